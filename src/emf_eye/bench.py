@@ -0,0 +1,561 @@
+"""EMF eye benchmarks."""
+
+import os
+
+# offscreen EGL rendering has to be selected before PyOpenGL is first imported
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+# lets Mesa render without X11 or Wayland
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from pathlib import Path
+from timeit import default_timer as timer
+
+import cv2
+import numpy as np
+import pygame
+from OpenGL import GL
+
+from .controller import Controller
+from .decoder import DECODERS, LoopingSource, OpenCVSource, open_source, write_raw
+from .exceptions import ScriptError
+from .mesh import WarpMesh
+from .offscreen import RESOLUTIONS, OffscreenContext, parse_resolution
+from .remap import BakedWarp
+from .texture import Texture
+from .warp import (
+    KNOB_X_FAN,
+    ShaderWarpMesh,
+    Warp,
+    WarpCache,
+    calculate_warp,
+    render_warp,
+)
+
+log = logging.getLogger()
+log_handler = logging.StreamHandler()
+log.addHandler(log_handler)
+
+
+BENCHMARKS = ("upload", "decode", "loop", "texture", "warp", "render")
+STEPS_DEFAULT = [20, 100, 400]
+FRAMES_DEFAULT = 50
+VIDEO_FPS = 25
+LOOP_PASSES = 3
+
+
+def upload_legacy(cv_image: np.ndarray, tx_ref: int) -> int:
+    """
+    Upload a frame by converting it to flipped RGB on the CPU and respecifying the texture, as frames first were.
+
+    Returns:
+        int: Bytes copied, by the conversion and by the upload.
+
+    """
+    tx_bytes = cv_image.tobytes()
+    tx_surface = pygame.image.frombuffer(
+        tx_bytes,
+        cv_image.shape[1::-1],
+        "BGR",
+    )
+    tx_data = pygame.image.tobytes(tx_surface, "RGB", True)
+
+    GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
+    GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+    GL.glTexImage2D(
+        GL.GL_TEXTURE_2D,
+        0,
+        GL.GL_RGB,
+        cv_image.shape[1],
+        cv_image.shape[0],
+        0,
+        GL.GL_RGB,
+        GL.GL_UNSIGNED_BYTE,
+        tx_data,
+    )
+    GL.glFinish()
+    GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    return len(tx_bytes) + (len(tx_data) * 2)
+
+
+def upload_direct(cv_image: np.ndarray, tx_ref: int) -> int:
+    """
+    Upload a frame from the decoded BGR buffer into the existing texture storage.
+
+    Returns:
+        int: Bytes copied, by the upload and any copy needed to make the rows contiguous.
+
+    """
+    tx_data = np.ascontiguousarray(cv_image)
+
+    GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
+    GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+    GL.glTexSubImage2D(
+        GL.GL_TEXTURE_2D,
+        0,
+        0,
+        0,
+        cv_image.shape[1],
+        cv_image.shape[0],
+        GL.GL_BGR,
+        GL.GL_UNSIGNED_BYTE,
+        tx_data,
+    )
+    GL.glFinish()
+    GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    copied = tx_data.nbytes
+    if tx_data is not cv_image:
+        copied += tx_data.nbytes
+
+    return copied
+
+
+def make_video(path: Path, resolution: tuple[int, int], frames: int) -> Path:
+    """Write a synthetic test video."""
+    writer = cv2.VideoWriter(
+        str(path),
+        cv2.VideoWriter_fourcc(*"mp4v"),
+        VIDEO_FPS,
+        resolution,
+    )
+
+    rng = np.random.default_rng(0)
+    background = rng.integers(0, 256, (resolution[1], resolution[0], 3), np.uint8)
+    for idx in range(frames):
+        frame = np.roll(background, idx * 8, axis=1)
+        cv2.putText(
+            frame,
+            str(idx),
+            (resolution[0] // 3, resolution[1] // 2),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            resolution[1] / 100,
+            (255, 255, 255),
+            resolution[1] // 100,
+        )
+        writer.write(frame)
+
+    writer.release()
+
+    return path
+
+
+def time_per_call(func: Callable[[], object], calls: int) -> float:
+    """Return the mean time of a function call after a warm up call."""
+    func()
+
+    time_start = timer()
+    for _ in range(calls):
+        func()
+
+    return (timer() - time_start) / calls
+
+
+def result(benchmark: str, seconds: float, **kwargs: object) -> dict:
+    """Return a benchmark result record."""
+    log.info("%s %s %.3f ms", benchmark, kwargs, seconds * 1000.0)
+
+    return {
+        "benchmark": benchmark,
+        **kwargs,
+        "ms": seconds * 1000.0,
+        "per_second": 1.0 / seconds if seconds else None,
+    }
+
+
+def bench_upload(resolution: tuple[int, int], frames: int) -> list[dict]:
+    """Time uploading a frame to a texture with the original conversion and directly."""
+    rng = np.random.default_rng(0)
+    cv_image = rng.integers(0, 256, (resolution[1], resolution[0], 3), np.uint8)
+
+    tx_ref = GL.glGenTextures(1)
+    GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
+    GL.glTexImage2D(
+        GL.GL_TEXTURE_2D,
+        0,
+        GL.GL_RGB8,
+        *resolution,
+        0,
+        GL.GL_BGR,
+        GL.GL_UNSIGNED_BYTE,
+        None,
+    )
+    GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    results = []
+    for name, upload in [("legacy", upload_legacy), ("direct", upload_direct)]:
+        copied = upload(cv_image, tx_ref)
+        results.append(
+            result(
+                f"upload_{name}",
+                time_per_call(lambda upload=upload: upload(cv_image, tx_ref), frames),
+                resolution=resolution,
+                bytes_copied=copied,
+            ),
+        )
+
+    GL.glDeleteTextures([tx_ref])
+
+    return results
+
+
+def bench_decode(video_path: Path, resolution: tuple[int, int]) -> list[dict]:
+    """Time decoding the whole video with each available decoder."""
+    raw_path = video_path.with_suffix(".raw")
+
+    results = []
+    for decoder in DECODERS:
+        try:
+            source = open_source(raw_path if decoder == "raw" else video_path, decoder)
+
+        except ScriptError as e:
+            log.warning("skipping %s decoder: %s", decoder, e)
+            continue
+
+        # copy into a frame buffer as the decode thread does so mapped frames are read
+        buffer = np.empty((resolution[1], resolution[0], 3), np.uint8)
+        frames = 0
+        time_start = timer()
+        while True:
+            cv_image = source.read(buffer)
+            if cv_image is None:
+                break
+
+            if cv_image is not buffer:
+                buffer[...] = cv_image
+            frames += 1
+        time_total = timer() - time_start
+
+        source.release()
+
+        results.append(
+            result(
+                "decode",
+                time_total / frames,
+                resolution=resolution,
+                decoder=decoder,
+            ),
+        )
+
+    return results
+
+
+def bench_loop(video_path: Path, resolution: tuple[int, int]) -> list[dict]:
+    """Time the worst frame read across a loop against the reads within one."""
+    raw_path = video_path.with_suffix(".raw")
+
+    results = []
+    for decoder in DECODERS:
+        try:
+            source = LoopingSource(
+                raw_path if decoder == "raw" else video_path,
+                decoder,
+            )
+
+        except ScriptError as e:
+            log.warning("skipping %s decoder: %s", decoder, e)
+            continue
+
+        # read at the video rate so background work runs as it would during playback
+        read_times = []
+        loop_time_max = 0.0
+        time_next = timer()
+        while source.loops < LOOP_PASSES:
+            loops = source.loops
+            time_start = timer()
+            source.read()
+            read_time = timer() - time_start
+
+            if source.loops != loops:
+                loop_time_max = max(loop_time_max, read_time)
+            else:
+                read_times.append(read_time)
+
+            time_next += 1.0 / VIDEO_FPS
+            time.sleep(max(time_next - timer(), 0.0))
+
+        source.release()
+
+        results.append(
+            result(
+                "loop",
+                loop_time_max,
+                resolution=resolution,
+                decoder=decoder,
+                frame_p99_ms=float(np.percentile(read_times, 99)) * 1000.0,
+            ),
+        )
+
+    return results
+
+
+def bench_texture(
+    video_path: Path,
+    resolution: tuple[int, int],
+    frames: int,
+) -> list[dict]:
+    """Time decoding and uploading frames to a texture."""
+    # upload a new frame on every update rather than at the video rate
+    texture = Texture(video_path, pacing=False)
+
+    def update() -> None:
+        texture.update()
+        GL.glFinish()
+
+    frame_time = time_per_call(update, frames)
+    texture.release()
+
+    return [result("texture", frame_time, resolution=resolution)]
+
+
+def bench_warp(steps_list: list[int], controller: Controller) -> list[dict]:
+    """Time calculating the whole warp on the CPU, then again as a single knob is turned."""
+    results = []
+    for steps in steps_list:
+        results.append(
+            result(
+                "warp",
+                time_per_call(
+                    lambda steps=steps: calculate_warp(
+                        Warp.PARAMETER,
+                        RESOLUTIONS["1080p"],
+                        controller,
+                        steps,
+                    ),
+                    FRAMES_DEFAULT,
+                ),
+                steps=steps,
+            ),
+        )
+        results.append(bench_warp_knob(steps, controller))
+
+    return results
+
+
+def bench_warp_knob(steps: int, controller: Controller) -> dict:
+    """Time recalculating the cached warp as a single knob is turned."""
+    cache = WarpCache()
+    knob_value = controller.knob(KNOB_X_FAN)
+    turns = iter(np.linspace(0.0, 1.0, FRAMES_DEFAULT + 1))
+
+    def turn_knob() -> None:
+        controller.set_knob(KNOB_X_FAN, next(turns))
+        calculate_warp(
+            Warp.PARAMETER,
+            RESOLUTIONS["1080p"],
+            controller,
+            steps,
+            cache,
+        )
+
+    calculate_warp(Warp.PARAMETER, RESOLUTIONS["1080p"], controller, steps, cache)
+    frame_time = time_per_call(turn_knob, FRAMES_DEFAULT)
+    controller.set_knob(KNOB_X_FAN, knob_value)
+
+    return result("warp_knob", frame_time, steps=steps)
+
+
+def bench_render(
+    video_path: Path,
+    resolution: tuple[int, int],
+    steps_list: list[int],
+    frames: int,
+    controller: Controller,
+) -> list[dict]:
+    """Time rendering the warp with each renderer."""
+    texture = Texture(video_path)
+    tx_ref = texture.update()
+
+    def render(warp_mesh: WarpMesh | BakedWarp, show_points: bool = False) -> None:
+        GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+        render_warp(
+            tx_ref,
+            resolution,
+            warp_mesh,
+            (0.0, 0.0),
+            show_points,
+            mouse_pos=(0.5, 0.5),
+        )
+        GL.glFinish()
+
+    results = []
+    mesh = WarpMesh()
+    baked_warp = BakedWarp()
+    for steps in steps_list:
+        mesh.update(calculate_warp(Warp.PARAMETER, resolution, controller, steps))
+        results.append(
+            result(
+                "render_mesh",
+                time_per_call(lambda: render(mesh), frames),
+                resolution=resolution,
+                steps=steps,
+            ),
+        )
+        # the calibration overlay with the mouse over the warp
+        results.append(
+            result(
+                "render_points",
+                time_per_call(lambda: render(mesh, True), frames),
+                resolution=resolution,
+                steps=steps,
+            ),
+        )
+
+    # the baked table does not depend on the mesh steps once baked
+    baked_warp.bake(video_path.with_suffix(".npy"), mesh, resolution)
+    results.append(
+        result(
+            "render_baked",
+            time_per_call(lambda: render(baked_warp), frames),
+            resolution=resolution,
+        ),
+    )
+
+    shader_mesh = ShaderWarpMesh()
+    shader_mesh.update_warp(resolution, controller)
+    results.append(
+        result(
+            "render_gpu_warp",
+            time_per_call(lambda: render(shader_mesh), frames),
+            resolution=resolution,
+        ),
+    )
+
+    shader_mesh.release()
+    baked_warp.release()
+    mesh.release()
+    texture.release()
+
+    return results
+
+
+def run() -> None:
+    """CLI entry function."""
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-b",
+        "--benchmark",
+        nargs="+",
+        choices=BENCHMARKS,
+        default=list(BENCHMARKS),
+        help="benchmarks to run",
+    )
+    parser.add_argument(
+        "-r",
+        "--resolution",
+        nargs="+",
+        type=parse_resolution,
+        default=list(RESOLUTIONS.values()),
+        help=f"resolutions as WIDTHxHEIGHT or one of {', '.join(RESOLUTIONS)}",
+    )
+    parser.add_argument(
+        "-s",
+        "--steps",
+        nargs="+",
+        type=int,
+        default=STEPS_DEFAULT,
+        help="warp grid steps per axis",
+    )
+    parser.add_argument(
+        "-n",
+        "--frames",
+        type=int,
+        default=FRAMES_DEFAULT,
+        help="number of frames to time",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help="write the JSON results to a file rather than stdout",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="log each result as it is measured",
+    )
+    args = parser.parse_args()
+
+    log.setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    controller = Controller(hardware=False, watch=False)
+
+    results = []
+    if "warp" in args.benchmark:
+        results += bench_warp(args.steps, controller)
+
+    renderer = None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for resolution in args.resolution:
+            video_path = None
+            if {"decode", "loop", "texture", "render"} & set(args.benchmark):
+                video_path = make_video(
+                    Path(temp_dir) / f"{resolution[0]}x{resolution[1]}.mp4",
+                    resolution,
+                    args.frames + 1,
+                )
+
+            if {"decode", "loop"} & set(args.benchmark):
+                source = OpenCVSource(video_path)
+                write_raw(video_path.with_suffix(".raw"), source)
+                source.release()
+
+            if "decode" in args.benchmark:
+                results += bench_decode(video_path, resolution)
+
+            if "loop" in args.benchmark:
+                results += bench_loop(video_path, resolution)
+
+            # uploads are timed through the GL driver, like the texture and rendering
+            if not {"upload", "texture", "render"} & set(args.benchmark):
+                continue
+
+            context = OffscreenContext(resolution)
+            renderer = context.renderer
+
+            if "upload" in args.benchmark:
+                results += bench_upload(resolution, args.frames)
+
+            if "texture" in args.benchmark:
+                results += bench_texture(video_path, resolution, args.frames)
+
+            if "render" in args.benchmark:
+                results += bench_render(
+                    video_path,
+                    resolution,
+                    args.steps,
+                    args.frames,
+                    controller,
+                )
+
+            context.release()
+
+    output = {
+        "system": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "renderer": renderer,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as file_object:
+            json.dump(output, file_object, indent=2)
+
+    else:
+        json.dump(output, sys.stdout, indent=2)
+        print()
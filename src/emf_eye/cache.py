@@ -0,0 +1,142 @@
+"""EMF eye scene video frame cache."""
+
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+from .decoder import (
+    DECODER_DEFAULT,
+    DECODERS,
+    frame_cache_path,
+    open_source,
+    read_raw_index,
+    video_info,
+    write_raw,
+    write_raw_index,
+)
+from .exceptions import ScriptError
+from .scene import PATH_DEFAULT, Scene
+
+log = logging.getLogger()
+log_handler = logging.StreamHandler()
+log.addHandler(log_handler)
+
+
+def update_cache(
+    video_path: Path,
+    decoder: str = DECODER_DEFAULT,
+    force: bool = False,
+) -> bool:
+    """
+    Transcode a video into its frame cache if the video has changed.
+
+    Args:
+        video_path (Path): Path to the video file.
+        decoder (str, optional): Name of the decoder to transcode with. Defaults to DECODER_DEFAULT.
+        force (bool, optional): Transcode even if the cache is current. Defaults to False.
+
+    Returns:
+        bool: True if the video was transcoded.
+
+    """
+    raw_path = frame_cache_path(video_path)
+    index = read_raw_index(raw_path)
+    info = video_info(video_path)
+
+    if index and not force:
+        source = index.get("source", {})
+        if source.get("size") == info["size"]:
+            if source.get("mtime_ns") == info["mtime_ns"]:
+                log.info("%s is current", raw_path)
+                return False
+
+            # copying to another machine changes the mtime but not the contents
+            info = video_info(video_path, digest=True)
+            if source.get("sha1") == info["sha1"]:
+                log.info("%s is current, updating the index", raw_path)
+                index["source"] = info
+                write_raw_index(raw_path, index)
+                return False
+
+    if "sha1" not in info:
+        info = video_info(video_path, digest=True)
+
+    log.info("transcoding %s", video_path)
+    source = open_source(video_path, decoder)
+    try:
+        index = write_raw(raw_path, source, {"source": info})
+
+    finally:
+        source.release()
+
+    log.info(
+        "%s %d frames %dx%d %.1f MB",
+        raw_path,
+        index["frames"],
+        index["width"],
+        index["height"],
+        raw_path.stat().st_size / 1e6,
+    )
+
+    return True
+
+
+def run() -> None:
+    """CLI entry function."""
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-p",
+        "--path",
+        type=Path,
+        default=Path(PATH_DEFAULT),
+        help="scenes directory",
+    )
+    parser.add_argument(
+        "--decoder",
+        choices=DECODERS,
+        default=DECODER_DEFAULT,
+        help="video decoder used to transcode",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="transcode videos even if the cache is current",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="log each video as it is checked",
+    )
+    args = parser.parse_args()
+
+    log.setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    failed = False
+    for scene in Scene.load_scenes(args.path, frame_cache=False):
+        try:
+            video_paths = scene.videos
+
+        except ScriptError:
+            # already logged, and there is nothing to cache
+            continue
+
+        for video_path in video_paths:
+            # videos that are already raw frames need no cache
+            if read_raw_index(video_path):
+                continue
+
+            try:
+                update_cache(video_path, args.decoder, args.force)
+
+            except ScriptError as e:
+                log.error("unable to cache %s: %s", video_path, e)
+                failed = True
+
+    if failed:
+        sys.exit(1)
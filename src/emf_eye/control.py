@@ -0,0 +1,162 @@
+"""Free-form warp from a sparse grid of control points dragged into place."""
+
+import io
+import logging
+import math
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+
+from .defaults import atomic_write
+
+log = logging.getLogger("control")
+
+
+CONTROL_POINTS_DEFAULT = 9
+CONTROL_FILE_NAME = "control.npz"
+
+
+def catmull_rom_weights(points: int, samples: int) -> np.ndarray:
+    """
+    Return the Catmull-Rom spline weights of each control point for evenly spaced samples along one axis.
+
+    Args:
+        points (int): Number of control points.
+        samples (int): Number of samples, including both ends.
+
+    Returns:
+        np.ndarray: Weights with a row per sample and a column per control point.
+
+    """
+    u = np.linspace(0.0, points - 1, samples)
+    patch = np.minimum(u.astype(int), points - 2)
+    t = (u - patch)[:, np.newaxis]
+
+    # the four points around each patch, from the one before it to the one after
+    basis = 0.5 * np.hstack(
+        [
+            -(t**3) + (2.0 * t**2) - t,
+            (3.0 * t**3) - (5.0 * t**2) + 2.0,
+            -(3.0 * t**3) + (4.0 * t**2) + t,
+            t**3 - t**2,
+        ],
+    )
+
+    # the ends are extended by reflecting the next point, P[-1] = 2 P[0] - P[1]
+    weights = np.zeros((samples, points + 2))
+    rows = np.arange(samples)
+    for offset in range(4):
+        np.add.at(weights, (rows, patch + offset), basis[:, offset])
+    weights[:, 1] += 2.0 * weights[:, 0]
+    weights[:, 2] -= weights[:, 0]
+    weights[:, points] += 2.0 * weights[:, points + 1]
+    weights[:, points - 1] -= weights[:, points + 1]
+
+    return weights[:, 1 : points + 1]
+
+
+class ControlWarp:
+    """Control points interpolated to a dense warp grid with Catmull-Rom patches."""
+
+    def __init__(self: Self, points: np.ndarray, steps: int) -> None:
+        """
+        Construct the warp.
+
+        Args:
+            points (np.ndarray): Control point display positions with a row per point row, at least 2 by 2.
+            steps (int): Minimum number of warp grid steps per axis, rounded up to a whole number per patch.
+
+        """
+        self._points = np.array(points, np.float32)
+
+        y_points, x_points, _ = self._points.shape
+        self._weights = []
+        for axis_points in (y_points, x_points):
+            patches = axis_points - 1
+            samples = (patches * math.ceil(steps / patches)) + 1
+            self._weights.append(catmull_rom_weights(axis_points, samples))
+
+        self._coord_array = np.empty(
+            (len(self._weights[0]), len(self._weights[1]), 2),
+            np.float32,
+        )
+        self._evaluate(slice(None), slice(None))
+
+    @property
+    def points(self: Self) -> np.ndarray:
+        """Return the control point display positions."""
+        return self._points
+
+    @property
+    def coord_array(self: Self) -> np.ndarray:
+        """Return the dense warp coordinates."""
+        return self._coord_array
+
+    def move(self: Self, point: tuple[int, int], position: tuple[float, float]) -> None:
+        """
+        Move a control point, only recalculating the patches it shapes.
+
+        Args:
+            point (tuple[int, int]): Control point column and row.
+            position (tuple[float, float]): New display position.
+
+        """
+        x_idx, y_idx = point
+        self._points[y_idx, x_idx] = position
+
+        # a point only shapes the samples it has a weight for
+        y_samples = np.flatnonzero(self._weights[0][:, y_idx])
+        x_samples = np.flatnonzero(self._weights[1][:, x_idx])
+        self._evaluate(
+            slice(y_samples[0], y_samples[-1] + 1),
+            slice(x_samples[0], x_samples[-1] + 1),
+        )
+
+    def _evaluate(self: Self, rows: slice, columns: slice) -> None:
+        """Interpolate part of the dense grid from the control points."""
+        y_weights = self._weights[0][rows]
+        x_weights = self._weights[1][columns]
+        for axis in range(2):
+            self._coord_array[rows, columns, axis] = (
+                y_weights @ self._points[..., axis] @ x_weights.T
+            )
+
+
+def load_control_points(outputs: int) -> list[np.ndarray | None]:
+    """Load the saved control points of each output, None for outputs without any."""
+    points = [None] * outputs
+    try:
+        with np.load(CONTROL_FILE_NAME) as data:
+            for idx in range(outputs):
+                key = f"output_{idx}"
+                if key in data:
+                    points[idx] = data[key]
+
+    except FileNotFoundError:
+        pass
+
+    except (OSError, ValueError) as e:
+        log.error("unable to load %s: %s", CONTROL_FILE_NAME, e)
+
+    return points
+
+
+def save_control_points(points: list[np.ndarray | None]) -> None:
+    """Save the control points of each output, keeping those saved for outputs not in use, which BackgroundWriter can do off the render thread."""
+    try:
+        saved = {}
+        if Path(CONTROL_FILE_NAME).exists():
+            with np.load(CONTROL_FILE_NAME) as data:
+                saved = dict(data)
+
+        for idx, output_points in enumerate(points):
+            if output_points is not None:
+                saved[f"output_{idx}"] = output_points
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **saved)
+        atomic_write(Path(CONTROL_FILE_NAME), buffer.getvalue())
+
+    except (OSError, ValueError) as e:
+        log.error("unable to save %s: %s", CONTROL_FILE_NAME, e)
@@ -1,104 +1,185 @@
 """Hardware controller interface and warp values."""
 
-import json
 import logging
+import threading
+from collections import deque
+from timeit import default_timer as timer
 from typing import Self
 
-from lpd8.knobs import Knobs
-from lpd8.lpd8 import LPD8
-from lpd8.pads import Pad, Pads
-from lpd8.programs import Programs
+from .defaults import DefaultsFile
 
 log = logging.getLogger("controller")
 
 
 # NOTE doesn't work with PGM_1 as it looks like I added 80 to the CC numbers for QLab
 # NOTE had to set the pads for PGM_2 to expected values 60, 62, 64, 65, 67, 69, 71, 72
-LPD8_PROGRAM = Programs.PGM_2
-DEFAULTS_FILE_NAME = "controller.json"
+# the lpd8 package Programs.PGM_2, kept as a number as the package is only imported once MIDI starts
+LPD8_PROGRAM = 2
+KNOB_COUNT = 8
+EVENT_KNOB = "knob"
+EVENT_PAD = "pad"
+EVENT_RELOAD = "reload"
 
 
-class Controller:
-    """Controller class."""
+class KnobSet:
+    """Warp knob values for one output."""
+
+    def __init__(self: Self) -> None:
+        """Construct the knobs, all at zero."""
+        self._knobs = [0.0] * KNOB_COUNT
+        self._updated = True
+
+    @property
+    def updated(self: Self) -> bool:
+        """Check if the knob values have been updated."""
+        if self._updated:
+            self._updated = False
+            return True
+
+        return False
+
+    @property
+    def knobs(self: Self) -> tuple[float, ...]:
+        """Return the knob values."""
+        return tuple(self._knobs)
+
+    def knob(self: Self, knob_index: int) -> float:
+        """Return a knob value."""
+        return self._knobs[knob_index]
+
+    def set_knob(self: Self, knob_index: int, value: float) -> None:
+        """Set a knob value as if it had been turned."""
+        self._knobs[knob_index] = value
+        self._updated = True
+
+    def set_knobs(self: Self, values: list[float]) -> None:
+        """Set all the knob values."""
+        self._knobs = list(values)
+        self._updated = True
+
+    def interpolate(
+        self: Self,
+        v1: float,
+        v2: float,
+        knob_index: int,
+        invert: bool = False,
+    ) -> float:
+        """Interpolate a range by the knob value."""
+        i = self._knobs[knob_index]
+        if invert:
+            i = 1.0 - i
+        return ((v2 - v1) * i) + v1
+
 
-    PAD_LOOKUP = {
-        pad_value: idx for idx, pad_value in enumerate(Pads.ALL_PADS, start=1)
-    }
+class Controller:
+    """Controller class, editing the knobs of the selected output."""
 
-    def __init__(self: Self, sticky: bool = True, pad_on_release: bool = True) -> None:
+    def __init__(
+        self: Self,
+        sticky: bool = True,
+        pad_on_release: bool = True,
+        hardware: bool = True,
+        knob_interval: float = 0.0,
+        knob_debounce: bool = False,
+        outputs: int = 1,
+        watch: bool = True,
+    ) -> None:
         """
         Construct the controller.
 
         Args:
             sticky (bool, optional): Whether to enable 'sticky' knob behaviour. Defaults to True.
             pad_on_release (bool, optional): Trigger pads on release rather than press. Defaults to True.
+            hardware (bool, optional): Whether to connect to the LPD8 device, which starts in the background. Defaults to True.
+            knob_interval (float, optional): Minimum seconds between knob updates. Defaults to 0.0, updating every frame.
+            knob_debounce (bool, optional): Wait until the knobs have been still for the interval rather than limiting the rate. Defaults to False.
+            outputs (int, optional): Number of outputs, each with its own knobs. Defaults to 1.
+            watch (bool, optional): Reload the saved values when another tool changes them. Defaults to True.
 
         """
         self._sticky = sticky
         self._pad_on_release = pad_on_release
+        self._knob_interval = knob_interval
+        self._knob_debounce = knob_debounce
 
-        # get the LPD8 device
-        # NOTE WSL2 supports audio via a Pulse audio server at PULSE_SERVER but does not support MIDI (no /dev/snd/seq)
-        # https://github.com/microsoft/WSL/issues/7107
-        try:
-            self._lpd8 = LPD8()
+        # MIDI callbacks and reloads only append events, which the render thread applies in update
+        self._events = deque()
+        self._knobs_pending = {}
+        self._pending_time = None
+        self._event_time = None
+        self._apply_time = None
+        self._arrival_time = None
+        self._latency = None
 
-        except Exception as e:
-            # check the exception message as rtmidi does not export the SystemError class
-            if not str(e).startswith("MidiInAlsa::initialize:"):
-                raise
+        self._outputs = [KnobSet() for _ in range(outputs)]
+        self._output_idx = 0
 
-            self._lpd8 = None
-            log.error("MIDI is not supported on WSL2")
+        self._pads = []
 
-        if self._lpd8:
-            self._lpd8.start()
-            self._lpd8.set_knob_limits(
-                LPD8_PROGRAM,
-                Knobs.ALL_KNOBS,
-                0,
-                1,
-                is_int=False,
+        self._lpd8 = None
+        self._hardware_lock = threading.Lock()
+        self._hardware_error = None
+        self._hardware_thread = None
+
+        on_change = self._defaults_changed if watch else None
+        self._defaults = DefaultsFile(on_change=on_change)
+        self.load_defaults()
+
+        # MIDI can take a while to start, so the saved values are used until it has
+        if hardware:
+            self._hardware_thread = threading.Thread(
+                target=self._start_hardware,
+                name="controller start",
+                daemon=True,
             )
-            if not self._sticky:
-                self._lpd8.set_not_sticky_knob(LPD8_PROGRAM, Knobs.ALL_KNOBS)
-            self._lpd8.set_pad_mode(LPD8_PROGRAM, Pads.ALL_PADS, Pad.PUSH_MODE)
+            self._hardware_thread.start()
 
-            def lpd8_knob(data: tuple[int, int, float]) -> None:
-                _, knob, value = data
-                self._knobs[knob - 1] = value
-                self._updated = True
-                log.debug("knob: %s = %s", knob, value)
+    @property
+    def updated(self: Self) -> bool:
+        """Check if the selected output knob values have been updated."""
+        return self.selected.updated
 
-            def lpd8_pad(data: tuple[int, int, float]) -> None:
-                _, pad, on = data
-                pad = self.PAD_LOOKUP[pad]
-                on = on == 1
-                self._updated = True
+    @property
+    def selected(self: Self) -> KnobSet:
+        """Return the knobs of the output being edited."""
+        return self._outputs[self._output_idx]
 
-                if self._pad_on_release != on:
-                    self._pads.append(pad)
-                log.debug("pad: %s = %s", pad, on)
+    @property
+    def selected_index(self: Self) -> int:
+        """Return the index of the output being edited."""
+        return self._output_idx
 
-            self._lpd8.subscribe(lpd8_knob, LPD8_PROGRAM, LPD8.CTRL, Knobs.ALL_KNOBS)
-            self._lpd8.subscribe(lpd8_pad, LPD8_PROGRAM, LPD8.NOTE_ON, Pads.ALL_PADS)
-            self._lpd8.subscribe(lpd8_pad, LPD8_PROGRAM, LPD8.NOTE_OFF, Pads.ALL_PADS)
+    def output(self: Self, output_index: int) -> KnobSet:
+        """Return the knobs of an output."""
+        return self._outputs[output_index]
 
-        self._knobs = [0.0] * Pads.PAD_MAX
-        self._updated = False
+    def select_output(self: Self, output_index: int) -> None:
+        """Edit the knobs of another output, moving the hardware knobs to its values."""
+        self._output_idx = output_index % len(self._outputs)
+        log.info("editing output %d", self._output_idx)
 
-        self._pads = []
+        # changes received for the previous output are not carried over
+        self._knobs_pending = {}
+        self._pending_time = None
+        self._update_hardware()
 
-        self.load_defaults()
+    @property
+    def latency(self: Self) -> float | None:
+        """Return the seconds from the oldest knob change arriving to the frame showing it, if one was shown."""
+        return self._latency
 
     @property
-    def updated(self: Self) -> bool:
-        """Check if the controller values have been updated."""
-        if self._updated:
-            self._updated = False
-            return True
+    def knobs(self: Self) -> tuple[float, ...]:
+        """Return the selected output knob values."""
+        return self.selected.knobs
 
-        return False
+    def knob(self: Self, knob_index: int) -> float:
+        """Return a selected output knob value."""
+        return self.selected.knob(knob_index)
+
+    def set_knob(self: Self, knob_index: int, value: float) -> None:
+        """Set a selected output knob value as if it had been turned."""
+        self.selected.set_knob(knob_index, value)
 
     def interpolate(
         self: Self,
@@ -107,11 +188,8 @@ class Controller:
         knob_index: int,
         invert: bool = False,
     ) -> float:
-        """Interpolate a range by the knob value."""
-        i = self._knobs[knob_index]
-        if invert:
-            i = 1.0 - i
-        return ((v2 - v1) * i) + v1
+        """Interpolate a range by the selected output knob value."""
+        return self.selected.interpolate(v1, v2, knob_index, invert)
 
     def pads(self: Self) -> list[int]:
         """Return a list of triggered pads."""
@@ -120,39 +198,198 @@ class Controller:
         return pads
 
     def update(self: Self) -> None:
-        """Query the controller hardware and update the values."""
+        """Query the controller hardware and apply the events received since the last update, once per frame before the values are used."""
+        time_now = timer()
+
+        if self._hardware_error:
+            error, self._hardware_error = self._hardware_error, None
+            raise error
+
         if self._lpd8:
             self._lpd8.pad_update()
 
+        while self._events:
+            kind, idx, value, event_time = self._events.popleft()
+            if kind == EVENT_RELOAD:
+                self._apply(value)
+                continue
+
+            if kind == EVENT_PAD:
+                log.debug("pad: %s = %s", idx, value)
+                self._pads.append(idx)
+                continue
+
+            log.debug("knob: %s = %s", idx + 1, value)
+
+            # a sweep only needs the latest value of each knob
+            self._knobs_pending[idx] = value
+            if self._pending_time is None:
+                self._pending_time = event_time
+            self._event_time = event_time
+
+        if not self._knobs_pending:
+            return
+
+        if self._knob_debounce:
+            since = time_now - self._event_time
+        else:
+            since = time_now - (self._apply_time or 0.0)
+        if since < self._knob_interval:
+            return
+
+        for idx, value in self._knobs_pending.items():
+            self.selected.set_knob(idx, value)
+        self._knobs_pending = {}
+
+        self._apply_time = time_now
+        self._arrival_time = self._pending_time
+        self._pending_time = None
+
+    def presented(self: Self) -> None:
+        """Measure the knob latency once the frame using the last update has been displayed."""
+        self._latency = None
+        if self._arrival_time is not None:
+            self._latency = timer() - self._arrival_time
+            self._arrival_time = None
+
     def stop(self: Self) -> None:
-        """Stop the controller hardware."""
+        """Stop the controller hardware, waiting for it to finish starting and the values to be saved."""
+        self._defaults.stop()
+
+        if self._hardware_thread:
+            self._hardware_thread.join()
+
         if self._lpd8:
             self._lpd8.stop()
 
-    def load_defaults(self: Self) -> None:
-        """Load the saved controller values from file."""
+    def _start_hardware(self: Self) -> None:
+        """Connect to the LPD8 device, in the background."""
+        # get the LPD8 device
+        # NOTE WSL2 supports audio via a Pulse audio server at PULSE_SERVER but does not support MIDI (no /dev/snd/seq)
+        # https://github.com/microsoft/WSL/issues/7107
         try:
-            with open(DEFAULTS_FILE_NAME) as file_object:
-                data = json.load(file_object)
-                if "knobs" in data:
-                    self._knobs = data["knobs"]
-
-        except FileNotFoundError:
-            pass
+            # imported here as loading MIDI is slow and the window opens first
+            from lpd8.knobs import Knobs
+            from lpd8.lpd8 import LPD8
+            from lpd8.pads import Pad, Pads
+
+            lpd8 = LPD8()
+            lpd8.start()
+            lpd8.set_knob_limits(
+                LPD8_PROGRAM,
+                Knobs.ALL_KNOBS,
+                0,
+                1,
+                is_int=False,
+            )
+            if not self._sticky:
+                lpd8.set_not_sticky_knob(LPD8_PROGRAM, Knobs.ALL_KNOBS)
+            lpd8.set_pad_mode(LPD8_PROGRAM, Pads.ALL_PADS, Pad.PUSH_MODE)
 
-        if self._lpd8:
-            for idx, value in enumerate(self._knobs):
-                self._lpd8.set_knob_value(LPD8_PROGRAM, idx + 1, value)
+        except Exception as e:
+            # check the exception message as rtmidi does not export the SystemError class
+            if str(e).startswith("MidiInAlsa::initialize:"):
+                log.error("MIDI is not supported on WSL2")
+
+            else:
+                # raised on the render thread by the next update
+                self._hardware_error = e
+
+            return
+
+        def lpd8_knob(data: tuple[int, int, float]) -> None:
+            _, knob, value = data
+            self._events.append((EVENT_KNOB, knob - 1, value, timer()))
+
+        pad_lookup = {
+            pad_value: idx for idx, pad_value in enumerate(Pads.ALL_PADS, start=1)
+        }
+
+        def lpd8_pad(data: tuple[int, int, float]) -> None:
+            _, pad, on = data
+            pad = pad_lookup[pad]
+            on = on == 1
+
+            if self._pad_on_release != on:
+                self._events.append((EVENT_PAD, pad, on, timer()))
+
+        lpd8.subscribe(lpd8_knob, LPD8_PROGRAM, LPD8.CTRL, Knobs.ALL_KNOBS)
+        lpd8.subscribe(lpd8_pad, LPD8_PROGRAM, LPD8.NOTE_ON, Pads.ALL_PADS)
+        lpd8.subscribe(lpd8_pad, LPD8_PROGRAM, LPD8.NOTE_OFF, Pads.ALL_PADS)
+
+        with self._hardware_lock:
+            self._lpd8 = lpd8
+
+        # the saved values may have been loaded or changed while starting
+        self._update_hardware()
+        log.info("controller started")
+
+    def _update_hardware(self: Self) -> None:
+        """Move the hardware knobs to the selected output values."""
+        with self._hardware_lock:
+            if self._lpd8:
+                for idx, value in enumerate(self.selected.knobs):
+                    self._lpd8.set_knob_value(LPD8_PROGRAM, idx + 1, value)
+
+    def _defaults_changed(self: Self, data: dict) -> None:
+        """Queue the values reloaded from file, in the background."""
+        self._events.append((EVENT_RELOAD, None, data, timer()))
+
+    def _apply(self: Self, data: dict) -> None:
+        """Set the knobs of every output from saved values."""
+        # the first output is also saved as the knobs of a single output
+        outputs_data = data.get("outputs", [])
+        for idx, knob_set in enumerate(self._outputs):
+            output_data = outputs_data[idx] if idx < len(outputs_data) else data
+            knob_set.set_knobs(output_data.get("knobs", knob_set.knobs))
+
+        # changes received before loading would overwrite the loaded values
+        self._knobs_pending = {}
+        self._pending_time = None
+
+        self._update_hardware()
+
+    def _snapshot(self: Self, data: dict) -> dict:
+        """Return saved values updated with the knobs of every output, keeping the values of outputs not in use."""
+        data = dict(data)
+        data["knobs"] = list(self._outputs[0].knobs)
+
+        if len(self._outputs) > 1 or "outputs" in data:
+            outputs_data = list(data.get("outputs", []))
+            outputs_data += [{}] * (len(self._outputs) - len(outputs_data))
+            for idx, knob_set in enumerate(self._outputs):
+                outputs_data[idx] = {
+                    **outputs_data[idx],
+                    "knobs": list(knob_set.knobs),
+                }
+            data["outputs"] = outputs_data
+
+        return data
 
-        self._updated = True
+    def load_defaults(self: Self) -> None:
+        """Load the saved controller values."""
+        self._apply(self._defaults.data)
 
     def save_defaults(self: Self) -> None:
-        """Save the current controller values to file."""
-        data = {"knobs": self._knobs}
-
-        try:
-            with open(DEFAULTS_FILE_NAME, "w") as file_object:
-                json.dump(data, file_object)
-
-        except Exception as e:
-            log.error("%s: %s", e.__class__.__name__, e)
+        """Save the current controller values to file in the background."""
+        self._defaults.save(self._snapshot(self._defaults.data))
+
+    def load_preset(self: Self, name: str) -> None:
+        """Switch every output to the knobs of a saved preset, which are kept in memory."""
+        preset = self._defaults.data.get("presets", {}).get(name)
+        if preset is None:
+            log.info("no preset %s", name)
+            return
+
+        log.info("preset %s", name)
+        self._apply(preset)
+
+    def save_preset(self: Self, name: str) -> None:
+        """Save the knobs of every output as a preset, in the background."""
+        data = dict(self._defaults.data)
+        presets = dict(data.get("presets", {}))
+        presets[name] = self._snapshot(presets.get(name, {}))
+        data["presets"] = presets
+
+        log.info("saved preset %s", name)
+        self._defaults.save(data)
@@ -0,0 +1,732 @@
+"""Video decoder backends and background decoding into a ring of frame buffers."""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Self
+
+import numpy as np
+
+from .defaults import atomic_write
+from .exceptions import ScriptError
+
+log = logging.getLogger("decoder")
+
+
+DECODER_DEFAULT = "opencv"
+RAW_INDEX_SUFFIX = ".json"
+FRAME_CACHE_SUFFIX = ".raw"
+LOOP_PRELOAD_FRAMES = 4
+BACKGROUND_THREAD_NICE = 10
+# a gap between frames longer than this is a pause rather than running late
+CLOCK_RESYNC_TIME = 1.0
+
+
+@dataclass
+class FrameStats:
+    """Frame delivery counters, with the presentation drift in seconds."""
+
+    decoded: int = 0
+    uploaded: int = 0
+    dropped: int = 0
+    late: int = 0
+    repeated: int = 0
+    drift: float = 0.0
+    drift_max: float = 0.0
+
+
+class PresentationClock:
+    """Map wall-clock time to video presentation time, independent of the render rate."""
+
+    def __init__(self: Self, fps: float | None, stats: FrameStats) -> None:
+        """
+        Construct the clock, starting from the first frame.
+
+        Args:
+            fps (float): Video frame rate, None to present every frame as soon as it is asked for.
+            stats (FrameStats): Counters to record the drift in.
+
+        """
+        self.interval = 1.0 / fps if fps else 0.0
+        self.pts = 0.0
+        self._stats = stats
+        self._start_time = None
+        self._call_time = None
+
+    def restart(self: Self) -> None:
+        """Restart the clock from the frame last presented after a pause."""
+        self._start_time = None
+
+    def play_time(self: Self, time_now: float) -> float:
+        """
+        Return the latest presentation time due now.
+
+        Frames are due half an interval early, so the frame nearest the display time is chosen.
+        """
+        # a stall is treated as a pause rather than dropping everything since
+        if (
+            self._call_time is not None
+            and time_now - self._call_time > CLOCK_RESYNC_TIME
+        ):
+            self._start_time = None
+        self._call_time = time_now
+
+        if self._start_time is None:
+            self._start_time = time_now - self.pts
+
+        return time_now - self._start_time + (self.interval / 2.0)
+
+    def late(self: Self, pts: float, time_now: float) -> bool:
+        """Return True if a frame will be replaced by the next frame before it is presented."""
+        if self._start_time is None or not self.interval:
+            return False
+
+        return time_now - self._start_time > pts + self.interval
+
+    def present(self: Self, pts: float, time_now: float) -> None:
+        """Record the presentation of a frame and how far it lags the clock."""
+        self.pts = pts
+        self._stats.drift = time_now - self._start_time - pts
+        self._stats.drift_max = max(self._stats.drift_max, self._stats.drift)
+
+
+class VideoSource(ABC):
+    """Video frame source interface, which every decoder backend implements."""
+
+    def __init__(self: Self, path: Path) -> None:
+        """
+        Open the video.
+
+        Args:
+            path (Path): Path to the video file.
+
+        """
+        self._path = path
+        self._fps = None
+
+    @property
+    def fps(self: Self) -> float | None:
+        """Get the video FPS if available."""
+        return self._fps
+
+    @abstractmethod
+    def read(self: Self, buffer: np.ndarray | None = None) -> np.ndarray | None:
+        """
+        Return the next BGR frame, top row first, or None at the end of the video.
+
+        Args:
+            buffer (np.ndarray, optional): Buffer to decode into where the backend supports it. Defaults to None.
+
+        """
+
+    def skip(self: Self) -> bool:
+        """Skip the next frame, without converting it where the backend allows, returning False at the end of the video."""
+        return self.read() is not None
+
+    @abstractmethod
+    def release(self: Self) -> None:
+        """Release the video."""
+
+
+class OpenCVSource(VideoSource):
+    """Video decoded with OpenCV."""
+
+    def __init__(self: Self, path: Path, hardware: bool = False) -> None:
+        """
+        Open the video.
+
+        Args:
+            path (Path): Path to the video file.
+            hardware (bool, optional): Request hardware accelerated decoding. Defaults to False.
+
+        Raises:
+            ScriptError: If the video cannot be opened.
+
+        """
+        super().__init__(path)
+
+        # OpenCV is slow to import so only import it when used, after the window has opened
+        import cv2
+
+        params = []
+        if hardware:
+            params = [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+
+        self._video = cv2.VideoCapture(str(path), cv2.CAP_ANY, params)
+        if not self._video.isOpened():
+            raise ScriptError(f"unable to open {path}")
+
+        self._fps = self._video.get(cv2.CAP_PROP_FPS) or None
+
+        if hardware:
+            # OpenCV quietly falls back to software decoding
+            log.debug(
+                "%s hardware acceleration %d",
+                path,
+                self._video.get(cv2.CAP_PROP_HW_ACCELERATION),
+            )
+
+    def read(self: Self, buffer: np.ndarray | None = None) -> np.ndarray | None:
+        """Return the next frame or None at the end of the video."""
+        cv_read_ok, cv_image = self._video.read(buffer)
+
+        return cv_image if cv_read_ok else None
+
+    def skip(self: Self) -> bool:
+        """Skip the next frame without converting it."""
+        return self._video.grab()
+
+    def release(self: Self) -> None:
+        """Release the video."""
+        self._video.release()
+
+
+class OpenCVHardwareSource(OpenCVSource):
+    """Video decoded with OpenCV using hardware acceleration if available."""
+
+    def __init__(self: Self, path: Path) -> None:
+        """
+        Open the video.
+
+        Args:
+            path (Path): Path to the video file.
+
+        """
+        super().__init__(path, hardware=True)
+
+
+class PyAVSource(VideoSource):
+    """Video decoded with FFmpeg through PyAV, using frame and slice threads."""
+
+    def __init__(self: Self, path: Path) -> None:
+        """
+        Open the video.
+
+        Args:
+            path (Path): Path to the video file.
+
+        Raises:
+            ScriptError: If PyAV is not installed or the video cannot be opened.
+
+        """
+        super().__init__(path)
+
+        # PyAV is optional so only import it when used
+        try:
+            import av
+
+        except ImportError as e:
+            raise ScriptError("the pyav decoder needs the av package") from e
+
+        try:
+            self._container = av.open(str(path))
+
+        except av.FFmpegError as e:
+            raise ScriptError(f"unable to open {path}: {e}") from e
+
+        stream = self._container.streams.video[0]
+        stream.thread_type = "AUTO"
+        self._fps = float(stream.average_rate) if stream.average_rate else None
+
+        self._frames = self._container.decode(stream)
+
+    def read(self: Self, buffer: np.ndarray | None = None) -> np.ndarray | None:
+        """Return the next frame or None at the end of the video."""
+        frame = next(self._frames, None)
+        if frame is None:
+            return None
+
+        # FFmpeg converts straight to the layout the texture upload expects
+        return frame.to_ndarray(format="bgr24")
+
+    def skip(self: Self) -> bool:
+        """Skip the next frame without converting it."""
+        return next(self._frames, None) is not None
+
+    def release(self: Self) -> None:
+        """Release the video."""
+        self._container.close()
+
+
+class RawSource(VideoSource):
+    """Uncompressed frames memory mapped from a raw file written by write_raw."""
+
+    def __init__(self: Self, path: Path) -> None:
+        """
+        Map the raw frames.
+
+        Args:
+            path (Path): Path to the raw file.
+
+        Raises:
+            ScriptError: If the raw file index is missing or does not match the file.
+
+        """
+        super().__init__(path)
+
+        index = read_raw_index(path)
+        if index is None:
+            raise ScriptError(f"missing or incomplete index for {path}")
+
+        self._fps = index["fps"]
+        self._frames = np.memmap(
+            path,
+            np.uint8,
+            "r",
+            shape=(index["frames"], index["height"], index["width"], 3),
+        )
+        self._frame_idx = 0
+
+    def read(self: Self, buffer: np.ndarray | None = None) -> np.ndarray | None:
+        """Return the next frame or None at the end of the video."""
+        if self._frame_idx == len(self._frames):
+            return None
+
+        cv_image = self._frames[self._frame_idx]
+        self._frame_idx += 1
+
+        return cv_image
+
+    def skip(self: Self) -> bool:
+        """Skip the next frame without reading it."""
+        if self._frame_idx == len(self._frames):
+            return False
+
+        self._frame_idx += 1
+
+        return True
+
+    def release(self: Self) -> None:
+        """Unmap the frames."""
+        self._frames = None
+
+
+DECODERS = {
+    "opencv": OpenCVSource,
+    "opencv-hw": OpenCVHardwareSource,
+    "pyav": PyAVSource,
+    "raw": RawSource,
+}
+
+
+def open_source(path: Path, decoder: str = DECODER_DEFAULT) -> VideoSource:
+    """
+    Open a video with a decoder backend.
+
+    Args:
+        path (Path): Path to the video file.
+        decoder (str, optional): Name of the decoder in DECODERS. Defaults to DECODER_DEFAULT.
+
+    Raises:
+        ScriptError: If the video is not found or the decoder is unknown.
+
+    """
+    if not path.exists():
+        raise ScriptError(f"video {path} not found")
+
+    if decoder not in DECODERS:
+        raise ScriptError(f"unknown decoder {decoder}")
+
+    return DECODERS[decoder](path)
+
+
+def raw_index_path(path: Path) -> Path:
+    """Return the index path for a raw frame file."""
+    return path.with_name(path.name + RAW_INDEX_SUFFIX)
+
+
+def read_raw_index(path: Path) -> dict | None:
+    """Return the index for a raw frame file if it is complete."""
+    try:
+        with open(raw_index_path(path)) as file_object:
+            index = json.load(file_object)
+
+        frame_size = index["width"] * index["height"] * 3
+        if path.stat().st_size != index["frames"] * frame_size:
+            return None
+
+    except (OSError, ValueError, KeyError):
+        return None
+
+    return index
+
+
+def write_raw(path: Path, source: VideoSource, extra: dict | None = None) -> dict:
+    """
+    Decode every frame of a video source into a raw frame file and index.
+
+    Args:
+        path (Path): Path to the raw file.
+        source (VideoSource): Video to decode.
+        extra (dict, optional): Additional values to store in the index. Defaults to None.
+
+    Returns:
+        dict: The raw file index.
+
+    Raises:
+        ScriptError: If the video has no frames.
+
+    """
+    index = {"fps": source.fps, "frames": 0, "width": 0, "height": 0, **(extra or {})}
+
+    # the index is written last so a partial file is never mistaken for a complete one
+    raw_index_path(path).unlink(missing_ok=True)
+
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as file_object:
+        while True:
+            cv_image = source.read()
+            if cv_image is None:
+                break
+
+            file_object.write(np.ascontiguousarray(cv_image).data)
+            index["frames"] += 1
+            index["height"], index["width"], _ = cv_image.shape
+
+    if not index["frames"]:
+        temp_path.unlink()
+        raise ScriptError(f"no frames decoded for {path}")
+
+    os.replace(temp_path, path)
+    write_raw_index(path, index)
+
+    return index
+
+
+def write_raw_index(path: Path, index: dict) -> None:
+    """Save the index for a raw frame file, replacing it atomically."""
+    atomic_write(raw_index_path(path), json.dumps(index).encode())
+
+
+def frame_cache_path(video_path: Path) -> Path:
+    """Return the path of the cached raw frames for a video."""
+    return video_path.with_name(video_path.name + FRAME_CACHE_SUFFIX)
+
+
+def video_info(video_path: Path, digest: bool = False) -> dict:
+    """
+    Return the details of a video file used to check a frame cache is current.
+
+    Args:
+        video_path (Path): Path to the video file.
+        digest (bool, optional): Include the SHA-1 of the file contents. Defaults to False.
+
+    """
+    stat = video_path.stat()
+    info = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    if digest:
+        with open(video_path, "rb") as file_object:
+            info["sha1"] = hashlib.file_digest(file_object, "sha1").hexdigest()
+
+    return info
+
+
+def cached_video(video_path: Path) -> Path | None:
+    """Return the cached raw frames for a video if they are current."""
+    raw_path = frame_cache_path(video_path)
+    index = read_raw_index(raw_path)
+    if index is None:
+        return None
+
+    info = video_info(video_path)
+    source = index.get("source", {})
+    if any(source.get(key) != value for key, value in info.items()):
+        log.warning("frame cache %s is out of date", raw_path)
+        return None
+
+    return raw_path
+
+
+def lower_thread_priority() -> None:
+    """Let the render thread take priority over background work on the calling thread."""
+    # Linux sets the nice value per thread, the decoder threads inherit it
+    try:
+        os.setpriority(
+            os.PRIO_PROCESS,
+            threading.get_native_id(),
+            BACKGROUND_THREAD_NICE,
+        )
+
+    except (AttributeError, OSError):
+        pass
+
+
+class LoopingSource(VideoSource):
+    """Video source that loops without a gap by preparing the next pass in the background."""
+
+    def __init__(self: Self, path: Path, decoder: str = DECODER_DEFAULT) -> None:
+        """
+        Open the video and start preparing the next pass.
+
+        Args:
+            path (Path): Path to the video file.
+            decoder (str, optional): Name of the decoder in DECODERS. Defaults to DECODER_DEFAULT.
+
+        """
+        super().__init__(path)
+        self._decoder = decoder
+
+        self._source, self._preloaded = self._open_next()
+        self._fps = self._source.fps
+
+        self.loops = 0
+
+        self._executor = ThreadPoolExecutor(
+            1,
+            f"loop {path.name}",
+            initializer=lower_thread_priority,
+        )
+        self._next: Future | None = None
+        self._prepare()
+
+    def _open_next(self: Self) -> tuple[VideoSource, deque]:
+        """Open the video again and decode its first frames."""
+        source = open_source(self._path, self._decoder)
+
+        # decoders are slowest for the first few frames after opening
+        preloaded = deque()
+        for _ in range(LOOP_PRELOAD_FRAMES):
+            cv_image = source.read()
+            if cv_image is None:
+                break
+
+            preloaded.append(np.array(cv_image))
+
+        if not preloaded:
+            source.release()
+            raise ScriptError(f"unable to load {self._path}")
+
+        return source, preloaded
+
+    def _prepare(self: Self) -> None:
+        """Prepare the next pass in the background."""
+        self._next = self._executor.submit(self._open_next)
+
+    @staticmethod
+    def _release_next(future: Future) -> None:
+        """Release a prepared pass that will not be played."""
+        if not future.exception():
+            future.result()[0].release()
+
+    def read(self: Self, buffer: np.ndarray | None = None) -> np.ndarray | None:
+        """
+        Return the next frame, continuing from the start at the end of the video.
+
+        Raises:
+            ScriptError: If the video cannot be reopened.
+
+        """
+        if self._preloaded:
+            return self._preloaded.popleft()
+
+        cv_image = self._source.read(buffer)
+        if cv_image is not None:
+            return cv_image
+
+        self._next_pass()
+
+        return self._preloaded.popleft()
+
+    def skip(self: Self) -> bool:
+        """
+        Skip the next frame, continuing from the start at the end of the video.
+
+        Raises:
+            ScriptError: If the video cannot be reopened.
+
+        """
+        if self._preloaded:
+            self._preloaded.popleft()
+            return True
+
+        if not self._source.skip():
+            self._next_pass()
+            self._preloaded.popleft()
+
+        return True
+
+    def _next_pass(self: Self) -> None:
+        """Switch to the prepared pass and start preparing the one after."""
+        # the next pass is normally open with its first frames decoded long before it is needed
+        source_previous = self._source
+        self._source, self._preloaded = self._next.result()
+        self.loops += 1
+
+        self._executor.submit(source_previous.release)
+        self._prepare()
+
+    def release(self: Self) -> None:
+        """Release the video and the prepared next pass."""
+        # release the next pass once prepared rather than waiting for it
+        if self._next:
+            self._next.add_done_callback(self._release_next)
+        self._next = None
+        self._executor.shutdown(wait=False)
+
+        self._source.release()
+
+
+class DecodeThread:
+    """Decode video frames ahead of the render loop."""
+
+    def __init__(
+        self: Self,
+        path: Path,
+        ring_size: int,
+        decoder: str = DECODER_DEFAULT,
+    ) -> None:
+        """
+        Open the video and start decoding ahead.
+
+        Args:
+            path (Path): Path to the video file.
+            ring_size (int): Number of preallocated frame buffers.
+            decoder (str, optional): Name of the decoder in DECODERS. Defaults to DECODER_DEFAULT.
+
+        """
+        self._path = path
+        self._source = LoopingSource(path, decoder)
+
+        self._fps = self._source.fps
+
+        # the first frame sizes the ring buffers
+        cv_image = self._source.read()
+        if cv_image is None:
+            raise ScriptError(f"unable to load {self._path}")
+        cv_image = np.array(cv_image)
+
+        self._buffers = [cv_image] + [
+            np.empty_like(cv_image) for _ in range(max(ring_size, 2) - 1)
+        ]
+        self._free = deque(range(1, len(self._buffers)))
+        self._ready = deque([(0, 0.0)])
+        self._in_use = None
+        self._frame_count = 1
+
+        self.stats = FrameStats(decoded=1)
+
+        self._clock = PresentationClock(self._fps, self.stats)
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run,
+            name=f"decode {path.name}",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @property
+    def fps(self: Self) -> float | None:
+        """Get the video FPS if available."""
+        return self._fps
+
+    @property
+    def video_time(self: Self) -> float | None:
+        """Return the presentation time of the frame last returned, None if the video has no frame rate."""
+        return self._clock.pts if self._clock.interval else None
+
+    @property
+    def ring_size(self: Self) -> int:
+        """Get the number of frame buffers."""
+        return len(self._buffers)
+
+    def restart(self: Self) -> None:
+        """Restart the presentation clock from the last frame returned after a pause."""
+        with self._condition:
+            self._clock.restart()
+
+    def _run(self: Self) -> None:
+        """Decode frames into free buffers until stopped."""
+        while True:
+            with self._condition:
+                while not self._free and not self._stopping:
+                    self._condition.wait()
+
+                if self._stopping:
+                    break
+
+                # a frame that would be replaced before it is shown is not worth converting
+                pts = self._frame_count * self._clock.interval
+                slot = None
+                if not self._clock.late(pts, timer()):
+                    slot = self._free.popleft()
+
+            try:
+                if slot is None:
+                    self._source.skip()
+
+                else:
+                    buffer = self._buffers[slot]
+                    cv_image = self._source.read(buffer)
+                    if cv_image is not buffer:
+                        buffer[...] = cv_image
+
+            except ScriptError as e:
+                log.error(e)
+                break
+
+            with self._condition:
+                if slot is None:
+                    self.stats.dropped += 1
+                else:
+                    self._ready.append((slot, pts))
+                    self.stats.decoded += 1
+                self._frame_count += 1
+
+        self._source.release()
+
+    def get_frame(self: Self) -> np.ndarray | None:
+        """
+        Return the newest frame that is due for presentation.
+
+        The buffer returned is valid until the next call. None is returned if
+        there is no new frame and the previous frame should be repeated.
+        """
+        with self._condition:
+            if self._in_use is not None:
+                self._free.append(self._in_use)
+                self._in_use = None
+                self._condition.notify()
+
+            time_now = timer()
+            play_time = self._clock.play_time(time_now)
+
+            slot = None
+            pts = None
+            while self._ready and self._ready[0][1] <= play_time:
+                if slot is not None:
+                    self._free.append(slot)
+                    self.stats.dropped += 1
+                slot, pts = self._ready.popleft()
+
+            if slot is None:
+                next_time = self._frame_count * self._clock.interval
+                if not self._ready and next_time <= play_time:
+                    self.stats.late += 1
+                else:
+                    self.stats.repeated += 1
+
+                return None
+
+            self._in_use = slot
+            self._condition.notify()
+            self.stats.uploaded += 1
+            self._clock.present(pts, time_now)
+
+            return self._buffers[slot]
+
+    def release(self: Self) -> None:
+        """Stop decoding and release the video."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+
+        self._thread.join()
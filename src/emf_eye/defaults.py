@@ -0,0 +1,227 @@
+"""Saved controller values, written in the background and reloaded when another tool changes them."""
+
+import ctypes
+import json
+import logging
+import os
+import select
+import threading
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Self
+
+log = logging.getLogger("defaults")
+
+
+DEFAULTS_FILE_NAME = "controller.json"
+# the longest a change goes unnoticed without inotify, and the longest stopping waits
+WATCH_INTERVAL = 0.5
+WATCH_READ_SIZE = 4096
+# inotify events for a file written in place or replaced whole
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+
+def inotify_watch(path: Path) -> int | None:
+    """Watch a directory with inotify, returning the file descriptor to wait on, or None where inotify is not available."""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    except (AttributeError, OSError, TypeError):
+        return None
+
+    if fd < 0:
+        return None
+
+    # a file replaced whole is a new inode, so the directory is watched rather than the file
+    if libc.inotify_add_watch(fd, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+
+    return fd
+
+
+def atomic_write(path: Path, data: bytes) -> None:
+    """Replace a file whole, so a crash or power cut leaves either the old or the new file."""
+    temp_path = path.with_name(path.name + ".tmp")
+    with open(temp_path, "wb") as file_object:
+        file_object.write(data)
+        file_object.flush()
+        os.fsync(file_object.fileno())
+    os.replace(temp_path, path)
+
+    # the rename is only durable once the directory is written
+    fd = os.open(path.resolve().parent, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+
+    finally:
+        os.close(fd)
+
+
+class BackgroundWriter:
+    """Files written one at a time in order on a background thread, so saving never holds up a frame."""
+
+    def __init__(self: Self, name: str = "save") -> None:
+        """
+        Start the writer.
+
+        Args:
+            name (str, optional): Name of the background thread. Defaults to "save".
+
+        """
+        self._executor = ThreadPoolExecutor(1, name)
+
+    def submit(self: Self, write: Callable[..., None], *args: object) -> None:
+        """Call a save function in the background, with arguments that must not be changed afterwards."""
+        self._executor.submit(self._write, write, args)
+
+    def stop(self: Self) -> None:
+        """Wait for the saves to be written."""
+        self._executor.shutdown()
+
+    @staticmethod
+    def _write(write: Callable[..., None], args: tuple) -> None:
+        """Call a save function, logging what it did not handle as there is no caller to raise to."""
+        try:
+            write(*args)
+
+        except Exception:
+            log.exception("unable to save")
+
+
+class DefaultsFile:
+    """Controller values kept in memory, so the render thread never waits for the file."""
+
+    def __init__(
+        self: Self,
+        path: Path | None = None,
+        on_change: Callable[[dict], None] | None = None,
+    ) -> None:
+        """
+        Read the saved values.
+
+        Args:
+            path (Path, optional): Path to the file. Defaults to DEFAULTS_FILE_NAME.
+            on_change (Callable[[dict], None], optional): Called from a background thread with the values when another tool changes the file. Defaults to None, not watching the file.
+
+        """
+        self._path = path or Path(DEFAULTS_FILE_NAME)
+
+        # held while writing, so a save is not mistaken for a change by another tool
+        self._lock = threading.Lock()
+        self._stat = None
+        with self._lock:
+            self._stat = self._stat_key()
+            self._data = self._read() or {}
+
+        self._writer = BackgroundWriter("defaults save")
+
+        self._on_change = on_change
+        self._stopping = threading.Event()
+        if on_change:
+            threading.Thread(
+                target=self._watch,
+                name="defaults watch",
+                daemon=True,
+            ).start()
+
+    @property
+    def data(self: Self) -> dict:
+        """Return the values last read or saved."""
+        return self._data
+
+    def save(self: Self, data: dict) -> None:
+        """Save the values in the background, which must not be changed afterwards."""
+        self._data = data
+        self._writer.submit(self._write, data)
+
+    def stop(self: Self) -> None:
+        """Stop watching the file, waiting for the saves to be written."""
+        self._stopping.set()
+        self._writer.stop()
+
+    def _stat_key(self: Self) -> tuple[int, int, int] | None:
+        """Return what changes when the file is written or replaced, None if there is no file."""
+        try:
+            stat = self._path.stat()
+
+        except FileNotFoundError:
+            return None
+
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _read(self: Self) -> dict | None:
+        """Read the values, None if there is no file or it cannot be read."""
+        try:
+            with open(self._path) as file_object:
+                data = json.load(file_object)
+
+            if not isinstance(data, dict):
+                raise ValueError("not an object")
+
+            return data
+
+        except FileNotFoundError:
+            return None
+
+        except (OSError, ValueError) as e:
+            log.error("unable to load %s: %s", self._path, e)
+            return None
+
+    def _write(self: Self, data: dict) -> None:
+        """Replace the file whole, so a crash or power cut keeps the last save."""
+        try:
+            with self._lock:
+                atomic_write(self._path, json.dumps(data).encode())
+                self._stat = self._stat_key()
+
+            log.debug("saved %s", self._path)
+
+        except (OSError, TypeError, ValueError) as e:
+            log.error("unable to save %s: %s", self._path, e)
+
+    def _watch(self: Self) -> None:
+        """Pass on the values whenever another tool changes the file."""
+        fd = inotify_watch(self._path.resolve().parent)
+        if fd is None:
+            log.debug("inotify not available, checking %s for changes", self._path)
+
+        try:
+            while not self._stopping.is_set():
+                if fd is None:
+                    self._stopping.wait(WATCH_INTERVAL)
+
+                else:
+                    # the events only wake the check, which the file modification says is needed
+                    ready, _, _ = select.select([fd], [], [], WATCH_INTERVAL)
+                    while ready:
+                        try:
+                            os.read(fd, WATCH_READ_SIZE)
+
+                        except BlockingIOError:
+                            break
+
+                self._check()
+
+        finally:
+            if fd is not None:
+                os.close(fd)
+
+    def _check(self: Self) -> None:
+        """Read the file if it has changed since last read or saved."""
+        with self._lock:
+            stat = self._stat_key()
+            if stat == self._stat:
+                return
+
+            # a file that cannot be read is not retried until it changes again
+            self._stat = stat
+            data = self._read()
+
+        if data is not None:
+            log.info("reloading %s", self._path)
+            self._data = data
+            self._on_change(data)
@@ -2,15 +2,22 @@
 
 import argparse
 import logging
+from pathlib import Path
 from timeit import default_timer as timer
 
 import pygame
 from OpenGL import GL
 
+from .control import load_control_points, save_control_points
 from .controller import Controller
+from .decoder import DECODER_DEFAULT, DECODERS
+from .defaults import BackgroundWriter
 from .exceptions import QuitError
-from .scene import Scene
-from .warp import Warp, calculate_warp, render_warp
+from .manager import SCENE_MEMORY_DEFAULT, SceneManager
+from .output import Output, output_viewports
+from .profiler import INPUT_LATENCY, Profiler, StartupTimer
+from .transition import Transition
+from .warp import WARP_PARAMETER_STEPS, Warp
 
 log = logging.getLogger()
 log_handler = logging.StreamHandler()
@@ -19,6 +26,7 @@ log.addHandler(log_handler)
 
 RESOLUTION_TARGET = (1920, 1080)
 FPS_DEFAULT = 25
+DISPLAY_FPS_DEFAULT = 60
 SHOWREEL_TIME = 60 * 1
 
 
@@ -47,10 +55,105 @@ def run() -> None:
         action="store_true",
         help=f"switch scene every {SHOWREEL_TIME} seconds",
     )
+    parser.add_argument(
+        "-d",
+        "--decode-ahead",
+        type=int,
+        default=0,
+        metavar="FRAMES",
+        help="decode video frames ahead in a background thread (0 to disable)",
+    )
+    parser.add_argument(
+        "--decoder",
+        choices=DECODERS,
+        default=DECODER_DEFAULT,
+        help="video decoder for scenes that do not choose one",
+    )
+    parser.add_argument(
+        "--no-frame-cache",
+        dest="frame_cache",
+        action="store_false",
+        help="decode scene videos even if emf-eye-cache has transcoded them",
+    )
+    parser.add_argument(
+        "--scene-memory",
+        type=int,
+        default=SCENE_MEMORY_DEFAULT,
+        metavar="MB",
+        help="memory for keeping neighbouring scenes ready to switch to (0 to disable)",
+    )
+    parser.add_argument(
+        "--display-fps",
+        type=int,
+        default=DISPLAY_FPS_DEFAULT,
+        metavar="FPS",
+        help="render frame rate limit, video frames are chosen by presentation time (0 to follow vsync only)",
+    )
+    parser.add_argument(
+        "--warp-steps",
+        type=int,
+        default=WARP_PARAMETER_STEPS,
+        metavar="STEPS",
+        help="number of warp grid steps per axis",
+    )
+    parser.add_argument(
+        "-g",
+        "--gpu-warp",
+        action="store_true",
+        help="calculate the parameter warp on the GPU",
+    )
+    parser.add_argument(
+        "-b",
+        "--bake",
+        action="store_true",
+        help="render saved warps from baked lookup tables",
+    )
+    parser.add_argument(
+        "-o",
+        "--outputs",
+        type=int,
+        default=1,
+        metavar="COUNT",
+        help="number of outputs side by side across the display, each with its own warp",
+    )
+    parser.add_argument(
+        "--knob-interval",
+        type=int,
+        default=0,
+        metavar="MS",
+        help="minimum time between warp updates while knobs are turned (0 for every frame)",
+    )
+    parser.add_argument(
+        "--knob-debounce",
+        action="store_true",
+        help="update the warp once the knobs have been still for the knob interval",
+    )
+    parser.add_argument(
+        "--profile-csv",
+        type=Path,
+        metavar="PATH",
+        help="save the frame timings to a CSV file on exit",
+    )
+    parser.add_argument(
+        "--mipmaps",
+        action="store_true",
+        help="generate video texture mipmaps",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="log the startup time breakdown and status messages",
+    )
     args = parser.parse_args()
 
-    # initialise controller
-    controller = Controller()
+    if args.outputs < 1:
+        parser.error("at least one output is needed")
+
+    log.setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    # start in stages, opening the window before anything that can wait
+    startup = StartupTimer()
 
     # initialise the display
     pygame.init()
@@ -74,17 +177,76 @@ def run() -> None:
     GL.glMatrixMode(GL.GL_MODELVIEW)
     GL.glLoadIdentity()
 
-    # initliase scenes
-    scenes = Scene.load_scenes()
-    scene_idx = 0
-    scene = scenes[scene_idx]
-    scene.start()
+    GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+    pygame.display.flip()
+
+    startup.mark("display")
+
+    # the scene modules are slow to import and not needed to open the window
+    from .scene import Scene
+
+    startup.mark("modules")
+
+    # initialise controller, with the saved values while MIDI starts in the background
+    controller = Controller(
+        knob_interval=args.knob_interval / 1000.0,
+        knob_debounce=args.knob_debounce,
+        outputs=args.outputs,
+    )
+
+    startup.mark("controller")
+
+    # saved files are written in the background so a save does not drop frames
+    writer = BackgroundWriter()
+
+    # every output warps the same decoded frame
+    control_points = load_control_points(args.outputs)
+    outputs = [
+        Output(
+            viewport,
+            controller.output(idx),
+            args.warp_steps,
+            args.gpu_warp,
+            args.bake,
+            control_points[idx],
+            writer,
+        )
+        for idx, viewport in enumerate(
+            output_viewports(display_resolution, args.outputs),
+        )
+    ]
+
+    profiler = Profiler()
+
+    startup.mark("outputs")
+
+    # initliase scenes, which are read when first used
+    texture_options = {
+        "decode_ahead": args.decode_ahead,
+        "mipmaps": args.mipmaps,
+        "decoder": args.decoder,
+    }
+    scenes = Scene.load_scenes(
+        texture_options=texture_options,
+        frame_cache=args.frame_cache,
+    )
+
+    startup.mark("scenes")
+
+    transition = Transition(FPS_DEFAULT)
+    scene_manager = SceneManager(scenes, args.scene_memory * 1_000_000, transition)
+    scene = scene_manager.current
+
+    startup.mark("first scene")
 
     show_points = False
+    show_profile = False
     warp_num = next(iter(Warp))
-    coord_array = None
     mouse_move = False
     mouse_hide = True
+    # the output and control point under the mouse, and the one being dragged
+    point_selected = None
+    point_drag = None
     tx_x, tx_y = 0.0, 0.0
     tx_time = timer()
     showreel_time = timer()
@@ -93,6 +255,13 @@ def run() -> None:
 
     try:
         while True:
+            profiler.start_frame()
+
+            # apply the controller changes received since the last frame before they are used
+            controller.update()
+
+            profiler.mark("controller")
+
             events = pygame.event.get()
 
             if args.showreel:
@@ -114,6 +283,7 @@ def run() -> None:
                             pygame.K_p,
                             pygame.K_w,
                             pygame.K_m,
+                            pygame.K_o,
                         ][pad - 1]
                         events.append(
                             pygame.event.Event(pygame.KEYDOWN, {"key": key}),
@@ -136,62 +306,102 @@ def run() -> None:
                             warp_num = next(iter(Warp))
 
                         # reset to ensure it is reread
-                        coord_array = None
+                        for output in outputs:
+                            output.reset()
+
+                    if event.key == pygame.K_t:
+                        show_profile = not show_profile
 
                     if event.key == pygame.K_m:
                         mouse_move = not mouse_move
 
+                    if event.key == pygame.K_o:
+                        controller.select_output(controller.selected_index + 1)
+
                     if event.key == pygame.K_h:
                         mouse_hide = not mouse_hide
                         pygame.mouse.set_visible(not mouse_hide)
 
                     if event.key == pygame.K_l:
                         controller.load_defaults()
+                        control_points = load_control_points(len(outputs))
+                        for output, points in zip(outputs, control_points, strict=True):
+                            output.load_control(points)
 
                     if event.key == pygame.K_s:
                         controller.save_defaults()
+                        # copied as dragging moves the points in place
+                        points = [output.control_points for output in outputs]
+                        writer.submit(
+                            save_control_points,
+                            [None if p is None else p.copy() for p in points],
+                        )
+                        for output in outputs:
+                            output.bake()
 
-                    if event.key == pygame.K_RIGHT:
-                        scene_idx += 1
-                        if scene_idx == len(scenes):
-                            scene_idx = 0
+                    # number keys switch to a preset, with shift to save one
+                    if pygame.K_1 <= event.key <= pygame.K_9:
+                        preset = str(event.key - pygame.K_0)
+                        if event.mod & pygame.KMOD_SHIFT:
+                            controller.save_preset(preset)
+                        else:
+                            controller.load_preset(preset)
 
-                        scene.stop()
-                        scene = scenes[scene_idx]
-                        scene.start()
+                    if event.key == pygame.K_RIGHT:
+                        scene = scene_manager.switch(1)
 
                         showreel_time = timer()
 
                     if event.key == pygame.K_LEFT:
-                        scene_idx -= 1
-                        if scene_idx < 0:
-                            scene_idx = len(scenes) - 1
-
-                        scene.stop()
-                        scene = scenes[scene_idx]
-                        scene.start()
+                        scene = scene_manager.switch(-1)
 
                         showreel_time = timer()
 
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    # control points are dragged from where they were selected
+                    if warp_num == Warp.CONTROL and point_selected:
+                        point_drag = point_selected
+
+                elif event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                    point_drag = None
+
                 elif event.type == pygame.QUIT:
                     raise QuitError()
 
-            if controller.updated:
-                coord_array = None
+            # get the mouse position relative to the output under the mouse
+            sx = sy = None
+            mouse_output = None
+            if mouse_move or show_points:
+                mx, my = pygame.mouse.get_pos()
+                # viewports count rows from the bottom
+                my = display_resolution[1] - 1 - my
+                mouse_output = next(
+                    (output for output in outputs if output.contains((mx, my))),
+                    outputs[0],
+                )
+                if point_drag:
+                    mouse_output = point_drag[0]
+                sx, sy = mouse_output.relative_position((mx, my))
 
-            if coord_array is None:
-                coord_array = calculate_warp(warp_num, display_resolution, controller)
+                if point_drag and warp_num == Warp.CONTROL:
+                    point_drag[0].drag(point_drag[1], (sx, sy))
+
+            profiler.mark("events")
+
+            for output in outputs:
+                output.update_warp(warp_num)
+
+            profiler.mark("warp")
 
             GL.glClear(GL.GL_COLOR_BUFFER_BIT)
 
+            # the outgoing scene of a transition decodes at the same time
+            transition.decode()
+            tx_ref = scene.update_texture()
+            transition.update()
+
             # get texture offset from mouse move
-            sx = sy = None
             if mouse_move:
-                mx, my = pygame.mouse.get_pos()
-
-                sx = mx / display_resolution[0]
-                sy = 1.0 - (my / display_resolution[1])
-
                 ntx_x = 0.5 - sx
                 ntx_y = 0.5 - sy
 
@@ -205,30 +415,68 @@ def run() -> None:
                 tx_time = tx_time_now
 
             else:
+                # for the frame just uploaded, as the moves follow the video
                 tx_x, tx_y = scene.update_position()
 
-            tx_ref = scene.update_texture()
+            tracks = scene.update_tracks()
 
-            render_warp(
-                tx_ref,
-                display_resolution,
-                coord_array,
-                (tx_x, tx_y),
-                show_points,
-                args.invert,
-                None if sx is None else (sx, sy),
-            )
+            profiler.mark("texture")
+
+            profiler.begin_gpu()
+            point_selected = None
+            for output in outputs:
+                selected = output.render(
+                    tx_ref,
+                    (tx_x, tx_y),
+                    show_points,
+                    args.invert,
+                    (sx, sy) if output is mouse_output else None,
+                    transition,
+                    tracks["brightness"],
+                )
+                if selected:
+                    point_selected = (output, selected[1])
+            GL.glViewport(0, 0, *display_resolution)
+            profiler.end_gpu()
+
+            if show_profile:
+                profiler.render(display_resolution, scene.stats)
+
+            profiler.mark("render")
 
             pygame.display.flip()
 
-            controller.update()
+            if startup:
+                startup.mark("first frame")
+                startup.log()
+                startup = None
+
+            controller.presented()
+            if controller.latency is not None:
+                profiler.record(INPUT_LATENCY, controller.latency)
+
+            profiler.mark("flip")
+
+            scene_manager.update()
+
+            profiler.mark("scenes")
+
+            # render at the display rate, the textures repeat or drop video frames to keep time
+            clock.tick(args.display_fps)
 
-            clock.tick(scene.fps or FPS_DEFAULT)
+            profiler.mark("wait")
 
     except (QuitError, KeyboardInterrupt):
         pass
 
     finally:
-        scene.stop()
+        scene_manager.release()
+        transition.release()
+        for output in outputs:
+            output.release()
+        if args.profile_csv:
+            profiler.save_csv(args.profile_csv)
+        profiler.release()
         pygame.quit()
         controller.stop()
+        writer.stop()
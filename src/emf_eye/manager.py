@@ -0,0 +1,244 @@
+"""Scene switching with neighbouring scenes kept ready to play."""
+
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import TYPE_CHECKING, Self
+
+from .decoder import lower_thread_priority
+from .exceptions import ScriptError
+from .transition import Transition
+
+if TYPE_CHECKING:
+    from .scene import Scene
+
+log = logging.getLogger("manager")
+
+
+SCENE_MEMORY_DEFAULT = 512
+
+
+class SceneManager:
+    """Switch between scenes, keeping the next and previous scenes warm."""
+
+    def __init__(
+        self: Self,
+        scenes: list["Scene"],
+        memory_budget: int,
+        transition: Transition | None = None,
+    ) -> None:
+        """
+        Start the first scene.
+
+        Args:
+            scenes (list[Scene]): Scenes to switch between.
+            memory_budget (int): Bytes of video frames the scenes may hold, 0 to keep only the current scene.
+            transition (Transition, optional): Transition to start when switching scenes. Defaults to None, always cutting.
+
+        """
+        self._scenes = scenes
+        self._memory_budget = memory_budget
+        self._transition = transition
+        self._scene_idx = 0
+
+        # prepared scenes, least recently used first
+        self._warm: OrderedDict[int, "Scene"] = OrderedDict()
+        self._pending: dict[int, Future] = {}
+        self._failed = set()
+        self._executor = ThreadPoolExecutor(
+            1,
+            "scene prepare",
+            initializer=lower_thread_priority,
+        )
+
+        self._start(1)
+        self._warm[self._scene_idx] = self.current
+
+    @property
+    def current(self: Self) -> "Scene":
+        """Return the current scene."""
+        return self._scenes[self._scene_idx]
+
+    @property
+    def memory(self: Self) -> int:
+        """Return the estimated bytes held by the prepared scenes."""
+        return sum(scene.memory for scene in self._warm.values())
+
+    def _neighbours(self: Self) -> list[int]:
+        """Return the scenes to keep warm, most important first."""
+        neighbours = [(self._scene_idx + step) % len(self._scenes) for step in (1, -1)]
+
+        return [idx for idx in dict.fromkeys(neighbours) if idx != self._scene_idx]
+
+    def switch(self: Self, step: int) -> "Scene":
+        """
+        Switch to a neighbouring scene.
+
+        Args:
+            step (int): Number of scenes to move forward, negative to move back.
+
+        Returns:
+            Scene: The new current scene.
+
+        """
+        scene_from = self.current
+        self._scene_idx = (self._scene_idx + step) % len(self._scenes)
+
+        # a scene still being prepared is nearer ready than starting again
+        if self._scene_idx in self._pending:
+            self._finish(self._scene_idx)
+
+        scene = self._start(step)
+        self._warm[self._scene_idx] = scene
+        self._warm.move_to_end(self._scene_idx)
+
+        if self._transition and scene is not scene_from:
+            self._transition.start(scene_from, scene)
+
+        self._evict()
+
+        return scene
+
+    def _start(self: Self, step: int) -> "Scene":
+        """
+        Start the current scene, moving on past scenes that cannot be started.
+
+        Args:
+            step (int): Direction to move in if the scene cannot be started.
+
+        Raises:
+            ScriptError: If none of the scenes can be started.
+
+        Returns:
+            Scene: The started scene.
+
+        """
+        # scenes are only read when first used, so an invalid scene is found here
+        direction = 1 if step >= 0 else -1
+        for _ in self._scenes:
+            scene = self.current
+            try:
+                scene.start()
+                self._failed.discard(self._scene_idx)
+
+                return scene
+
+            except ScriptError as e:
+                log.error("unable to start %s: %s", scene, e)
+                self._failed.add(self._scene_idx)
+                self._warm.pop(self._scene_idx, None)
+                scene.stop()
+
+            self._scene_idx = (self._scene_idx + direction) % len(self._scenes)
+
+        raise ScriptError("no scene can be started")
+
+    def update(self: Self) -> None:
+        """Finish preparing scenes in the background and warm the next one needed."""
+        for idx, future in list(self._pending.items()):
+            if future.done():
+                self._finish(idx)
+
+        self._evict()
+
+        if self._pending:
+            return
+
+        # the current scene is the best estimate of the memory another will need
+        scene_memory = self.current.memory
+        for idx in self._neighbours():
+            if idx in self._warm or idx in self._failed:
+                continue
+
+            if self._evict(scene_memory, idx):
+                self._pending[idx] = self._executor.submit(self._scenes[idx].prepare)
+
+            break
+
+    def _finish(self: Self, idx: int) -> None:
+        """Upload the first frame of a scene prepared in the background."""
+        future = self._pending.pop(idx)
+        scene = self._scenes[idx]
+
+        try:
+            future.result()
+
+        except ScriptError as e:
+            # leave the error to be raised if the scene is switched to
+            log.error("unable to prepare %s: %s", scene, e)
+            self._failed.add(idx)
+            scene.stop()
+            return
+
+        # allocates the texture so switching only has to start playback
+        scene.update_texture()
+
+        self._warm[idx] = scene
+        self._warm.move_to_end(idx, last=False)
+
+    def _evict(self: Self, required: int = 0, idx_for: int | None = None) -> bool:
+        """
+        Stop the least important scenes until within the memory budget.
+
+        Args:
+            required (int, optional): Bytes to make room for. Defaults to 0.
+            idx_for (int, optional): Neighbouring scene to make room for, only less important scenes are stopped. Defaults to None.
+
+        Returns:
+            bool: True if the required bytes fit within the budget.
+
+        """
+        neighbours = self._neighbours()
+
+        # the outgoing scene of a transition is still playing
+        playing = [self._scene_idx]
+        if self._transition and self._transition.active:
+            playing.append(self._scenes.index(self._transition.scene_from))
+
+        # least recently used first, then the neighbours least important first
+        candidates = [
+            idx for idx in self._warm if idx not in neighbours and idx not in playing
+        ]
+        candidates += [
+            idx
+            for idx in reversed(neighbours)
+            if idx in self._warm and idx not in playing
+        ]
+        if idx_for is not None:
+            candidates = [
+                idx
+                for idx in candidates
+                if idx not in neighbours[: neighbours.index(idx_for)]
+            ]
+
+        memory = self.memory
+        evict = []
+        for idx in candidates:
+            if memory + required <= self._memory_budget:
+                break
+
+            evict.append(idx)
+            memory -= self._warm[idx].memory
+
+        # there is no point stopping scenes without making enough room
+        if idx_for is not None and memory + required > self._memory_budget:
+            return False
+
+        for idx in evict:
+            scene = self._warm.pop(idx)
+            log.debug("evict %s", scene)
+            scene.stop()
+
+        return memory + required <= self._memory_budget
+
+    def release(self: Self) -> None:
+        """Stop all the scenes."""
+        if self._transition:
+            self._transition.stop()
+
+        self._executor.shutdown()
+        self._pending = {}
+        self._warm.clear()
+
+        for scene in self._scenes:
+            scene.stop()
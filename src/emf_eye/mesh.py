@@ -0,0 +1,221 @@
+"""Warp mesh held in OpenGL vertex buffers."""
+
+import ctypes
+import logging
+from typing import Self
+
+import numpy as np
+from OpenGL import GL
+
+from .shader import Shader
+
+log = logging.getLogger("mesh")
+
+
+# shared by all mesh shaders so the vertex array can be drawn with any of them
+ATTRIBUTE_LOCATIONS = {"position": 0, "tex_coord": 1}
+
+VERTEX_SHADER = """
+#version 120
+
+attribute vec2 position;
+attribute vec2 tex_coord;
+
+uniform vec2 offset;
+uniform bool invert_x;
+
+varying vec2 frag_tex_coord;
+
+// the WARP hook moves the mesh on the GPU
+#ifndef WARP
+vec2 warp(vec2 position) {
+    return position;
+}
+#endif
+
+void main() {
+    vec2 coord = tex_coord;
+    if (invert_x) {
+        coord.x = 1.0 - coord.x;
+    }
+    coord += offset;
+
+    // textures are stored top row first so flip vertically
+    frag_tex_coord = vec2(coord.x, 1.0 - coord.y);
+
+    // orthographic projection - (0, 0) bottom left, (1, 1) top right
+    gl_Position = vec4((warp(position) * 2.0) - 1.0, 0.0, 1.0);
+}
+"""
+
+FRAGMENT_SHADER = """
+#version 120
+
+uniform sampler2D video;
+
+varying vec2 frag_tex_coord;
+
+// the BLEND hook mixes in a second video
+#ifndef BLEND
+vec4 blend(sampler2D video, vec2 coord) {
+    return texture2D(video, coord);
+}
+#endif
+
+void main() {
+    gl_FragColor = blend(video, frag_tex_coord);
+}
+"""
+
+
+def grid_coords(steps: int) -> np.ndarray:
+    """Return an unwarped grid of coordinates."""
+    v = np.linspace(0.0, 1.0, steps + 1, dtype=np.float32)
+    x, y = np.meshgrid(v, v)
+
+    return np.stack([x, y], axis=-1)
+
+
+def grid_indices(y_size: int, x_size: int) -> np.ndarray:
+    """Return the triangle indices for a grid of vertices."""
+    idx = np.arange(y_size * x_size, dtype=np.uint32).reshape(y_size, x_size)
+    v00 = idx[:-1, :-1]
+    v01 = idx[:-1, 1:]
+    v10 = idx[1:, :-1]
+    v11 = idx[1:, 1:]
+
+    return np.stack([v00, v01, v10, v01, v11, v10], axis=-1).ravel()
+
+
+class WarpMesh:
+    """Warp mesh class."""
+
+    def __init__(self: Self, vertex_source: str = VERTEX_SHADER) -> None:
+        """
+        Create the shader and buffers for the mesh.
+
+        Args:
+            vertex_source (str, optional): GLSL vertex shader source. Defaults to VERTEX_SHADER.
+
+        """
+        self.vertex_source = vertex_source
+        self.fragment_source = FRAGMENT_SHADER
+        self._shader = Shader(vertex_source, FRAGMENT_SHADER, ATTRIBUTE_LOCATIONS)
+
+        self._vao_ref = GL.glGenVertexArrays(1)
+        self._vbo_ref, self._ibo_ref = GL.glGenBuffers(2)
+        self._grid_size = None
+        self._index_count = 0
+        self._vertices = None
+
+        self._coord_array = None
+        self.uniforms: dict[str, float] = {}
+
+    @property
+    def coord_array(self: Self) -> np.ndarray | None:
+        """Return the warp coordinates of the mesh."""
+        return self._coord_array
+
+    @property
+    def grid_size(self: Self) -> tuple[int, int] | None:
+        """Return the number of vertex rows and columns."""
+        return self._grid_size
+
+    def update(self: Self, coord_array: np.ndarray) -> None:
+        """Upload a new warp to the vertex buffers, keeping a copy so the caller can reuse the array."""
+        y_size, x_size, _ = coord_array.shape
+
+        # interleaved display position and source texture coordinate per vertex,
+        # the texture coordinates only change with the grid size
+        vertices = self._vertices
+        if vertices is None or vertices.shape[:2] != (y_size, x_size):
+            vertices = np.empty((y_size, x_size, 4), np.float32)
+            vertices[..., 2] = np.linspace(0.0, 1.0, x_size)[np.newaxis, :]
+            vertices[..., 3] = np.linspace(0.0, 1.0, y_size)[:, np.newaxis]
+            self._vertices = vertices
+        vertices[..., :2] = coord_array
+        self._coord_array = vertices[..., :2]
+
+        GL.glBindVertexArray(self._vao_ref)
+
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vbo_ref)
+        GL.glBufferData(
+            GL.GL_ARRAY_BUFFER,
+            vertices.nbytes,
+            vertices,
+            GL.GL_STATIC_DRAW,
+        )
+
+        if self._grid_size != (y_size, x_size):
+            self._grid_size = (y_size, x_size)
+            log.debug("grid %sx%s", x_size, y_size)
+
+            indices = grid_indices(y_size, x_size)
+            self._index_count = len(indices)
+
+            GL.glBindBuffer(GL.GL_ELEMENT_ARRAY_BUFFER, self._ibo_ref)
+            GL.glBufferData(
+                GL.GL_ELEMENT_ARRAY_BUFFER,
+                indices.nbytes,
+                indices,
+                GL.GL_STATIC_DRAW,
+            )
+
+            stride = vertices.itemsize * 4
+            for name, offset in [("position", 0), ("tex_coord", 2)]:
+                location = ATTRIBUTE_LOCATIONS[name]
+                GL.glEnableVertexAttribArray(location)
+                GL.glVertexAttribPointer(
+                    location,
+                    2,
+                    GL.GL_FLOAT,
+                    GL.GL_FALSE,
+                    stride,
+                    ctypes.c_void_p(offset * vertices.itemsize),
+                )
+
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+    def draw(
+        self: Self,
+        tx_ref: int,
+        offset_coord: tuple[float, float],
+        invert_x: bool = False,
+        shader: Shader | None = None,
+    ) -> None:
+        """Draw the mesh textured with the video."""
+        if not self._index_count:
+            return
+
+        shader = shader or self._shader
+        shader.use()
+        GL.glUniform2f(shader.uniform("offset"), *offset_coord)
+        GL.glUniform1i(shader.uniform("invert_x"), invert_x)
+        GL.glUniform1i(shader.uniform("video"), 0)
+        for name, value in self.uniforms.items():
+            GL.glUniform1f(shader.uniform(name), value)
+
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
+
+        GL.glBindVertexArray(self._vao_ref)
+        GL.glDrawElements(
+            GL.GL_TRIANGLES,
+            self._index_count,
+            GL.GL_UNSIGNED_INT,
+            ctypes.c_void_p(0),
+        )
+        GL.glBindVertexArray(0)
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glUseProgram(0)
+
+    def release(self: Self) -> None:
+        """Release the shader and buffers."""
+        if self._vao_ref:
+            GL.glDeleteVertexArrays(1, [self._vao_ref])
+            GL.glDeleteBuffers(2, [self._vbo_ref, self._ibo_ref])
+        self._vao_ref = None
+
+        self._shader.release()
@@ -0,0 +1,241 @@
+"""
+Offscreen OpenGL rendering without a display server.
+
+PyOpenGL must first be imported with PYOPENGL_PLATFORM=egl in the environment.
+"""
+
+import argparse
+import ctypes
+import logging
+import os
+from typing import Self
+
+import numpy as np
+from OpenGL import EGL, GL
+
+from .exceptions import ScriptError
+
+log = logging.getLogger("offscreen")
+
+
+RESOLUTIONS = {
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+
+def parse_resolution(value: str) -> tuple[int, int]:
+    """Parse a named or WIDTHxHEIGHT resolution."""
+    if value.lower() in RESOLUTIONS:
+        return RESOLUTIONS[value.lower()]
+
+    try:
+        width, height = (int(v) for v in value.lower().split("x"))
+
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(f"invalid resolution {value}") from e
+
+    return width, height
+
+
+class OffscreenContext:
+    """EGL context rendering into a framebuffer object."""
+
+    def __init__(self: Self, resolution: tuple[int, int]) -> None:
+        """
+        Create the context and make it current.
+
+        Args:
+            resolution (tuple[int, int]): Framebuffer width and height.
+
+        Raises:
+            ScriptError: If an EGL context cannot be created.
+
+        """
+        self._resolution = resolution
+
+        if os.environ.get("PYOPENGL_PLATFORM") != "egl":
+            raise ScriptError("PyOpenGL was not imported with the EGL platform")
+
+        try:
+            self._display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+            EGL.eglInitialize(self._display, None, None)
+
+            config_attributes = [
+                EGL.EGL_SURFACE_TYPE,
+                EGL.EGL_PBUFFER_BIT,
+                EGL.EGL_RENDERABLE_TYPE,
+                EGL.EGL_OPENGL_BIT,
+                EGL.EGL_NONE,
+            ]
+            config = EGL.EGLConfig()
+            config_count = EGL.EGLint()
+            EGL.eglChooseConfig(
+                self._display,
+                (EGL.EGLint * len(config_attributes))(*config_attributes),
+                ctypes.pointer(config),
+                1,
+                ctypes.pointer(config_count),
+            )
+            if not config_count.value:
+                raise ScriptError("no EGL config available")
+
+            # the pbuffer is only needed to make the context current
+            surface_attributes = [EGL.EGL_WIDTH, 1, EGL.EGL_HEIGHT, 1, EGL.EGL_NONE]
+            self._surface = EGL.eglCreatePbufferSurface(
+                self._display,
+                config,
+                (EGL.EGLint * len(surface_attributes))(*surface_attributes),
+            )
+
+            EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+            self._context = EGL.eglCreateContext(
+                self._display,
+                config,
+                EGL.EGL_NO_CONTEXT,
+                None,
+            )
+            EGL.eglMakeCurrent(
+                self._display,
+                self._surface,
+                self._surface,
+                self._context,
+            )
+
+        except EGL.EGLError as e:
+            raise ScriptError(f"unable to create EGL context: {e}") from e
+
+        log.debug(
+            "%s %s",
+            GL.glGetString(GL.GL_RENDERER).decode(),
+            GL.glGetString(GL.GL_VERSION).decode(),
+        )
+
+        self._rbo_ref = GL.glGenRenderbuffers(1)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, self._rbo_ref)
+        GL.glRenderbufferStorage(GL.GL_RENDERBUFFER, GL.GL_RGBA8, *resolution)
+        GL.glBindRenderbuffer(GL.GL_RENDERBUFFER, 0)
+
+        self._fbo_ref = GL.glGenFramebuffers(1)
+        GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, self._fbo_ref)
+        GL.glFramebufferRenderbuffer(
+            GL.GL_FRAMEBUFFER,
+            GL.GL_COLOR_ATTACHMENT0,
+            GL.GL_RENDERBUFFER,
+            self._rbo_ref,
+        )
+        GL.glViewport(0, 0, *resolution)
+
+        # frames read back through alternate PBOs, so the GPU is not waited on
+        self._pbo_refs = None
+        self._pbo_idx = 0
+        self._pbo_pending = None
+
+    @property
+    def renderer(self: Self) -> str:
+        """Return the OpenGL renderer name."""
+        return GL.glGetString(GL.GL_RENDERER).decode()
+
+    def read_pixels(self: Self) -> np.ndarray:
+        """Return the framebuffer as BGR rows, top row first."""
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+        data = GL.glReadPixels(
+            0,
+            0,
+            *self._resolution,
+            GL.GL_BGR,
+            GL.GL_UNSIGNED_BYTE,
+        )
+
+        image = np.frombuffer(data, np.uint8).reshape(
+            self._resolution[1],
+            self._resolution[0],
+            3,
+        )
+
+        return image[::-1]
+
+    def read_pixels_deferred(self: Self) -> np.ndarray | None:
+        """
+        Start reading the framebuffer and return the frame started by the previous call.
+
+        Returns:
+            np.ndarray | None: The previous frame as BGR rows, top row first, or None on the first call.
+
+        """
+        frame_size = self._resolution[0] * self._resolution[1] * 3
+        if self._pbo_refs is None:
+            self._pbo_refs = GL.glGenBuffers(2)
+            for pbo_ref in self._pbo_refs:
+                GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo_ref)
+                GL.glBufferData(
+                    GL.GL_PIXEL_PACK_BUFFER,
+                    frame_size,
+                    None,
+                    GL.GL_STREAM_READ,
+                )
+
+        pbo_ref = self._pbo_refs[self._pbo_idx]
+        self._pbo_idx = 1 - self._pbo_idx
+
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo_ref)
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+        GL.glReadPixels(
+            0,
+            0,
+            *self._resolution,
+            GL.GL_BGR,
+            GL.GL_UNSIGNED_BYTE,
+            ctypes.c_void_p(0),
+        )
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+        image = self.finish_read()
+        self._pbo_pending = pbo_ref
+
+        return image
+
+    def finish_read(self: Self) -> np.ndarray | None:
+        """Return the frame started by the last deferred read, if there is one."""
+        if self._pbo_pending is None:
+            return None
+
+        frame_size = self._resolution[0] * self._resolution[1] * 3
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, self._pbo_pending)
+        address = GL.glMapBuffer(GL.GL_PIXEL_PACK_BUFFER, GL.GL_READ_ONLY)
+        image = np.frombuffer(
+            (ctypes.c_ubyte * frame_size).from_address(address),
+            np.uint8,
+        ).reshape(self._resolution[1], self._resolution[0], 3)
+        image = np.ascontiguousarray(image[::-1])
+        GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+        GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+        self._pbo_pending = None
+
+        return image
+
+    def release(self: Self) -> None:
+        """Release the framebuffer and context."""
+        if self._pbo_refs is not None:
+            GL.glDeleteBuffers(len(self._pbo_refs), self._pbo_refs)
+        self._pbo_refs = None
+        self._pbo_pending = None
+
+        if self._fbo_ref:
+            GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, 0)
+            GL.glDeleteFramebuffers(1, [self._fbo_ref])
+            GL.glDeleteRenderbuffers(1, [self._rbo_ref])
+        self._fbo_ref = None
+
+        if self._context:
+            EGL.eglMakeCurrent(
+                self._display,
+                EGL.EGL_NO_SURFACE,
+                EGL.EGL_NO_SURFACE,
+                EGL.EGL_NO_CONTEXT,
+            )
+            EGL.eglDestroyContext(self._display, self._context)
+            EGL.eglDestroySurface(self._display, self._surface)
+            EGL.eglTerminate(self._display)
+        self._context = None
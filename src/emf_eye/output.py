@@ -0,0 +1,235 @@
+"""Outputs showing the shared video through their own warp in part of the display."""
+
+import logging
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+from OpenGL import GL
+
+from .control import CONTROL_POINTS_DEFAULT, ControlWarp
+from .controller import KnobSet
+from .defaults import BackgroundWriter
+from .exceptions import ScriptError
+from .mesh import WarpMesh
+from .remap import BakedWarp, remap_path
+from .transition import Transition
+from .warp import (
+    WARP_PARAMETER_STEPS,
+    ShaderWarpMesh,
+    Warp,
+    WarpCache,
+    calculate_warp,
+    render_warp,
+)
+
+log = logging.getLogger("output")
+
+
+def output_viewports(
+    display_resolution: tuple[int, int],
+    outputs: int,
+) -> list[tuple[int, int, int, int]]:
+    """Split the display side by side into a viewport per output, such as projectors spanning one desktop."""
+    width = display_resolution[0] // outputs
+
+    return [(idx * width, 0, width, display_resolution[1]) for idx in range(outputs)]
+
+
+class Output:
+    """Display viewport with its own warp and knobs."""
+
+    def __init__(
+        self: Self,
+        viewport: tuple[int, int, int, int],
+        knobs: KnobSet,
+        warp_steps: int = WARP_PARAMETER_STEPS,
+        gpu_warp: bool = False,
+        bake: bool = False,
+        control_points: np.ndarray | None = None,
+        writer: BackgroundWriter | None = None,
+    ) -> None:
+        """
+        Create the warp meshes for the output.
+
+        Args:
+            viewport (tuple[int, int, int, int]): Display area as x, y, width and height.
+            knobs (KnobSet): Warp knob values for the output.
+            warp_steps (int, optional): Number of warp grid steps per axis. Defaults to WARP_PARAMETER_STEPS.
+            gpu_warp (bool, optional): Calculate the parameter warp on the GPU. Defaults to False.
+            bake (bool, optional): Render saved warps from baked lookup tables. Defaults to False.
+            control_points (np.ndarray, optional): Saved CONTROL warp points. Defaults to None, starting from the PARAMETER warp.
+            writer (BackgroundWriter, optional): Writer to save baked lookup tables with. Defaults to None, saving on the render thread.
+
+        """
+        self.viewport = viewport
+        self.resolution = viewport[2:]
+        self._knobs = knobs
+        self._warp_steps = warp_steps
+
+        self._mesh = WarpMesh()
+        self._warp_cache = WarpCache()
+
+        self._shader_mesh = None
+        if gpu_warp:
+            try:
+                self._shader_mesh = ShaderWarpMesh()
+
+            except ScriptError:
+                log.error("GPU warp not available, using the CPU warp")
+
+        self._baked_warp = BakedWarp(writer) if bake else None
+        self._bake_path: Path | None = None
+        self._bake_pending = bake
+
+        self._control_points = control_points
+        self._control = None
+
+        self._warp_num = None
+        self._warp_mesh = None
+        self._render_mesh = None
+
+    @property
+    def control_points(self: Self) -> np.ndarray | None:
+        """Return the CONTROL warp points, None if never used."""
+        return self._control.points if self._control else self._control_points
+
+    def load_control(self: Self, control_points: np.ndarray | None) -> None:
+        """Replace the CONTROL warp points."""
+        self._control_points = control_points
+        self._control = None
+        self.reset()
+
+    def drag(self: Self, point: tuple[int, int], position: tuple[float, float]) -> None:
+        """Move a CONTROL warp point to a position relative to the output."""
+        if self._control:
+            self._control.move(point, position)
+            self.reset()
+
+    def reset(self: Self) -> None:
+        """Recalculate the warp before it is next rendered."""
+        self._warp_mesh = None
+
+    def bake(self: Self) -> None:
+        """Bake the lookup table for the warp before it is next rendered, if baking."""
+        self._bake_pending = self._baked_warp is not None
+
+    def update_warp(self: Self, warp_num: Warp) -> None:
+        """Recalculate the warp if it or the output knobs have changed."""
+        # the table baked last frame has been read back by now
+        if self._baked_warp:
+            self._baked_warp.update()
+
+        if self._knobs.updated:
+            self._warp_mesh = None
+
+        if self._warp_num != warp_num:
+            self._warp_num = warp_num
+            self._warp_mesh = None
+
+        if self._warp_mesh is None:
+            if warp_num == Warp.CONTROL:
+                if self._control is None:
+                    # start from the parameter warp so the points refine the current fit
+                    points = self._control_points
+                    if points is None:
+                        points = calculate_warp(
+                            Warp.PARAMETER,
+                            self.resolution,
+                            self._knobs,
+                            CONTROL_POINTS_DEFAULT - 1,
+                        )
+                    self._control = ControlWarp(points, self._warp_steps)
+
+                # moving a point only recalculated the patches around it
+                self._mesh.update(self._control.coord_array)
+                self._warp_mesh = self._mesh
+
+            elif self._shader_mesh and warp_num == Warp.PARAMETER:
+                self._shader_mesh.update_warp(
+                    self.resolution,
+                    self._knobs,
+                    self._warp_steps,
+                )
+                self._warp_mesh = self._shader_mesh
+
+            else:
+                coord_array = calculate_warp(
+                    warp_num,
+                    self.resolution,
+                    self._knobs,
+                    self._warp_steps,
+                    self._warp_cache,
+                )
+                self._mesh.update(coord_array)
+                self._warp_mesh = self._mesh
+
+            self._render_mesh = self._warp_mesh
+            if self._baked_warp:
+                self._bake_path = remap_path(
+                    warp_num,
+                    self.resolution,
+                    self._knobs,
+                    self._warp_mesh,
+                    control_points=self._control.points
+                    if warp_num == Warp.CONTROL
+                    else None,
+                )
+                if self._baked_warp.load(self._bake_path, self._warp_mesh):
+                    self._render_mesh = self._baked_warp
+
+        # bake missing lookup tables on start and when the warp is saved
+        if self._bake_pending:
+            self._bake_pending = False
+            if self._render_mesh is not self._baked_warp:
+                self._baked_warp.bake(self._bake_path, self._warp_mesh, self.resolution)
+                self._render_mesh = self._baked_warp
+
+    def contains(self: Self, position: tuple[int, int]) -> bool:
+        """Return True if a display position, bottom row first, is within the output."""
+        return (
+            self.viewport[0] <= position[0] < self.viewport[0] + self.viewport[2]
+            and self.viewport[1] <= position[1] < self.viewport[1] + self.viewport[3]
+        )
+
+    def relative_position(self: Self, position: tuple[int, int]) -> tuple[float, float]:
+        """Return a display position, bottom row first, relative to the output from (0, 0) bottom left to (1, 1) top right."""
+        x, y, width, height = self.viewport
+
+        return (position[0] - x) / width, (position[1] - y + 1) / height
+
+    def render(
+        self: Self,
+        tx_ref: int,
+        offset_coord: tuple[float, float],
+        show_points: bool,
+        invert_x: bool = False,
+        mouse_pos: tuple[float, float] | None = None,
+        transition: Transition | None = None,
+        brightness: float = 1.0,
+    ) -> tuple[tuple[float, float], tuple[int, int]] | None:
+        """Render the warp into the output viewport."""
+        GL.glViewport(*self.viewport)
+
+        return render_warp(
+            tx_ref,
+            self.resolution,
+            self._render_mesh,
+            offset_coord,
+            show_points,
+            invert_x,
+            mouse_pos,
+            transition,
+            self._control.points
+            if self._control and self._warp_num == Warp.CONTROL
+            else None,
+            brightness,
+        )
+
+    def release(self: Self) -> None:
+        """Release the warp meshes."""
+        self._mesh.release()
+        if self._shader_mesh:
+            self._shader_mesh.release()
+        if self._baked_warp:
+            self._baked_warp.release()
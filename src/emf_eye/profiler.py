@@ -0,0 +1,314 @@
+"""Frame timing profiler and overlay."""
+
+import csv
+import logging
+from collections import deque
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import TYPE_CHECKING, Self
+
+import numpy as np
+import pygame
+from OpenGL import GL
+
+if TYPE_CHECKING:
+    from .decoder import FrameStats
+
+log = logging.getLogger("profiler")
+
+
+STAGES = (
+    "controller",
+    "events",
+    "warp",
+    "texture",
+    "render",
+    "flip",
+    "scenes",
+    "wait",
+)
+GPU_STAGE = "render_gpu"
+INPUT_LATENCY = "input"
+PROFILE_FRAMES = 300
+GPU_QUERIES = 4
+OVERLAY_FONT_SIZE = 20
+OVERLAY_TEXT_TIME = 0.5
+OVERLAY_GRAPH_HEIGHT = 0.25
+OVERLAY_GRAPH_MS = 80.0
+OVERLAY_COLOURS = {
+    "frame": (1.0, 1.0, 1.0),
+    "texture": (0.0, 1.0, 1.0),
+    "render": (1.0, 1.0, 0.0),
+    GPU_STAGE: (1.0, 0.0, 1.0),
+}
+
+
+class Profiler:
+    """Record per-stage frame timings into a ring buffer."""
+
+    def __init__(self: Self, frames: int = PROFILE_FRAMES) -> None:
+        """
+        Construct the profiler.
+
+        Args:
+            frames (int, optional): Number of frames to keep. Defaults to PROFILE_FRAMES.
+
+        """
+        self._columns = [*STAGES, GPU_STAGE, INPUT_LATENCY, "frame"]
+        self._times = np.full((frames, len(self._columns)), np.nan)
+        self._frame_idx = -1
+        self._frame_count = 0
+        self._frame_start = None
+        self._mark_time = None
+
+        # GPU timer queries are read back a few frames later to avoid stalling
+        self._query_refs = None
+        self._queries_free = deque()
+        self._queries_pending = deque()
+        if bool(GL.glGenQueries):
+            self._query_refs = GL.glGenQueries(GPU_QUERIES)
+            self._queries_free.extend(self._query_refs)
+        self._query_active = None
+
+        self._font = None
+        self._text_tx_ref = None
+        self._text_size = None
+        self._text_time = 0.0
+        self._stats = None
+
+    def start_frame(self: Self) -> None:
+        """Start timing a new frame."""
+        time_now = timer()
+        if self._frame_start is not None:
+            self._times[self._frame_idx, -1] = time_now - self._frame_start
+
+        self._read_queries()
+
+        self._frame_idx = (self._frame_idx + 1) % len(self._times)
+        self._frame_count += 1
+        self._times[self._frame_idx] = np.nan
+        self._frame_start = self._mark_time = time_now
+
+    def mark(self: Self, stage: str) -> None:
+        """Record the time since the previous mark against a stage."""
+        time_now = timer()
+        self._times[self._frame_idx, self._columns.index(stage)] = (
+            time_now - self._mark_time
+        )
+        self._mark_time = time_now
+
+    def record(self: Self, column: str, seconds: float) -> None:
+        """Record a time that is not a stage of the frame, such as a latency."""
+        self._times[self._frame_idx, self._columns.index(column)] = seconds
+
+    def begin_gpu(self: Self) -> None:
+        """Start timing GPU work."""
+        if self._queries_free:
+            self._query_active = self._queries_free.popleft()
+            GL.glBeginQuery(GL.GL_TIME_ELAPSED, self._query_active)
+
+    def end_gpu(self: Self) -> None:
+        """Stop timing GPU work."""
+        if self._query_active is not None:
+            GL.glEndQuery(GL.GL_TIME_ELAPSED)
+            self._queries_pending.append((self._query_active, self._frame_idx))
+            self._query_active = None
+
+    def _read_queries(self: Self) -> None:
+        """Read back any GPU timer queries that have completed."""
+        while self._queries_pending:
+            query_ref, frame_idx = self._queries_pending[0]
+            if not GL.glGetQueryObjectiv(query_ref, GL.GL_QUERY_RESULT_AVAILABLE):
+                break
+
+            self._queries_pending.popleft()
+            self._queries_free.append(query_ref)
+
+            # 32 bits of nanoseconds is plenty for a frame
+            elapsed = GL.glGetQueryObjectuiv(query_ref, GL.GL_QUERY_RESULT)
+            self._times[frame_idx, self._columns.index(GPU_STAGE)] = elapsed / 1e9
+
+    def _ordered_times(self: Self) -> np.ndarray:
+        """Return the recorded frames, oldest first."""
+        frames = min(self._frame_count, len(self._times))
+        times = np.roll(self._times, -(self._frame_idx + 1), axis=0)
+
+        return times[len(times) - frames :]
+
+    def percentiles(self: Self) -> dict[str, tuple[float, float]]:
+        """Return the p50 and p99 times in milliseconds for each stage."""
+        times = self._ordered_times()
+        stats = {}
+        for idx, column in enumerate(self._columns):
+            values = times[:, idx]
+            values = values[~np.isnan(values)]
+            if len(values):
+                p50, p99 = np.percentile(values, [50, 99]) * 1000.0
+                stats[column] = (p50, p99)
+
+        return stats
+
+    def render(
+        self: Self,
+        display_resolution: tuple[int, int],
+        stats: "FrameStats | None" = None,
+    ) -> None:
+        """
+        Render the frame time graphs and percentiles over the display.
+
+        Args:
+            display_resolution (tuple[int, int]): Display size in pixels.
+            stats (FrameStats, optional): Video frame delivery counters to show. Defaults to None.
+
+        """
+        self._stats = stats
+
+        times = self._ordered_times() * 1000.0
+        if not len(times):
+            return
+
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+        GL.glLineWidth(1)
+
+        x = np.linspace(0.0, 1.0, len(self._times))[: len(times)]
+        for column, colour in OVERLAY_COLOURS.items():
+            values = times[:, self._columns.index(column)]
+            values = np.nan_to_num(values) / OVERLAY_GRAPH_MS * OVERLAY_GRAPH_HEIGHT
+            points = np.ascontiguousarray(np.stack([x, values], axis=-1), np.float32)
+
+            GL.glColor3f(*colour)
+            GL.glVertexPointer(2, GL.GL_FLOAT, 0, points)
+            GL.glDrawArrays(GL.GL_LINE_STRIP, 0, len(points))
+
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+        time_now = timer()
+        if time_now - self._text_time > OVERLAY_TEXT_TIME:
+            self._text_time = time_now
+            self._update_text()
+
+        self._render_text(display_resolution)
+
+    def _update_text(self: Self) -> None:
+        """Render the percentile table to a texture."""
+        if self._font is None:
+            pygame.font.init()
+            self._font = pygame.font.Font(None, OVERLAY_FONT_SIZE)
+            self._text_tx_ref = GL.glGenTextures(1)
+
+        lines = [
+            f"{column:>10} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms"
+            for column, (p50, p99) in self.percentiles().items()
+        ]
+        if self._stats:
+            lines.append(
+                f"{'video':>10} dropped {self._stats.dropped} "
+                f"repeated {self._stats.repeated} "
+                f"drift {self._stats.drift * 1000.0:6.2f} ms "
+                f"max {self._stats.drift_max * 1000.0:6.2f} ms",
+            )
+        line_height = self._font.get_linesize()
+        surface = pygame.Surface(
+            (max(self._font.size(line)[0] for line in lines), line_height * len(lines)),
+            pygame.SRCALPHA,
+        )
+        surface.fill((0, 0, 0, 160))
+        for idx, line in enumerate(lines):
+            surface.blit(
+                self._font.render(line, True, (255, 255, 255)),
+                (0, idx * line_height),
+            )
+
+        self._text_size = surface.get_size()
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._text_tx_ref)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 4)
+        GL.glTexImage2D(
+            GL.GL_TEXTURE_2D,
+            0,
+            GL.GL_RGBA,
+            *self._text_size,
+            0,
+            GL.GL_RGBA,
+            GL.GL_UNSIGNED_BYTE,
+            pygame.image.tobytes(surface, "RGBA", True),
+        )
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    def _render_text(self: Self, display_resolution: tuple[int, int]) -> None:
+        """Draw the percentile table in the top left corner."""
+        if self._text_size is None:
+            return
+
+        w = self._text_size[0] / display_resolution[0]
+        h = self._text_size[1] / display_resolution[1]
+
+        GL.glEnable(GL.GL_BLEND)
+        GL.glBlendFunc(GL.GL_SRC_ALPHA, GL.GL_ONE_MINUS_SRC_ALPHA)
+        GL.glEnable(GL.GL_TEXTURE_2D)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._text_tx_ref)
+        GL.glColor3f(1.0, 1.0, 1.0)
+
+        GL.glBegin(GL.GL_QUADS)
+        GL.glTexCoord2f(0.0, 0.0)
+        GL.glVertex2f(0.0, 1.0 - h)
+        GL.glTexCoord2f(1.0, 0.0)
+        GL.glVertex2f(w, 1.0 - h)
+        GL.glTexCoord2f(1.0, 1.0)
+        GL.glVertex2f(w, 1.0)
+        GL.glTexCoord2f(0.0, 1.0)
+        GL.glVertex2f(0.0, 1.0)
+        GL.glEnd()
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glDisable(GL.GL_TEXTURE_2D)
+        GL.glDisable(GL.GL_BLEND)
+
+    def save_csv(self: Self, path: Path) -> None:
+        """Save the recorded frame times in milliseconds."""
+        with open(path, "w", newline="") as file_object:
+            writer = csv.writer(file_object)
+            writer.writerow(self._columns)
+            for row in self._ordered_times() * 1000.0:
+                writer.writerow(
+                    ["" if np.isnan(value) else f"{value:.3f}" for value in row],
+                )
+
+        log.info("frame timings saved to %s", path)
+
+    def release(self: Self) -> None:
+        """Release the GL resources."""
+        if self._query_refs is not None:
+            GL.glDeleteQueries(len(self._query_refs), self._query_refs)
+        self._query_refs = None
+
+        if self._text_tx_ref:
+            GL.glDeleteTextures([self._text_tx_ref])
+        self._text_tx_ref = None
+
+
+class StartupTimer:
+    """Time the stages of starting up, until the first frame is shown."""
+
+    def __init__(self: Self) -> None:
+        """Start timing."""
+        self._time_start = timer()
+        self._mark_time = self._time_start
+        self._stages = []
+
+    def mark(self: Self, stage: str) -> None:
+        """Record the time since the last stage finished."""
+        time_now = timer()
+        self._stages.append((stage, time_now - self._mark_time))
+        self._mark_time = time_now
+
+    def log(self: Self) -> None:
+        """Log the stage times."""
+        log.info(
+            "startup %.0fms: %s",
+            (self._mark_time - self._time_start) * 1000.0,
+            ", ".join(
+                f"{stage} {seconds * 1000.0:.0f}ms" for stage, seconds in self._stages
+            ),
+        )
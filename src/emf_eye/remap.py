@@ -0,0 +1,397 @@
+"""Warps baked into per-pixel texture coordinate lookup tables."""
+
+import ctypes
+import hashlib
+import io
+import json
+import logging
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+from OpenGL import GL
+
+from .controller import Controller, KnobSet
+from .defaults import BackgroundWriter, atomic_write
+from .mesh import ATTRIBUTE_LOCATIONS, WarpMesh
+from .shader import Shader
+
+log = logging.getLogger("remap")
+
+
+REMAP_PATH_DEFAULT = "warp_cache"
+REMAP_OUTSIDE = -1.0
+# unit 1 is left free for a second video
+REMAP_TEXTURE_UNIT = 2
+# two 32 bit floats per pixel
+REMAP_PIXEL_SIZE = 8
+
+BAKE_FRAGMENT_SHADER = """
+#version 120
+
+varying vec2 frag_tex_coord;
+
+void main() {
+    gl_FragColor = vec4(frag_tex_coord, 0.0, 1.0);
+}
+"""
+
+VERTEX_SHADER = """
+#version 120
+
+attribute vec2 position;
+
+varying vec2 frag_position;
+
+void main() {
+    frag_position = position;
+    gl_Position = vec4((position * 2.0) - 1.0, 0.0, 1.0);
+}
+"""
+
+FRAGMENT_SHADER = f"""
+#version 120
+
+uniform sampler2D video;
+uniform sampler2D remap;
+uniform vec2 offset;
+uniform bool invert_x;
+
+varying vec2 frag_position;
+
+// the BLEND hook mixes in a second video
+#ifndef BLEND
+vec4 blend(sampler2D video, vec2 coord) {{
+    return texture2D(video, coord);
+}}
+#endif
+
+void main() {{
+    vec2 coord = texture2D(remap, frag_position).xy;
+    if (coord.x == {REMAP_OUTSIDE:.1f}) {{
+        discard;
+    }}
+
+    if (invert_x) {{
+        coord.x = 1.0 - coord.x;
+    }}
+
+    // the baked coordinates are already flipped vertically
+    coord.x += offset.x;
+    coord.y -= offset.y;
+
+    gl_FragColor = blend(video, coord);
+}}
+"""
+
+
+def remap_path(
+    warp_num: int,
+    display_resolution: tuple[int, int],
+    controller: Controller | KnobSet,
+    mesh: WarpMesh,
+    path: Path | None = None,
+    control_points: np.ndarray | None = None,
+) -> Path:
+    """Return the cache file path for a warp, keyed by everything that changes it, including the control points of a CONTROL warp."""
+    if path is None:
+        path = Path(REMAP_PATH_DEFAULT)
+
+    key_data = {
+        "warp": int(warp_num),
+        "knobs": controller.knobs,
+        "grid": mesh.grid_size,
+        "resolution": display_resolution,
+    }
+    if control_points is not None:
+        key_data["points"] = control_points.tolist()
+    key = json.dumps(key_data)
+    digest = hashlib.sha1(key.encode(), usedforsecurity=False).hexdigest()
+
+    return path / f"warp-{digest}.npy"
+
+
+def bake_remap(
+    mesh: WarpMesh,
+    display_resolution: tuple[int, int],
+    tx_ref: int,
+) -> int:
+    """
+    Render the texture coordinates of a warp mesh for every display pixel, starting to read them back.
+
+    Args:
+        mesh (WarpMesh): Mesh to bake.
+        display_resolution (tuple[int, int]): Size of the table.
+        tx_ref (int): RG32F texture of the display resolution to render into.
+
+    Returns:
+        int: Pixel buffer the table is read into, ready for read_remap once the GPU has finished.
+
+    """
+    shader = Shader(mesh.vertex_source, BAKE_FRAGMENT_SHADER, ATTRIBUTE_LOCATIONS)
+
+    fbo_ref_previous = GL.glGetIntegerv(GL.GL_FRAMEBUFFER_BINDING)
+    fbo_ref = GL.glGenFramebuffers(1)
+    GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, fbo_ref)
+    GL.glFramebufferTexture2D(
+        GL.GL_FRAMEBUFFER,
+        GL.GL_COLOR_ATTACHMENT0,
+        GL.GL_TEXTURE_2D,
+        tx_ref,
+        0,
+    )
+
+    viewport = GL.glGetIntegerv(GL.GL_VIEWPORT)
+    GL.glViewport(0, 0, *display_resolution)
+    GL.glClearColor(REMAP_OUTSIDE, REMAP_OUTSIDE, 0.0, 0.0)
+    GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+
+    mesh.draw(0, (0.0, 0.0), shader=shader)
+
+    # read into a pixel buffer so the render thread does not wait for the GPU to finish
+    pbo_ref = GL.glGenBuffers(1)
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo_ref)
+    GL.glBufferData(
+        GL.GL_PIXEL_PACK_BUFFER,
+        display_resolution[0] * display_resolution[1] * REMAP_PIXEL_SIZE,
+        None,
+        GL.GL_STREAM_READ,
+    )
+    GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 4)
+    # an offset into the pixel buffer rather than an array
+    GL.glReadPixels(0, 0, *display_resolution, GL.GL_RG, GL.GL_FLOAT, 0)
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+
+    GL.glClearColor(0.0, 0.0, 0.0, 0.0)
+    GL.glViewport(*viewport)
+    GL.glBindFramebuffer(GL.GL_FRAMEBUFFER, fbo_ref_previous)
+    GL.glDeleteFramebuffers(1, [fbo_ref])
+    shader.release()
+
+    return pbo_ref
+
+
+def read_remap(pbo_ref: int, display_resolution: tuple[int, int]) -> np.ndarray:
+    """Copy a table read back by bake_remap out of its pixel buffer, releasing the buffer."""
+    tx_w, tx_h = display_resolution
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, pbo_ref)
+    pointer = GL.glMapBufferRange(
+        GL.GL_PIXEL_PACK_BUFFER,
+        0,
+        tx_w * tx_h * REMAP_PIXEL_SIZE,
+        GL.GL_MAP_READ_BIT,
+    )
+    # rows are kept bottom first as read, ready to upload again
+    remap = np.ctypeslib.as_array(
+        ctypes.cast(pointer, ctypes.POINTER(ctypes.c_float)),
+        (tx_h, tx_w, 2),
+    ).copy()
+    GL.glUnmapBuffer(GL.GL_PIXEL_PACK_BUFFER)
+    GL.glBindBuffer(GL.GL_PIXEL_PACK_BUFFER, 0)
+    GL.glDeleteBuffers(1, [pbo_ref])
+
+    return remap
+
+
+def save_remap(path: Path, remap: np.ndarray) -> None:
+    """Save a remap table, replacing the file atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    buffer = io.BytesIO()
+    np.save(buffer, remap)
+    atomic_write(path, buffer.getvalue())
+
+
+def load_remap(path: Path) -> np.ndarray | None:
+    """Memory map a remap table if it has been baked."""
+    try:
+        return np.load(path, mmap_mode="r")
+
+    except FileNotFoundError:
+        return None
+
+
+class BakedWarp:
+    """Warp rendered from a baked remap table with a single quad."""
+
+    def __init__(self: Self, writer: BackgroundWriter | None = None) -> None:
+        """
+        Create the shader and quad buffer.
+
+        Args:
+            writer (BackgroundWriter, optional): Writer to save baked tables with. Defaults to None, saving on the render thread.
+
+        """
+        self.vertex_source = VERTEX_SHADER
+        self.fragment_source = FRAGMENT_SHADER
+        self._shader = Shader(VERTEX_SHADER, FRAGMENT_SHADER, ATTRIBUTE_LOCATIONS)
+
+        quad = np.array(
+            [[0.0, 0.0], [1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+            np.float32,
+        )
+
+        self._vao_ref = GL.glGenVertexArrays(1)
+        self._vbo_ref = GL.glGenBuffers(1)
+        GL.glBindVertexArray(self._vao_ref)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, self._vbo_ref)
+        GL.glBufferData(GL.GL_ARRAY_BUFFER, quad.nbytes, quad, GL.GL_STATIC_DRAW)
+        location = ATTRIBUTE_LOCATIONS["position"]
+        GL.glEnableVertexAttribArray(location)
+        GL.glVertexAttribPointer(
+            location,
+            2,
+            GL.GL_FLOAT,
+            GL.GL_FALSE,
+            0,
+            ctypes.c_void_p(0),
+        )
+        GL.glBindVertexArray(0)
+        GL.glBindBuffer(GL.GL_ARRAY_BUFFER, 0)
+
+        self._remap_tx_ref = GL.glGenTextures(1)
+        self._mesh = None
+
+        self._writer = writer
+        # the table being read back, saved on a later frame
+        self._bake_pending: tuple[int, Path, tuple[int, int]] | None = None
+
+    @property
+    def coord_array(self: Self) -> np.ndarray | None:
+        """Return the warp coordinates of the mesh that was baked."""
+        return self._mesh.coord_array if self._mesh else None
+
+    def load(self: Self, path: Path, mesh: WarpMesh) -> bool:
+        """
+        Load the remap table for a warp mesh.
+
+        Args:
+            path (Path): Path to the remap table.
+            mesh (WarpMesh): Mesh the table was baked from.
+
+        Returns:
+            bool: True if the table was loaded, False if it has not been baked.
+
+        """
+        remap = load_remap(path)
+        if remap is None:
+            self._mesh = None
+            return False
+
+        log.debug("load %s", path)
+        self._upload(remap)
+        self._mesh = mesh
+
+        return True
+
+    def bake(
+        self: Self,
+        path: Path,
+        mesh: WarpMesh,
+        display_resolution: tuple[int, int],
+    ) -> None:
+        """Bake the remap table for a warp mesh into the lookup texture, saving it once read back by update."""
+        log.info("bake %s", path)
+        self.update()
+
+        self._allocate(display_resolution)
+        pbo_ref = bake_remap(mesh, display_resolution, self._remap_tx_ref)
+        self._bake_pending = (pbo_ref, path, display_resolution)
+        self._mesh = mesh
+
+    def update(self: Self) -> None:
+        """Save the table baked on an earlier frame, once per frame so the read back has finished."""
+        if self._bake_pending is None:
+            return
+
+        pbo_ref, path, display_resolution = self._bake_pending
+        self._bake_pending = None
+        remap = read_remap(pbo_ref, display_resolution)
+        if self._writer:
+            self._writer.submit(save_remap, path, remap)
+
+        else:
+            save_remap(path, remap)
+
+    def _upload(self: Self, remap: np.ndarray) -> None:
+        """Upload a remap table to the lookup texture."""
+        tx_h, tx_w, _ = remap.shape
+        self._allocate((tx_w, tx_h), np.ascontiguousarray(remap))
+
+    def _allocate(
+        self: Self,
+        resolution: tuple[int, int],
+        remap: np.ndarray | None = None,
+    ) -> None:
+        """Size the lookup texture, with a table to upload or None to leave it for baking into."""
+        tx_w, tx_h = resolution
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._remap_tx_ref)
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 4)
+        GL.glTexImage2D(
+            GL.GL_TEXTURE_2D,
+            0,
+            GL.GL_RG32F,
+            tx_w,
+            tx_h,
+            0,
+            GL.GL_RG,
+            GL.GL_FLOAT,
+            remap,
+        )
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_NEAREST)
+        GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_NEAREST)
+        GL.glTexParameteri(
+            GL.GL_TEXTURE_2D,
+            GL.GL_TEXTURE_WRAP_S,
+            GL.GL_CLAMP_TO_EDGE,
+        )
+        GL.glTexParameteri(
+            GL.GL_TEXTURE_2D,
+            GL.GL_TEXTURE_WRAP_T,
+            GL.GL_CLAMP_TO_EDGE,
+        )
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    def draw(
+        self: Self,
+        tx_ref: int,
+        offset_coord: tuple[float, float],
+        invert_x: bool = False,
+        shader: Shader | None = None,
+    ) -> None:
+        """Draw the warp textured with the video."""
+        shader = shader or self._shader
+        shader.use()
+        GL.glUniform2f(shader.uniform("offset"), *offset_coord)
+        GL.glUniform1i(shader.uniform("invert_x"), invert_x)
+        GL.glUniform1i(shader.uniform("video"), 0)
+        GL.glUniform1i(shader.uniform("remap"), REMAP_TEXTURE_UNIT)
+
+        GL.glActiveTexture(GL.GL_TEXTURE0 + REMAP_TEXTURE_UNIT)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._remap_tx_ref)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
+
+        GL.glBindVertexArray(self._vao_ref)
+        GL.glDrawArrays(GL.GL_TRIANGLE_STRIP, 0, 4)
+        GL.glBindVertexArray(0)
+
+        GL.glActiveTexture(GL.GL_TEXTURE0 + REMAP_TEXTURE_UNIT)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glUseProgram(0)
+
+    def release(self: Self) -> None:
+        """Release the shader, buffers and lookup texture."""
+        if self._bake_pending:
+            GL.glDeleteBuffers(1, [self._bake_pending[0]])
+            self._bake_pending = None
+
+        if self._vao_ref:
+            GL.glDeleteVertexArrays(1, [self._vao_ref])
+            GL.glDeleteBuffers(1, [self._vbo_ref])
+            GL.glDeleteTextures([self._remap_tx_ref])
+        self._vao_ref = None
+
+        self._shader.release()
@@ -0,0 +1,361 @@
+"""EMF eye offscreen renderer."""
+
+import os
+
+# offscreen EGL rendering has to be selected before PyOpenGL is first imported
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+# lets Mesa render without X11 or Wayland
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+import argparse
+import logging
+import shlex
+import subprocess
+import sys
+from pathlib import Path
+from timeit import default_timer as timer
+from typing import Self
+
+import cv2
+import numpy as np
+from OpenGL import GL
+
+from .control import load_control_points
+from .controller import Controller
+from .decoder import DECODER_DEFAULT, DECODERS
+from .exceptions import ScriptError
+from .offscreen import OffscreenContext, parse_resolution
+from .output import Output
+from .scene import PATH_DEFAULT, Scene
+from .warp import WARP_PARAMETER_STEPS, Warp
+
+log = logging.getLogger()
+log_handler = logging.StreamHandler()
+log.addHandler(log_handler)
+
+
+RESOLUTION_DEFAULT = (1920, 1080)
+FPS_DEFAULT = 25
+DURATION_DEFAULT = 10.0
+# the warp the renderer starts with
+WARP_DEFAULT = next(iter(Warp)).name.lower()
+
+
+class VirtualClock:
+    """Clock advanced a frame at a time, so each frame takes as long as it needs to render."""
+
+    def __init__(self: Self) -> None:
+        """Start the clock at zero."""
+        self._time = 0.0
+
+    def __call__(self: Self) -> float:
+        """Return the current time in seconds."""
+        return self._time
+
+    def advance(self: Self, seconds: float) -> None:
+        """Move the clock on."""
+        self._time += seconds
+
+
+class FrameWriter:
+    """Write rendered frames to an image sequence or the standard input of an encoder."""
+
+    def __init__(
+        self: Self,
+        output: str | None,
+        pipe: str | None,
+        resolution: tuple[int, int],
+        fps: float,
+    ) -> None:
+        """
+        Open the output.
+
+        Args:
+            output (str): Image sequence path with a frame number format, such as frames/%05d.png, or None.
+            pipe (str): Encoder command reading raw BGR frames from standard input, or None.
+            resolution (tuple[int, int]): Frame width and height.
+            fps (float): Frame rate.
+
+        Raises:
+            ScriptError: If the image sequence path has no frame number format.
+
+        """
+        self._output = output
+        self._process = None
+        self._frames = 0
+
+        if pipe:
+            # the command is told the frame format it is sent
+            command = pipe.format(width=resolution[0], height=resolution[1], fps=fps)
+            log.info("piping frames to %s", command)
+            self._process = subprocess.Popen(
+                shlex.split(command),
+                stdin=subprocess.PIPE,
+            )
+
+        elif output:
+            try:
+                path = Path(output % 0)
+
+            except TypeError as e:
+                raise ScriptError(f"no frame number format in {output}") from e
+
+            path.parent.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def frames(self: Self) -> int:
+        """Return the number of frames written."""
+        return self._frames
+
+    def write(self: Self, image: np.ndarray) -> None:
+        """
+        Write a frame.
+
+        Raises:
+            ScriptError: If the frame cannot be written.
+
+        """
+        if self._process:
+            try:
+                self._process.stdin.write(image.data)
+
+            except BrokenPipeError as e:
+                raise ScriptError("the encoder exited early") from e
+
+        elif self._output:
+            path = self._output % self._frames
+            if not cv2.imwrite(path, image):
+                raise ScriptError(f"unable to write {path}")
+
+        self._frames += 1
+
+    def close(self: Self) -> None:
+        """
+        Close the output, waiting for the encoder to finish.
+
+        Raises:
+            ScriptError: If the encoder fails.
+
+        """
+        if self._process:
+            self._process.stdin.close()
+            returncode = self._process.wait()
+            self._process = None
+            if returncode:
+                raise ScriptError(f"the encoder exited with {returncode}")
+
+
+def run() -> None:
+    """CLI entry function."""
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "-p",
+        "--path",
+        type=Path,
+        default=Path(PATH_DEFAULT),
+        help="scenes directory",
+    )
+    parser.add_argument(
+        "-s",
+        "--scene",
+        nargs="+",
+        metavar="NAME",
+        help="scenes to render in order, otherwise all of them",
+    )
+    parser.add_argument(
+        "-r",
+        "--resolution",
+        type=parse_resolution,
+        default=RESOLUTION_DEFAULT,
+        help="output resolution as WIDTHxHEIGHT, 720p, 1080p or 4k",
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=FPS_DEFAULT,
+        help="output frame rate",
+    )
+    parser.add_argument(
+        "-t",
+        "--duration",
+        type=float,
+        default=DURATION_DEFAULT,
+        metavar="SECONDS",
+        help="time to render each scene for",
+    )
+    output_group = parser.add_mutually_exclusive_group()
+    output_group.add_argument(
+        "-o",
+        "--output",
+        metavar="PATH",
+        help="write an image sequence to a path with a frame number format, such as frames/%%05d.png",
+    )
+    output_group.add_argument(
+        "--pipe",
+        metavar="COMMAND",
+        help="pipe raw BGR frames to an encoder command, where {width}, {height} and {fps} are replaced",
+    )
+    parser.add_argument(
+        "-i",
+        "--invert",
+        action="store_true",
+        help="invert horizontal coordinates",
+    )
+    parser.add_argument(
+        "--decoder",
+        choices=DECODERS,
+        default=DECODER_DEFAULT,
+        help="video decoder for scenes that do not choose one",
+    )
+    parser.add_argument(
+        "--no-frame-cache",
+        dest="frame_cache",
+        action="store_false",
+        help="decode scene videos even if emf-eye-cache has transcoded them",
+    )
+    parser.add_argument(
+        "-w",
+        "--warp",
+        choices=[warp.name.lower() for warp in Warp],
+        default=WARP_DEFAULT,
+        help="warp to render through, the saved parameters, the saved control points or none",
+    )
+    parser.add_argument(
+        "--output-index",
+        type=int,
+        default=0,
+        metavar="INDEX",
+        help="output of the renderer whose saved knobs and control points are used",
+    )
+    parser.add_argument(
+        "--warp-steps",
+        type=int,
+        default=WARP_PARAMETER_STEPS,
+        metavar="STEPS",
+        help="number of warp grid steps per axis",
+    )
+    parser.add_argument(
+        "-g",
+        "--gpu-warp",
+        action="store_true",
+        help="calculate the parameter warp on the GPU",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="log the output and each scene as it is rendered",
+    )
+    args = parser.parse_args()
+
+    if args.output_index < 0:
+        parser.error("the output index cannot be negative")
+
+    log.setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    # the saved warp parameters without the hardware
+    outputs = args.output_index + 1
+    controller = Controller(hardware=False, watch=False, outputs=outputs)
+
+    clock = VirtualClock()
+    scenes = Scene.load_scenes(
+        args.path,
+        {"decoder": args.decoder},
+        args.frame_cache,
+        clock,
+    )
+    if args.scene:
+        scenes_by_name = {scene.path.name: scene for scene in scenes}
+        try:
+            scenes = [scenes_by_name[name] for name in args.scene]
+
+        except KeyError as e:
+            log.error("unknown scene %s", e.args[0])
+            sys.exit(1)
+
+    context = OffscreenContext(args.resolution)
+    log.info("rendering with %s", context.renderer)
+
+    # orthographic projection - (0, 0) bottom left, (1, 1) top right
+    GL.glMatrixMode(GL.GL_PROJECTION)
+    GL.glLoadIdentity()
+
+    GL.glOrtho(0.0, 1.0, 0.0, 1.0, -1.0, 1.0)
+
+    GL.glMatrixMode(GL.GL_MODELVIEW)
+    GL.glLoadIdentity()
+
+    # warped the same way as the output on the display, filling the frame
+    output = Output(
+        (0, 0, *args.resolution),
+        controller.output(args.output_index),
+        args.warp_steps,
+        args.gpu_warp,
+        control_points=load_control_points(outputs)[args.output_index],
+    )
+    output.update_warp(Warp[args.warp.upper()])
+
+    frame_time = 1.0 / args.fps
+    scene_frames = round(args.duration * args.fps)
+    writer = None
+    time_start = timer()
+    try:
+        writer = FrameWriter(args.output, args.pipe, args.resolution, args.fps)
+        read_back = args.output or args.pipe
+
+        for scene in scenes:
+            log.info("rendering %s", scene.path.name)
+            scene.start()
+
+            for _ in range(scene_frames):
+                GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+
+                tx_ref = scene.update_texture()
+                tx_x, tx_y = scene.update_position()
+                output.render(
+                    tx_ref,
+                    (tx_x, tx_y),
+                    False,
+                    args.invert,
+                    brightness=scene.update_tracks()["brightness"],
+                )
+
+                if read_back:
+                    # the frame read back is the one before, keeping the GPU busy
+                    image = context.read_pixels_deferred()
+                    if image is not None:
+                        writer.write(image)
+
+                else:
+                    GL.glFinish()
+
+                clock.advance(frame_time)
+
+            scene.stop()
+
+        if read_back:
+            image = context.finish_read()
+            if image is not None:
+                writer.write(image)
+
+        writer.close()
+
+    except ScriptError as e:
+        log.error(e)
+        sys.exit(1)
+
+    finally:
+        for scene in scenes:
+            scene.stop()
+        output.release()
+        context.release()
+
+    time_total = timer() - time_start
+    frames = scene_frames * len(scenes)
+    print(
+        f"rendered {frames} frames in {time_total:.1f}s, "
+        f"{frames / time_total if time_total else 0.0:.1f} fps",
+    )
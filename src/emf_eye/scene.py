@@ -2,163 +2,398 @@
 
 import json
 import logging
+import threading
+from collections.abc import Callable
 from pathlib import Path
 from timeit import default_timer as timer
 from typing import Self
 
+from .decoder import DECODER_DEFAULT, DECODERS, FrameStats, cached_video
+from .defaults import atomic_write
+from .exceptions import ScriptError
 from .texture import Texture
+from .timeline import (
+    EASINGS,
+    MOVE_PATH_DEFAULT,
+    MOVE_PATHS,
+    TRACKS,
+    Timeline,
+    Tracks,
+    load_tracks,
+)
+from .transition import TRANSITION_DEFAULT, TRANSITION_TIME_DEFAULT, TRANSITIONS
 
 log = logging.getLogger("scene")
 
 
 PATH_DEFAULT = "resources/scenes"
 SCENE_DEFAULT = "default"
+SCENE_FILE_NAME = "scene.json"
+INDEX_SUFFIX = ".index.json"
+
+
+class SceneIndex:
+    """Scene directories and definitions, cached between runs so startup does not read every scene."""
+
+    def __init__(self: Self, path: Path) -> None:
+        """
+        Read the index of a scenes directory, listing the directory again if it has changed.
+
+        Args:
+            path (Path): Path to the scenes directory.
+
+        """
+        self._path = path
+        # beside the directory, as writing inside it would change its modification time
+        resolved_path = path.resolve()
+        self._index_path = resolved_path.with_name(resolved_path.name + INDEX_SUFFIX)
+        self._lock = threading.Lock()
+
+        try:
+            with open(self._index_path) as file_object:
+                self._index = json.load(file_object)
+
+        except (OSError, ValueError):
+            self._index = {}
+
+        # adding, removing or renaming a scene changes the directory modification time
+        mtime = path.stat().st_mtime_ns
+        if self._index.get("mtime") != mtime:
+            log.debug("index %s", path)
+            self._index = {
+                "mtime": mtime,
+                "names": sorted(
+                    d.name
+                    for d in path.iterdir()
+                    if d.is_dir() and not d.name.endswith(".disabled")
+                ),
+                "scenes": {},
+            }
+            self._save()
+
+    @property
+    def names(self: Self) -> list[str]:
+        """Return the scene directory names in order."""
+        return self._index["names"]
+
+    def definitions(self: Self, name: str) -> dict | None:
+        """Return the validated definitions of a scene if its scene file is unchanged."""
+        entry = self._index["scenes"].get(name)
+        if entry is None:
+            return None
+
+        stat = (self._path / name / SCENE_FILE_NAME).stat()
+        if entry["stat"] != [stat.st_mtime_ns, stat.st_size]:
+            return None
+
+        return entry["data"]
+
+    def store(self: Self, name: str, data: dict) -> None:
+        """Cache the validated definitions of a scene."""
+        stat = (self._path / name / SCENE_FILE_NAME).stat()
+        with self._lock:
+            self._index["scenes"][name] = {
+                "stat": [stat.st_mtime_ns, stat.st_size],
+                "data": data,
+            }
+            self._save()
+
+    def _save(self: Self) -> None:
+        """Write the index, which is only a cache so a read only directory is not an error."""
+        try:
+            # replace the index whole so a power cut cannot leave it half written
+            atomic_write(self._index_path, json.dumps(self._index).encode())
+
+        except OSError as e:
+            log.debug("unable to save %s: %s", self._index_path, e)
 
 
 class Scene:
     """Scene class."""
 
-    def __init__(self: Self, path: Path) -> None:
+    def __init__(
+        self: Self,
+        path: Path,
+        texture_options: dict | None = None,
+        frame_cache: bool = True,
+        time_source: Callable[[], float] = timer,
+        index: SceneIndex | None = None,
+    ) -> None:
         """
-        Construct the scene, loading the scene definitions from the path.
+        Construct the scene, leaving the scene definitions to be read when first used.
 
         Args:
             path (Path): Path to the scene directory.
+            texture_options (dict, optional): Keyword arguments for the scene textures. Defaults to None.
+            frame_cache (bool, optional): Play videos from their frame cache if it is current. Defaults to True.
+            time_source (Callable[[], float], optional): Clock the video is played by, and the moves if the video has no frame rate. Defaults to timer.
+            index (SceneIndex, optional): Cache of the validated scene definitions. Defaults to None.
 
         """
         self._path = path
+        self._texture_options = texture_options or {}
+        self._frame_cache = frame_cache
+        self._time_source = time_source
+        self._index = index
 
         self._name = None
 
         self._texture = None
 
-        self._moves = None
-        self._move_idx = 0
-        self._move_start_x = 0.0
-        self._move_start_y = 0.0
-        self._move_start_time = None
-        self._move_end_x = 0.0
-        self._move_end_y = 0.0
-        self._move_end_time = None
+        # compiled once per scene definition, then kept while the scene is stopped
+        self._timelines: dict[str, Timeline] = {}
+        self._timeline = None
+        self._start_time = None
+        self._tracks_cache: dict[str, Tracks] = {}
+        self._tracks = None
 
-        with open(path / "scene.json") as file_object:
-            self._data = json.load(file_object)
+        self._data = None
 
-        self.validate()
+    @property
+    def data(self: Self) -> dict:
+        """
+        Return the scene definitions, reading and validating them on first use.
+
+        Raises:
+            ScriptError: If the scene definitions cannot be read or are invalid.
 
-    def validate(self: Self) -> None:
         """
-        Validate the loaded scene definitions.
+        if self._data is None:
+            name = self._path.name
+            try:
+                data = self._index.definitions(name) if self._index else None
+                if data is None:
+                    with open(self._path / SCENE_FILE_NAME) as file_object:
+                        data = json.load(file_object)
+
+                    self.validate(data)
+
+                    if self._index:
+                        self._index.store(name, data)
+
+            except (OSError, ValueError) as e:
+                log.error("invalid scene %s", self._path)
+                raise ScriptError(f"invalid scene {self._path}") from e
+
+            self._data = data
+
+        return self._data
+
+    def validate(self: Self, scene_data: dict) -> None:
+        """
+        Validate scene definitions.
+
+        Args:
+            scene_data (dict): Scene definitions read from the scene file.
 
         Raises:
-            FileNotFoundError: If a scene video file is not found.
+            FileNotFoundError: If a scene video or tracks file is not found.
+            ValueError: If a scene decoder, transition, move or track is invalid.
 
         """
-        for data in self._data.values():
-            for file_key in ["video"]:
+        for data in scene_data.values():
+            for file_key in ["video", "tracks"]:
                 if file_key in data:
                     file_path = self._path / data[file_key]
                     if not file_path.exists():
                         log.error("file not found %s", file_path)
                         raise FileNotFoundError(file_path)
 
+            if data.get("decoder", DECODER_DEFAULT) not in DECODERS:
+                log.error("unknown decoder %s", data["decoder"])
+                raise ValueError(data["decoder"])
+
+            transition = data.get("transition", {}).get("type", TRANSITION_DEFAULT)
+            if transition not in TRANSITIONS:
+                log.error("unknown transition %s", transition)
+                raise ValueError(transition)
+
+            for move in data.get("moves", []):
+                if (
+                    len(move) not in (3, 4)
+                    or move[2] < 0
+                    or (len(move) == 4 and move[3] not in EASINGS)
+                ):
+                    log.error("invalid move %s", move)
+                    raise ValueError(move)
+
+            if data.get("move_path", MOVE_PATH_DEFAULT) not in MOVE_PATHS:
+                log.error("unknown move path %s", data["move_path"])
+                raise ValueError(data["move_path"])
+
+            if "tracks" in data:
+                load_tracks(self._path / data["tracks"])
+
     def __repr__(self: Self) -> str:
         """Return a string representation of the object."""
         return f"<scene.Scene {self._path}>"
 
+    @property
+    def path(self: Self) -> Path:
+        """Return the scene directory."""
+        return self._path
+
+    @property
+    def videos(self: Self) -> list[Path]:
+        """Return the paths of the scene videos."""
+        return [
+            self._path / data["video"] for data in self.data.values() if "video" in data
+        ]
+
     @property
     def fps(self: Self) -> float | None:
         """Return the video file FPS."""
         return self._texture.fps if self._texture else None
 
+    @property
+    def stats(self: Self) -> FrameStats | None:
+        """Return the video frame delivery counters."""
+        return self._texture.stats if self._texture else None
+
+    @property
+    def transition(self: Self) -> tuple[str, float]:
+        """Return the transition type and time used when switching to the scene."""
+        data = self.data[self._name or SCENE_DEFAULT].get("transition", {})
+
+        return (
+            data.get("type", TRANSITION_DEFAULT),
+            data.get("time", TRANSITION_TIME_DEFAULT),
+        )
+
+    def decode_texture(self: Self) -> None:
+        """Decode the next video frame ready for the texture update."""
+        self._texture.decode()
+
     def update_texture(self: Self) -> int | None:
         """Update the video playback."""
         return self._texture.update()
 
+    def _scene_time(self: Self) -> float:
+        """Return the presentation time of the video frame shown, or the time since the scene started without a video frame rate."""
+        # keyed to the video, so the eye stays on the frame however slow decoding runs
+        video_time = self._texture.video_time if self._texture else None
+        if video_time is not None:
+            return video_time
+
+        return self._time_source() - self._start_time
+
     def update_position(self: Self) -> tuple[float, float]:
-        """Return the interpolated movement coordinates."""
-        if not self._moves:
+        """Return the movement coordinates for the video frame shown."""
+        if not self._timeline:
             return 0.0, 0.0
 
-        move_now = timer() - self._move_start_time
-        move_ratio = move_now / self._move_end_time
-        if move_ratio > 1.0:
-            tx_x = self._move_end_x
-            tx_y = self._move_end_y
-            self._next_move()
+        # looked up from the scene time, so a slow frame cannot put the eye behind
+        return self._timeline.position(self._scene_time())
 
-        else:
-            tx_x = (
-                (self._move_end_x - self._move_start_x) * move_ratio
-            ) + self._move_start_x
-            tx_y = (
-                (self._move_end_y - self._move_start_y) * move_ratio
-            ) + self._move_start_y
+    def update_tracks(self: Self) -> dict[str, float]:
+        """Return the metadata track values for the video frame shown."""
+        if not self._tracks:
+            return TRACKS
 
-        return tx_x, tx_y
+        return self._tracks.values(self._scene_time())
 
     @staticmethod
-    def load_scenes(path: Path | None = None) -> list["Scene"]:
-        """Load all the scenes in a directory."""
+    def load_scenes(
+        path: Path | None = None,
+        texture_options: dict | None = None,
+        frame_cache: bool = True,
+        time_source: Callable[[], float] = timer,
+    ) -> list["Scene"]:
+        """Load the scenes in a directory, which are read and validated when first used."""
         if path is None:
             path = Path(PATH_DEFAULT)
 
-        scenes = []
-        for scene_path in sorted(
-            [
-                d
-                for d in path.iterdir()
-                if d.is_dir() and not str(d).endswith(".disabled")
-            ],
-        ):
-            try:
-                scenes.append(Scene(scene_path))
-
-            except FileNotFoundError:
-                log.error("invalid scene %s", scene_path)
+        index = SceneIndex(path)
+        scenes = [
+            Scene(path / name, texture_options, frame_cache, time_source, index)
+            for name in index.names
+        ]
 
         log.debug(scenes)
 
         return scenes
 
-    def _next_move(self: Self) -> None:
-        """Load the next move step."""
-        self._move_start_x = self._move_end_x
-        self._move_start_y = self._move_end_y
+    @property
+    def prepared(self: Self) -> bool:
+        """Return True if the scene video is open."""
+        return self._texture is not None
 
-        move_idx = self._move_idx + 1
-        if move_idx == len(self._moves):
-            move_idx = 0
+    @property
+    def memory(self: Self) -> int:
+        """Estimate the bytes held by the scene video."""
+        return self._texture.memory if self._texture else 0
 
-        self._set_move(move_idx)
+    def prepare(
+        self: Self,
+        name: str = SCENE_DEFAULT,
+    ) -> None:
+        """Open the scene video without any OpenGL calls, so it can run in the background."""
+        if self._texture:
+            return
 
-    def _set_move(self: Self, idx: int, on_start: bool = False) -> None:
-        """Set the current move steo."""
-        self._move_idx = idx
-        self._move_start_time = timer()
-        self._move_end_x = self._moves[self._move_idx][0]
-        self._move_end_y = self._moves[self._move_idx][1]
-        self._move_end_time = self._moves[self._move_idx][2]
+        log.debug("scene prepare %s %s", self._path, name)
 
-        if on_start:
-            self._next_move()
+        self._name = name
+
+        # scenes can choose the decoder that suits their video
+        data = self.data[name]
+        video_path = self._path / data["video"]
+        texture_options = dict(self._texture_options)
+        if "decoder" in data:
+            texture_options["decoder"] = data["decoder"]
+
+        # pretranscoded frames need no decoding at all
+        raw_path = cached_video(video_path) if self._frame_cache else None
+        if raw_path:
+            video_path = raw_path
+            texture_options["decoder"] = "raw"
+
+        self._texture = Texture(
+            video_path,
+            time_source=self._time_source,
+            **texture_options,
+        )
 
     def start(
         self: Self,
         name: str = SCENE_DEFAULT,
     ) -> None:
-        """Load the resources and start the scene."""
+        """Load the resources if not already prepared and start the scene."""
         log.debug("scene start %s %s", self._path, name)
 
-        self._name = name
+        if self._texture and self._name != name:
+            self.stop()
+
+        self.prepare(name)
+        self._texture.restart()
+
+        self._timeline = None
+        data = self.data[name]
+        if data.get("moves"):
+            if name not in self._timelines:
+                self._timelines[name] = Timeline(
+                    data["moves"],
+                    data.get("move_path", MOVE_PATH_DEFAULT),
+                )
+            self._timeline = self._timelines[name]
+
+        self._tracks = None
+        if data.get("tracks"):
+            if not self.fps:
+                log.warning("tracks ignored without a video frame rate %s", self._path)
+
+            else:
+                if name not in self._tracks_cache:
+                    tracks_path = self._path / data["tracks"]
+                    try:
+                        self._tracks_cache[name] = Tracks(tracks_path, self.fps)
+
+                    except (OSError, ValueError) as e:
+                        raise ScriptError(f"invalid tracks {tracks_path}") from e
 
-        assert not self._texture, "texture not released"
-        self._texture = Texture(self._path / self._data[name]["video"])
+                self._tracks = self._tracks_cache[name]
 
-        self._moves = None
-        if "moves" in self._data[name]:
-            self._moves = self._data[self._name]["moves"]
-            self._set_move(0, on_start=True)
+        self._start_time = self._time_source()
 
     def stop(self: Self) -> None:
         """Stop the scene and release the resources."""
@@ -169,4 +404,5 @@ class Scene:
             self._texture = None
             self._name = None
 
-        self._moves = []
+        self._timeline = None
+        self._tracks = None
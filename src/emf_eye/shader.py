@@ -0,0 +1,107 @@
+"""OpenGL shader programs."""
+
+import logging
+from typing import Self
+
+from OpenGL import GL
+from OpenGL.GL import shaders
+
+from .exceptions import ScriptError
+
+log = logging.getLogger("shader")
+
+
+def define_hook(source: str, name: str, definition: str) -> str:
+    """
+    Return GLSL source with a hook function defined in place of the default the source guards with #ifndef.
+
+    Args:
+        source (str): GLSL source starting with the #version line.
+        name (str): Name of the hook, defined before the guard so the default is left out.
+        definition (str): GLSL defining the hook function.
+
+    Raises:
+        ScriptError: If the source does not have the hook.
+
+    """
+    if f"#ifndef {name}\n" not in source:
+        raise ScriptError(f"shader has no {name} hook")
+
+    # the version has to come first
+    version, body = source.lstrip().split("\n", 1)
+
+    return f"{version}\n#define {name}\n{definition}\n{body}"
+
+
+class Shader:
+    """Shader program class."""
+
+    def __init__(
+        self: Self,
+        vertex_source: str,
+        fragment_source: str,
+        attributes: dict[str, int] | None = None,
+    ) -> None:
+        """
+        Compile and link the shader program.
+
+        Args:
+            vertex_source (str): GLSL vertex shader source.
+            fragment_source (str): GLSL fragment shader source.
+            attributes (dict, optional): Vertex attribute locations to bind before linking. Defaults to None.
+
+        Raises:
+            ScriptError: If the program fails to compile or link.
+
+        """
+        self._program_ref = None
+        shader_refs = []
+        try:
+            for source, shader_type in [
+                (vertex_source, GL.GL_VERTEX_SHADER),
+                (fragment_source, GL.GL_FRAGMENT_SHADER),
+            ]:
+                shader_refs.append(shaders.compileShader(source, shader_type))
+
+            self._program_ref = GL.glCreateProgram()
+            for shader_ref in shader_refs:
+                GL.glAttachShader(self._program_ref, shader_ref)
+
+            for name, location in (attributes or {}).items():
+                GL.glBindAttribLocation(self._program_ref, location, name)
+
+            GL.glLinkProgram(self._program_ref)
+            if not GL.glGetProgramiv(self._program_ref, GL.GL_LINK_STATUS):
+                raise RuntimeError(GL.glGetProgramInfoLog(self._program_ref))
+
+        except RuntimeError as e:
+            log.error("%s: %s", e.__class__.__name__, e)
+            self.release()
+            raise ScriptError("unable to compile shader") from e
+
+        finally:
+            for shader_ref in shader_refs:
+                GL.glDeleteShader(shader_ref)
+
+        self._locations = {}
+
+    def use(self: Self) -> None:
+        """Make the program current."""
+        GL.glUseProgram(self._program_ref)
+
+    def attribute(self: Self, name: str) -> int:
+        """Return the location of a vertex attribute."""
+        return GL.glGetAttribLocation(self._program_ref, name)
+
+    def uniform(self: Self, name: str) -> int:
+        """Return the location of a uniform."""
+        if name not in self._locations:
+            self._locations[name] = GL.glGetUniformLocation(self._program_ref, name)
+
+        return self._locations[name]
+
+    def release(self: Self) -> None:
+        """Release the program."""
+        if self._program_ref:
+            GL.glDeleteProgram(self._program_ref)
+        self._program_ref = None
@@ -1,14 +1,24 @@
 """Video as an OpenGL texture."""
 
+import ctypes
 import logging
+from collections.abc import Callable
+from math import log2
 from pathlib import Path
+from timeit import default_timer as timer
 from typing import Self
 
-import cv2
-import pygame
+import numpy as np
 from OpenGL import GL
 
-from .exceptions import ScriptError
+from .decoder import (
+    DECODER_DEFAULT,
+    LOOP_PRELOAD_FRAMES,
+    DecodeThread,
+    FrameStats,
+    LoopingSource,
+    PresentationClock,
+)
 
 log = logging.getLogger("texture")
 
@@ -16,75 +26,288 @@ log = logging.getLogger("texture")
 class Texture:
     """Texture class."""
 
-    def __init__(self: Self, path: Path) -> None:
-        """Load the video from a file."""
+    def __init__(
+        self: Self,
+        path: Path,
+        decode_ahead: int = 0,
+        mipmaps: bool = False,
+        decoder: str = DECODER_DEFAULT,
+        pacing: bool = True,
+        time_source: Callable[[], float] = timer,
+    ) -> None:
+        """
+        Load the video from a file.
+
+        No OpenGL calls are made until the first update so the video can be opened in the background.
+
+        Args:
+            path (Path): Path to the video file.
+            decode_ahead (int, optional): Number of frames to decode ahead in a background thread. Defaults to 0, decoding on the render thread.
+            mipmaps (bool, optional): Generate mipmaps for each frame. Defaults to False.
+            decoder (str, optional): Name of the video decoder backend. Defaults to DECODER_DEFAULT.
+            pacing (bool, optional): Choose frames by presentation time when decoding on the render thread, otherwise every update takes the next frame. Defaults to True.
+            time_source (Callable[[], float], optional): Clock frames are paced by when decoding on the render thread. Defaults to timer.
+
+        """
         self._path = path
+        self._mipmaps = mipmaps
+        self._time_source = time_source
 
-        self._video: cv2.VideoCapture | None = None
-        self._reset_video()
-        self._fps = self._video.get(cv2.CAP_PROP_FPS)
+        self._video: LoopingSource | None = None
+        self._decoder: DecodeThread | None = None
+        if decode_ahead:
+            self._decoder = DecodeThread(path, decode_ahead, decoder)
+            self._fps = self._decoder.fps
+            self._stats = self._decoder.stats
 
-        self._tx_ref = GL.glGenTextures(1)
+        else:
+            self._video = LoopingSource(path, decoder)
+            self._fps = self._video.fps
+            self._stats = FrameStats()
+            self._clock = PresentationClock(self._fps if pacing else None, self._stats)
+            self._frame_count = 0
+
+        self._tx_ref = None
+        self._tx_size = None
+        self._pbo_refs = None
+        self._pbo_idx = 0
+        # the buffer written by the last update, with the presentation time of its frame
+        self._pbo_pending: tuple[int, float | None] | None = None
+        self._video_time = None
+        self._frame = None
+        self._frame_decoded = False
 
     @property
     def fps(self: Self) -> float | None:
         """Get the video FPS if available."""
         return self._fps
 
-    def _reset_video(self: Self) -> None:
-        """Release and reload the video."""
-        if self._video:
-            self._video.release()
+    @property
+    def video_time(self: Self) -> float | None:
+        """
+        Return the presentation time of the frame in the texture.
+
+        The time counts on through each loop of the video. None is returned
+        if frames are not chosen by presentation time.
+        """
+        return self._video_time
+
+    @property
+    def stats(self: Self) -> FrameStats:
+        """Get the frame delivery counters."""
+        return self._stats
+
+    @property
+    def memory(self: Self) -> int:
+        """Estimate the bytes held for video frames once the first frame is uploaded."""
+        if not self._tx_size:
+            return 0
+
+        # the texture, upload buffers and frames preloaded for this and the next loop
+        frames = 1 + len(self._pbo_refs) + (LOOP_PRELOAD_FRAMES * 2)
+        if self._decoder:
+            frames += self._decoder.ring_size
+
+        return frames * self._tx_size[0] * self._tx_size[1] * 3
 
-        if not self._path.exists():
-            raise ScriptError(f"video {self._path} not found")
+    def restart(self: Self) -> None:
+        """Resume playback from the frame already uploaded after being paused."""
+        if self._decoder:
+            self._decoder.restart()
 
-        self._video = cv2.VideoCapture(str(self._path))
+        else:
+            self._clock.restart()
+
+    def _source_time(self: Self) -> float | None:
+        """Return the presentation time of the frame last taken from the video."""
+        if self._decoder:
+            return self._decoder.video_time
+
+        return self._clock.pts if self._clock.interval else None
+
+    def _next_frame(self: Self) -> np.ndarray | None:
+        """Return the next frame to upload or None to keep the last frame."""
+        if self._decoder:
+            # None when nothing new is due
+            return self._decoder.get_frame()
+
+        time_now = self._time_source()
+        play_time = self._clock.play_time(time_now)
+        interval = self._clock.interval
+
+        if self._frame_count * interval > play_time:
+            self._stats.repeated += 1
+            return None
+
+        # catch up without converting frames that would never be shown
+        while interval and (self._frame_count + 1) * interval <= play_time:
+            self._video.skip()
+            self._frame_count += 1
+            self._stats.dropped += 1
+
+        # loops back to the start without reopening on this thread
+        cv_image = self._video.read()
+        self._clock.present(self._frame_count * interval, time_now)
+        self._frame_count += 1
+
+        self._stats.decoded += 1
+        self._stats.uploaded += 1
+
+        return cv_image
+
+    def decode(self: Self) -> None:
+        """Decode the frame for the next update without any OpenGL calls, so it can run in another thread."""
+        if self._frame_decoded:
+            return
+
+        self._frame = self._next_frame()
+        self._frame_decoded = True
 
     def update(self: Self) -> int | None:
         """Update the texture with a new frame."""
-        if not self._tx_ref:
+        if not (self._video or self._decoder):
             return None
 
-        cv_read_ok, cv_image = self._video.read()
-        if not cv_read_ok:
-            self._reset_video()
-            cv_read_ok, cv_image = self._video.read()
-            if not cv_read_ok:
-                raise ScriptError(f"unable to load {self._path}")
+        if self._frame_decoded:
+            cv_image = self._frame
+            self._frame = None
+            self._frame_decoded = False
+
+        else:
+            cv_image = self._next_frame()
+
+        if cv_image is None:
+            # keep showing the last frame, once the frame written last update is uploaded
+            self._upload_pending()
+            return self._tx_ref
 
         tx_h, tx_w, _ = cv_image.shape
-        tx_surface = pygame.image.frombuffer(
-            cv_image.tobytes(),
-            cv_image.shape[1::-1],
-            "BGR",
+        allocated = self._tx_size != (tx_w, tx_h)
+        if allocated:
+            self._allocate(tx_w, tx_h)
+
+        # upload the frame written last update, which has had a frame to transfer,
+        # while this frame is written into the other buffer
+        self._upload_pending()
+        self._write_pending(cv_image)
+
+        # a new texture has nothing to show, so its first frame cannot wait
+        if allocated:
+            self._upload_pending()
+
+        return self._tx_ref
+
+    def _write_pending(self: Self, cv_image: np.ndarray) -> None:
+        """Copy a frame into the next upload buffer, to be uploaded by the next update."""
+        pbo_idx = self._pbo_idx
+        self._pbo_idx = 1 - self._pbo_idx
+
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, self._pbo_refs[pbo_idx])
+        # invalidated so mapping does not wait for the previous upload from the buffer
+        pointer = GL.glMapBufferRange(
+            GL.GL_PIXEL_UNPACK_BUFFER,
+            0,
+            cv_image.nbytes,
+            GL.GL_MAP_WRITE_BIT | GL.GL_MAP_INVALIDATE_BUFFER_BIT,
         )
-        tx_data = pygame.image.tobytes(tx_surface, "RGB", True)
+        mapped = np.ctypeslib.as_array(
+            ctypes.cast(pointer, ctypes.POINTER(ctypes.c_ubyte)),
+            cv_image.shape,
+        )
+        np.copyto(mapped, cv_image)
+        GL.glUnmapBuffer(GL.GL_PIXEL_UNPACK_BUFFER)
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+
+        self._pbo_pending = (pbo_idx, self._source_time())
 
+    def _upload_pending(self: Self) -> None:
+        """Upload the frame written by the last update to the texture."""
+        if self._pbo_pending is None:
+            return
+
+        pbo_idx, self._video_time = self._pbo_pending
+        self._pbo_pending = None
+
+        tx_w, tx_h = self._tx_size
         GL.glBindTexture(GL.GL_TEXTURE_2D, self._tx_ref)
-        GL.glTexImage2D(
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, self._pbo_refs[pbo_idx])
+
+        # upload the decoded BGR rows as is, the renderer flips the texture coordinates
+        GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+        GL.glTexSubImage2D(
             GL.GL_TEXTURE_2D,
             0,
-            GL.GL_RGB,
+            0,
+            0,
             tx_w,
             tx_h,
-            0,
-            GL.GL_RGB,
+            GL.GL_BGR,
             GL.GL_UNSIGNED_BYTE,
-            tx_data,
+            ctypes.c_void_p(0),
         )
-        GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+
+        if self._mipmaps:
+            GL.glGenerateMipmap(GL.GL_TEXTURE_2D)
+
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    def _allocate(self: Self, tx_w: int, tx_h: int) -> None:
+        """Allocate the texture storage and upload buffers for the frame size."""
+        if self._tx_size:
+            # immutable storage cannot be resized so start again with a new texture
+            GL.glDeleteTextures([self._tx_ref])
+            GL.glDeleteBuffers(len(self._pbo_refs), self._pbo_refs)
+
+        self._tx_ref = GL.glGenTextures(1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, self._tx_ref)
+
+        self._tx_size = (tx_w, tx_h)
+        log.debug("allocate %s %sx%s", self._path, tx_w, tx_h)
+
+        levels = int(log2(max(tx_w, tx_h))) + 1 if self._mipmaps else 1
+        if bool(GL.glTexStorage2D):
+            GL.glTexStorage2D(GL.GL_TEXTURE_2D, levels, GL.GL_RGB8, tx_w, tx_h)
+
+        else:
+            GL.glTexImage2D(
+                GL.GL_TEXTURE_2D,
+                0,
+                GL.GL_RGB8,
+                tx_w,
+                tx_h,
+                0,
+                GL.GL_BGR,
+                GL.GL_UNSIGNED_BYTE,
+                None,
+            )
+            GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAX_LEVEL, levels - 1)
+
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
         GL.glTexParameteri(
             GL.GL_TEXTURE_2D,
             GL.GL_TEXTURE_MIN_FILTER,
-            GL.GL_LINEAR_MIPMAP_LINEAR,
+            GL.GL_LINEAR_MIPMAP_LINEAR if self._mipmaps else GL.GL_LINEAR,
         )
         # GL_REPEAT is going to make life a lot easier
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_REPEAT)
         GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_REPEAT)
 
-        return self._tx_ref
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+        # two upload buffers, so one is written while the other is uploaded
+        self._pbo_refs = GL.glGenBuffers(2)
+        for pbo_ref in self._pbo_refs:
+            GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, pbo_ref)
+            GL.glBufferData(
+                GL.GL_PIXEL_UNPACK_BUFFER,
+                tx_w * tx_h * 3,
+                None,
+                GL.GL_STREAM_DRAW,
+            )
+        GL.glBindBuffer(GL.GL_PIXEL_UNPACK_BUFFER, 0)
+        self._pbo_idx = 0
+        self._pbo_pending = None
 
     def release(self: Self) -> None:
         """Release the video and texture resources."""
@@ -92,6 +315,18 @@ class Texture:
             GL.glDeleteTextures([self._tx_ref])
         self._tx_ref = None
 
+        if self._pbo_refs is not None:
+            GL.glDeleteBuffers(len(self._pbo_refs), self._pbo_refs)
+        self._pbo_refs = None
+        self._pbo_pending = None
+        self._tx_size = None
+
+        if self._decoder:
+            self._decoder.release()
+            self._decoder = None
+            self._fps = None
+            log.debug("%s %s", self._path, self._stats)
+
         if self._video:
             self._video.release()
             self._video = None
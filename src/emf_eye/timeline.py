@@ -0,0 +1,222 @@
+"""Scene eye movement and metadata tracks looked up by scene time."""
+
+import bisect
+import logging
+from pathlib import Path
+from typing import Self
+
+import numpy as np
+
+log = logging.getLogger("timeline")
+
+
+EASING_STEPS = 1024
+EASINGS = {
+    "linear": lambda t: t,
+    "ease-in": lambda t: t**3,
+    "ease-out": lambda t: 1.0 - (1.0 - t) ** 3,
+    "ease-in-out": lambda t: t * t * (3.0 - (2.0 * t)),
+}
+EASING_DEFAULT = "linear"
+# each easing sampled once, so easing a move is a table lookup
+EASING_TABLE = [
+    easing(np.linspace(0.0, 1.0, EASING_STEPS + 1)).tolist()
+    for easing in EASINGS.values()
+]
+EASING_INDEX = {name: idx for idx, name in enumerate(EASINGS)}
+MOVE_PATHS = ("line", "spline")
+MOVE_PATH_DEFAULT = "line"
+# track names and the value used when a scene has no track
+TRACKS = {"brightness": 1.0}
+
+
+class Timeline:
+    """Eye positions over time, compiled from the scene moves."""
+
+    def __init__(self: Self, moves: list[list], path: str = MOVE_PATH_DEFAULT) -> None:
+        """
+        Compile the moves.
+
+        Args:
+            moves (list[list]): Moves as x, y, seconds to move there from the previous position and an optional easing name, starting at the first position and looping back to it.
+            path (str, optional): Path between positions, either straight lines or a spline through them. Defaults to MOVE_PATH_DEFAULT.
+
+        """
+        positions = np.array([move[:2] for move in moves], np.float64)
+        durations = np.array([move[2] for move in moves], np.float64)
+        easings = [
+            EASING_INDEX[move[3] if len(move) > 3 else EASING_DEFAULT] for move in moves
+        ]
+
+        # the eye starts at the first position, so the move to it comes last
+        count = len(moves)
+        order = np.roll(np.arange(count), -1)
+        before = positions[(order - 2) % count]
+        start = positions[(order - 1) % count]
+        end = positions[order]
+        after = positions[(order + 1) % count]
+
+        # cubic coefficients of each segment, from the constant term up
+        if path == "spline":
+            # Catmull-Rom through the positions, looping like the moves
+            coefficients = 0.5 * np.stack(
+                [
+                    2.0 * start,
+                    end - before,
+                    (2.0 * before) - (5.0 * start) + (4.0 * end) - after,
+                    -before + (3.0 * start) - (3.0 * end) + after,
+                ],
+                axis=1,
+            )
+
+        else:
+            zero = np.zeros_like(start)
+            coefficients = np.stack([start, end - start, zero, zero], axis=1)
+
+        # scalar lookups are quicker from lists than arrays
+        self._first = tuple(positions[0].tolist())
+        self._coefficients = coefficients.tolist()
+        self._easings = [easings[idx] for idx in order]
+        self._durations = durations[order].tolist()
+        ends = np.cumsum(durations[order])
+        self._ends = ends.tolist()
+        self._duration = self._ends[-1]
+
+        # the first segment of equal time buckets narrows each search to a few segments
+        self._buckets = count
+        self._bucket_time = self._duration / self._buckets
+        self._bucket_segments = np.searchsorted(
+            ends,
+            np.arange(self._buckets + 1) * self._bucket_time,
+            side="right",
+        ).tolist()
+
+        log.debug("timeline %d moves %.1fs", count, self._duration)
+
+    @property
+    def duration(self: Self) -> float:
+        """Return the seconds taken to loop through the moves."""
+        return self._duration
+
+    def position(self: Self, scene_time: float) -> tuple[float, float]:
+        """
+        Return the eye position at a time.
+
+        Args:
+            scene_time (float): Seconds since the scene started.
+
+        Returns:
+            tuple[float, float]: Eye position.
+
+        """
+        if self._duration <= 0.0:
+            return self._first
+
+        last = len(self._ends) - 1
+        loop_time = scene_time % self._duration
+        bucket = min(int(loop_time / self._bucket_time), self._buckets - 1)
+        segment = bisect.bisect_right(
+            self._ends,
+            loop_time,
+            self._bucket_segments[bucket],
+            min(self._bucket_segments[bucket + 1], last),
+        )
+
+        duration = self._durations[segment]
+        ratio = 1.0
+        if duration > 0.0:
+            ratio = (loop_time - self._ends[segment] + duration) / duration
+            ratio = min(max(ratio, 0.0), 1.0)
+
+        table = EASING_TABLE[self._easings[segment]]
+        table_pos = ratio * EASING_STEPS
+        table_idx = min(int(table_pos), EASING_STEPS - 1)
+        s = table[table_idx] + (
+            (table[table_idx + 1] - table[table_idx]) * (table_pos - table_idx)
+        )
+
+        c0, c1, c2, c3 = self._coefficients[segment]
+
+        return (
+            c0[0] + (s * (c1[0] + (s * (c2[0] + (s * c3[0]))))),
+            c0[1] + (s * (c1[1] + (s * (c2[1] + (s * c3[1]))))),
+        )
+
+
+def load_tracks(path: Path) -> dict[str, np.ndarray]:
+    """
+    Read the metadata tracks of a video from a CSV file.
+
+    Args:
+        path (Path): Path to the file, a header row of track names then a row of values per video frame.
+
+    Returns:
+        dict[str, np.ndarray]: Values of each track, one per frame.
+
+    Raises:
+        ValueError: If a track is unknown, a value is not a number or from 0.0 to 1.0, or there are no frames.
+
+    """
+    with open(path) as file_object:
+        names = [name.strip() for name in file_object.readline().split(",")]
+        rows = [line for line in file_object if line.strip()]
+
+    for name in names:
+        if name not in TRACKS:
+            log.error("unknown track %s", name)
+            raise ValueError(name)
+
+    values = np.loadtxt(rows, delimiter=",", ndmin=2) if rows else None
+    if (
+        values is None
+        or values.shape[1] != len(names)
+        or np.any((values < 0.0) | (values > 1.0))
+    ):
+        log.error("invalid tracks %s", path)
+        raise ValueError(path)
+
+    return {name: values[:, idx] for idx, name in enumerate(names)}
+
+
+class Tracks:
+    """Metadata values per video frame, such as brightness, looping with the video."""
+
+    def __init__(self: Self, path: Path, fps: float) -> None:
+        """
+        Load the tracks.
+
+        Args:
+            path (Path): Path to the CSV file of values per video frame.
+            fps (float): Video frame rate the values are presented at.
+
+        """
+        self._fps = fps
+
+        tracks = load_tracks(path)
+        self._frames = len(next(iter(tracks.values())))
+        # a row of every track per frame, so a lookup is a single index
+        self._values = [
+            dict(zip(tracks, row, strict=True))
+            for row in zip(
+                *[values.tolist() for values in tracks.values()],
+                strict=True,
+            )
+        ]
+        for values in self._values:
+            for name, default in TRACKS.items():
+                values.setdefault(name, default)
+
+        log.debug("tracks %s %d frames", ", ".join(tracks), self._frames)
+
+    def values(self: Self, scene_time: float) -> dict[str, float]:
+        """
+        Return the track values at a time.
+
+        Args:
+            scene_time (float): Presentation time of the video frame shown.
+
+        Returns:
+            dict[str, float]: Value of every track name.
+
+        """
+        return self._values[round(scene_time * self._fps) % self._frames]
@@ -0,0 +1,229 @@
+"""Transitions blending between two scenes drawn through the same warp."""
+
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor
+from timeit import default_timer as timer
+from typing import TYPE_CHECKING, Self
+
+from OpenGL import GL
+
+from .mesh import ATTRIBUTE_LOCATIONS
+from .shader import Shader, define_hook
+
+if TYPE_CHECKING:
+    from .mesh import WarpMesh
+    from .remap import BakedWarp
+    from .scene import Scene
+
+log = logging.getLogger("transition")
+
+
+TRANSITIONS = {"cut": 0, "crossfade": 1, "wipe": 2, "iris": 3}
+TRANSITION_DEFAULT = "cut"
+TRANSITION_TIME_DEFAULT = 1.0
+TRANSITION_EDGE = 0.05
+# consecutive frames over budget before giving up and cutting
+TRANSITION_LATE_FRAMES = 3
+TRANSITION_LATE_SLACK = 1.2
+
+TRANSITION_FUNCTION = f"""
+const float EDGE = {TRANSITION_EDGE};
+
+uniform sampler2D video_to;
+uniform vec2 offset_to;
+uniform vec2 origin;
+uniform vec2 resolution;
+uniform float progress;
+uniform int transition;
+
+vec4 blend(sampler2D video_from, vec2 coord) {{
+    vec4 colour = texture2D(video_from, coord);
+    vec4 colour_to = texture2D(video_to, coord + offset_to);
+
+    // sweep a soft edge through the display from 0.0 to 1.0
+    float edge = (progress * (1.0 + (2.0 * EDGE))) - EDGE;
+    vec2 position = (gl_FragCoord.xy - origin) / resolution;
+
+    float amount = smoothstep(0.0, 1.0, progress);
+    if (transition == {TRANSITIONS["wipe"]}) {{
+        amount = 1.0 - smoothstep(edge - EDGE, edge + EDGE, position.x);
+    }}
+    else if (transition == {TRANSITIONS["iris"]}) {{
+        vec2 aspect = vec2(resolution.x / resolution.y, 1.0);
+        float radius = length((position - 0.5) * aspect) / length(0.5 * aspect);
+        amount = 1.0 - smoothstep(edge - EDGE, edge + EDGE, radius);
+    }}
+
+    return mix(colour, colour_to, amount);
+}}
+"""
+
+
+def transition_fragment_shader(fragment_source: str) -> str:
+    """Return a warp fragment shader blending its video into a second one."""
+    return define_hook(fragment_source, "BLEND", TRANSITION_FUNCTION)
+
+
+class Transition:
+    """Blend from the previous scene to the current one."""
+
+    def __init__(self: Self, fps_default: float) -> None:
+        """
+        Construct the transition.
+
+        Args:
+            fps_default (float): Frame rate to hold for scenes without a video frame rate.
+
+        """
+        self._fps_default = fps_default
+
+        self.scene_from: Scene | None = None
+        self._transition = 0
+        self._duration = 0.0
+        self._start_time = None
+        self._frame_budget = 0.0
+        self._frame_time = None
+        self._late_frames = 0
+        self._progress = 0.0
+        self._tx_ref_from = None
+        self._offset_from = (0.0, 0.0)
+
+        # the outgoing scene decodes alongside the incoming one
+        self._executor = ThreadPoolExecutor(1, "transition decode")
+        self._decode: Future | None = None
+
+        self._shaders: dict[tuple[str, str], Shader] = {}
+
+    @property
+    def active(self: Self) -> bool:
+        """Return True while blending between scenes."""
+        return self.scene_from is not None
+
+    def start(self: Self, scene_from: "Scene", scene_to: "Scene") -> None:
+        """
+        Start the transition the incoming scene is configured with.
+
+        Args:
+            scene_from (Scene): Outgoing scene, which must stay started until the transition ends.
+            scene_to (Scene): Incoming scene.
+
+        """
+        self.stop()
+
+        name, duration = scene_to.transition
+        if name == TRANSITION_DEFAULT or duration <= 0.0:
+            return
+
+        log.debug("transition %s %.1fs %s %s", name, duration, scene_from, scene_to)
+
+        self.scene_from = scene_from
+        self._transition = TRANSITIONS[name]
+        self._duration = duration
+        self._start_time = timer()
+        self._frame_budget = 1.0 / (scene_to.fps or self._fps_default)
+        self._frame_time = None
+        self._late_frames = 0
+
+    def stop(self: Self) -> None:
+        """Finish the transition, leaving only the incoming scene."""
+        if self._decode:
+            self._decode.result()
+        self._decode = None
+
+        self.scene_from = None
+
+    def decode(self: Self) -> None:
+        """Start decoding the outgoing scene in the background."""
+        if self.active and not self._decode:
+            self._decode = self._executor.submit(self.scene_from.decode_texture)
+
+    def update(self: Self) -> None:
+        """Update the outgoing scene once per frame, ready to draw for each output."""
+        if not self.active:
+            return
+
+        time_now = timer()
+        progress = (time_now - self._start_time) / self._duration
+
+        # cut rather than hold everything up if two videos cannot be played at once
+        if self._frame_time is not None:
+            if time_now - self._frame_time > self._frame_budget * TRANSITION_LATE_SLACK:
+                self._late_frames += 1
+            else:
+                self._late_frames = 0
+        self._frame_time = time_now
+
+        if progress >= 1.0 or self._late_frames >= TRANSITION_LATE_FRAMES:
+            if progress < 1.0:
+                log.info("transition over the frame budget, cutting")
+
+            self.stop()
+            return
+
+        self.decode()
+        self._decode.result()
+        self._decode = None
+
+        self._progress = progress
+        self._tx_ref_from = self.scene_from.update_texture()
+        self._offset_from = self.scene_from.update_position()
+
+    def draw(
+        self: Self,
+        mesh: "WarpMesh | BakedWarp",
+        tx_ref: int,
+        offset_coord: tuple[float, float],
+        invert_x: bool,
+    ) -> None:
+        """Draw the outgoing scene blended into the incoming one in the current viewport."""
+        if not self.active:
+            mesh.draw(tx_ref, offset_coord, invert_x)
+            return
+
+        offset_from = self._offset_from
+        viewport = GL.glGetIntegerv(GL.GL_VIEWPORT)
+
+        shader = self._shader(mesh)
+        shader.use()
+        GL.glUniform1i(shader.uniform("video_to"), 1)
+        GL.glUniform2f(
+            shader.uniform("offset_to"),
+            offset_coord[0] - offset_from[0],
+            # texture coordinates are flipped vertically
+            offset_from[1] - offset_coord[1],
+        )
+        GL.glUniform2f(shader.uniform("origin"), *viewport[:2])
+        GL.glUniform2f(shader.uniform("resolution"), *viewport[2:])
+        GL.glUniform1f(shader.uniform("progress"), self._progress)
+        GL.glUniform1i(shader.uniform("transition"), self._transition)
+
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+
+        mesh.draw(self._tx_ref_from, offset_from, invert_x, shader=shader)
+
+        GL.glActiveTexture(GL.GL_TEXTURE1)
+        GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+        GL.glActiveTexture(GL.GL_TEXTURE0)
+
+    def _shader(self: Self, mesh: "WarpMesh | BakedWarp") -> Shader:
+        """Return the transition variant of the shader a mesh draws with."""
+        key = (mesh.vertex_source, mesh.fragment_source)
+        if key not in self._shaders:
+            self._shaders[key] = Shader(
+                mesh.vertex_source,
+                transition_fragment_shader(mesh.fragment_source),
+                ATTRIBUTE_LOCATIONS,
+            )
+
+        return self._shaders[key]
+
+    def release(self: Self) -> None:
+        """Release the shaders."""
+        self.stop()
+        self._executor.shutdown()
+
+        for shader in self._shaders.values():
+            shader.release()
+        self._shaders = {}
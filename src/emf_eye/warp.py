@@ -1,14 +1,19 @@
 """Texture warp calculator."""
 
 import logging
+from collections.abc import Callable
 from enum import IntEnum
-from math import cos, pi, sin
+from typing import Self
 
 import numpy as np
 from OpenGL import GL
 
-from .controller import Controller
+from .controller import Controller, KnobSet
 from .exceptions import ScriptError
+from .mesh import VERTEX_SHADER, WarpMesh, grid_coords
+from .remap import BakedWarp
+from .shader import define_hook
+from .transition import Transition
 
 log = logging.getLogger("warp")
 
@@ -23,6 +28,62 @@ KNOB_Y_FAN = 5
 POINT_OFFSET = 0.002
 LINE_WIDTH_NORMAL = 2
 LINE_WIDTH_SELECTED = 8
+# the four sides of a square around a point as line start and end corners
+POINT_SQUARE_LINES = np.array(
+    [(-1, -1), (-1, 1), (-1, 1), (1, 1), (1, 1), (1, -1), (1, -1), (-1, -1)],
+    np.float32,
+)
+# the whole viewport as a triangle strip
+VIEWPORT_QUAD = np.array(
+    [(0.0, 0.0), (1.0, 0.0), (0.0, 1.0), (1.0, 1.0)],
+    np.float32,
+)
+SHADER_WARP_STEPS = 256
+
+# the PARAMETER warp of calculate_warp evaluated per vertex
+SHADER_WARP_FUNCTION = f"""
+const float PI = {np.pi};
+const float Y_FAN_SCALE = {Y_FAN_SCALE:.1f};
+
+uniform float display_scale;
+uniform float knob_x_pos;
+uniform float knob_x_fan;
+uniform float knob_y_pos;
+uniform float knob_y_fan;
+
+float interpolate(float v1, float v2, float knob) {{
+    return ((v2 - v1) * (1.0 - knob)) + v1;
+}}
+
+float cos_curve(float v, float knob) {{
+    float c = (1.0 - cos(v * PI)) / 2.0;
+    return interpolate(c, v, knob);
+}}
+
+float sin_curve(float v, float knob) {{
+    return interpolate(sin(v * PI), 1.0, knob);
+}}
+
+vec2 warp(vec2 v) {{
+    float y_scale = sin_curve(v.y, knob_x_fan);
+
+    float x_pos = cos_curve(v.x, knob_x_pos) - 0.5;
+    x_pos *= y_scale;
+    x_pos /= display_scale;
+    x_pos += 0.5;
+
+    float y_fan = 1.0 - sin_curve(v.x, knob_y_fan);
+    y_fan *= Y_FAN_SCALE;
+    y_fan += 1.0;
+
+    float y_pos = cos_curve(v.y, knob_y_pos) - 0.5;
+    y_pos *= y_fan;
+    y_pos += 0.5;
+
+    return vec2(x_pos, y_pos);
+}}
+"""
+SHADER_WARP_VERTEX_SHADER = define_hook(VERTEX_SHADER, "WARP", SHADER_WARP_FUNCTION)
 
 
 class Warp(IntEnum):
@@ -30,25 +91,83 @@ class Warp(IntEnum):
 
     PARAMETER = 0
     NONE = 1
+    CONTROL = 2
+
+
+class WarpCache:
+    """Separable row and column factors of the PARAMETER warp, kept so a knob change only recalculates what it affects."""
+
+    def __init__(self: Self) -> None:
+        """Construct the empty cache."""
+        self._factors: dict[str, tuple[tuple, np.ndarray]] = {}
+        self._plane_keys: list[tuple | None] = [None, None]
+        self._coord_array = None
+
+    def factor(
+        self: Self,
+        name: str,
+        key: tuple,
+        calculate: Callable[[], np.ndarray],
+    ) -> np.ndarray:
+        """Return a factor vector, calculating it only if its key has changed."""
+        cached = self._factors.get(name)
+        if cached is None or cached[0] != key:
+            cached = (key, calculate())
+            self._factors[name] = cached
+
+        return cached[1]
+
+    def coord_array(self: Self, steps: int) -> np.ndarray:
+        """Return the coordinate array reused between calculations."""
+        shape = (steps + 1, steps + 1, 2)
+        if self._coord_array is None or self._coord_array.shape != shape:
+            self._coord_array = np.empty(shape, np.float32)
+            self._plane_keys = [None, None]
+
+        return self._coord_array
+
+    def plane_changed(self: Self, axis: int, key: tuple) -> bool:
+        """Return True if a coordinate plane needs recalculating, recording its new key."""
+        if self._plane_keys[axis] == key:
+            return False
+
+        self._plane_keys[axis] = key
+
+        return True
 
 
 def calculate_warp(
     warp_num: Warp,
     display_resolution: tuple[int, int],
-    controller: Controller,
+    controller: Controller | KnobSet,
+    steps: int = WARP_PARAMETER_STEPS,
+    cache: WarpCache | None = None,
 ) -> np.ndarray:
-    """Return the warp as an array of quad-strip coordinates."""
+    """
+    Return the warp as an array of quad-strip coordinates.
+
+    Args:
+        warp_num (Warp): Warp to calculate.
+        display_resolution (tuple[int, int]): Display size in pixels.
+        controller (Controller | KnobSet): Warp knob values, the controller for its selected output.
+        steps (int, optional): Number of grid steps per axis. Defaults to WARP_PARAMETER_STEPS.
+        cache (WarpCache, optional): Factors from the previous calculation, the array returned is reused by the next. Defaults to None.
+
+    Returns:
+        np.ndarray: Warp coordinates. With a cache the array belongs to the cache and is only valid until the next call with it, so copy it to keep it.
+
+    """
     display_aspect = display_resolution[0] / display_resolution[1]
     display_scale = controller.interpolate(display_aspect, 1.0, KNOB_ASPECT, True)
 
-    def cos_curve(v: float, knob_index: int, invert: bool) -> float:
-        t = v * pi
-        c = (1.0 - cos(t)) / 2.0
+    def cos_curve(v: np.ndarray, knob_index: int, invert: bool) -> np.ndarray:
+        t = v * np.pi
+        c = (1.0 - np.cos(t)) / 2.0
         return controller.interpolate(c, v, knob_index, invert)
 
-    def sin_curve(v: float, knob_index: int, invert: bool) -> float:
-        t = v * pi
-        c = sin(t)
+    def sin_curve(v: np.ndarray, knob_index: int, invert: bool) -> np.ndarray:
+        t = v * np.pi
+        c = np.sin(t)
         return controller.interpolate(c, 1.0, knob_index, invert)
 
     match warp_num:
@@ -62,139 +181,232 @@ def calculate_warp(
             )
 
         case Warp.PARAMETER:
-            coord_array = []
-            for y in [
-                v / WARP_PARAMETER_STEPS for v in range(WARP_PARAMETER_STEPS + 1)
-            ]:
-                y_scale = sin_curve(y, KNOB_X_FAN, True)
-
-                row = []
-                for x in [
-                    v / WARP_PARAMETER_STEPS for v in range(WARP_PARAMETER_STEPS + 1)
-                ]:
-                    x_pos = cos_curve(x, KNOB_X_POS, True)
-                    x_pos -= 0.5
-                    x_pos *= y_scale
-                    x_pos /= display_scale
-                    x_pos += 0.5
-
-                    y_fan = 1.0 - sin_curve(x, KNOB_Y_FAN, True)
-                    y_fan *= Y_FAN_SCALE
-                    y_fan += 1.0
-
-                    y_pos = cos_curve(y, KNOB_Y_POS, True)
-                    y_pos -= 0.5
-                    y_pos *= y_fan
-                    y_pos += 0.5
-
-                    row.append(
-                        [x_pos, y_pos],
-                    )
-                coord_array.append(row)
-
-            return np.array(
-                coord_array,
-                np.float32,
-            )
+            if cache is None:
+                cache = WarpCache()
+
+            v = np.arange(steps + 1) / steps
+
+            def calculate_y_fan() -> np.ndarray:
+                y_fan = 1.0 - sin_curve(v, KNOB_Y_FAN, True)
+                y_fan *= Y_FAN_SCALE
+                y_fan += 1.0
+                return y_fan
+
+            # each factor depends on a single knob and each plane on two factors
+            knob_x_pos = controller.knob(KNOB_X_POS)
+            knob_x_fan = controller.knob(KNOB_X_FAN)
+            knob_y_pos = controller.knob(KNOB_Y_POS)
+            knob_y_fan = controller.knob(KNOB_Y_FAN)
+            x_key = (steps, knob_x_fan, knob_x_pos, display_scale)
+            y_key = (steps, knob_y_pos, knob_y_fan)
+            coord_array = cache.coord_array(steps)
+
+            if cache.plane_changed(0, x_key):
+                # per row
+                y_scale = cache.factor(
+                    "y_scale",
+                    (steps, knob_x_fan),
+                    lambda: sin_curve(v, KNOB_X_FAN, True),
+                )
+                # per column
+                x_pos = cache.factor(
+                    "x_pos",
+                    (steps, knob_x_pos),
+                    lambda: cos_curve(v, KNOB_X_POS, True) - 0.5,
+                )
+                coord_array[..., 0] = np.outer(y_scale, x_pos) / display_scale + 0.5
+
+            if cache.plane_changed(1, y_key):
+                # per row
+                y_pos = cache.factor(
+                    "y_pos",
+                    (steps, knob_y_pos),
+                    lambda: cos_curve(v, KNOB_Y_POS, True) - 0.5,
+                )
+                # per column
+                y_fan = cache.factor("y_fan", (steps, knob_y_fan), calculate_y_fan)
+                coord_array[..., 1] = np.outer(y_pos, y_fan) + 0.5
+
+            return coord_array
 
     raise ScriptError(f"load_warp {warp_num} not implemented")
 
 
-def render_warp(
-    tx_ref: int,
-    display_resolution: tuple[int, int],
-    coord_array: np.ndarray,
-    offset_coord: tuple[float, float],
-    show_points: bool,
-    invert_x: bool = False,
-    mouse_pos: tuple[float, float] | None = None,
-) -> tuple[tuple[float, float], tuple[int, int]] | None:
-    """Render a warp to the display."""
-    GL.glEnable(GL.GL_TEXTURE_2D)
-    GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
-    GL.glColor3f(1.0, 1.0, 1.0)
-
-    d_y_size, d_x_size, _ = coord_array.shape
+class ShaderWarpMesh(WarpMesh):
+    """Warp mesh with the PARAMETER warp calculated in the vertex shader."""
 
-    points = set()
-    points_orig = set()
+    def __init__(self: Self, steps: int = SHADER_WARP_STEPS) -> None:
+        """
+        Create the shader and a fixed grid to warp.
 
-    for s_y_idx in range(d_y_size - 1):
-        s_y_pos_0 = s_y_idx / (d_y_size - 1)
-        s_y_pos_0 += offset_coord[1]
-        s_y_pos_1 = (s_y_idx + 1) / (d_y_size - 1)
-        s_y_pos_1 += offset_coord[1]
+        Args:
+            steps (int, optional): Number of grid steps per axis. Defaults to SHADER_WARP_STEPS.
 
-        GL.glBegin(GL.GL_QUAD_STRIP)
-        log.debug("----")
+        """
+        super().__init__(SHADER_WARP_VERTEX_SHADER)
+        super().update(grid_coords(steps))
 
-        for s_x_idx in range(d_x_size):
-            s_x_pos = s_x_idx / (d_x_size - 1)
-            if invert_x:
-                s_x_pos = 1.0 - s_x_pos
-            s_x_pos += offset_coord[0]
+        self._coord_array = None
+        self._warp_args = None
 
-            d_pos_0 = coord_array[s_y_idx, s_x_idx]
-            d_pos_1 = coord_array[s_y_idx + 1, s_x_idx]
+    @property
+    def coord_array(self: Self) -> np.ndarray | None:
+        """Return the warp coordinates, only calculated on the CPU when needed."""
+        if self._coord_array is None and self._warp_args:
+            self._coord_array = calculate_warp(Warp.PARAMETER, *self._warp_args)
 
-            GL.glTexCoord2f(s_x_pos, s_y_pos_0)
-            GL.glVertex3f(d_pos_0[0], d_pos_0[1], 0.0)
+        return self._coord_array
 
-            GL.glTexCoord2f(s_x_pos, s_y_pos_1)
-            GL.glVertex3f(d_pos_1[0], d_pos_1[1], 0.0)
-
-            points.add(((d_pos_0[0], d_pos_0[1]), (s_x_idx, s_y_idx)))
-            points.add(((d_pos_1[0], d_pos_1[1]), (s_x_idx, s_y_idx + 1)))
+    def update_warp(
+        self: Self,
+        display_resolution: tuple[int, int],
+        controller: Controller | KnobSet,
+        steps: int = WARP_PARAMETER_STEPS,
+    ) -> None:
+        """Update the warp parameters from the controller."""
+        display_aspect = display_resolution[0] / display_resolution[1]
+        self.uniforms = {
+            "display_scale": controller.interpolate(
+                display_aspect,
+                1.0,
+                KNOB_ASPECT,
+                True,
+            ),
+            "knob_x_pos": controller.knob(KNOB_X_POS),
+            "knob_x_fan": controller.knob(KNOB_X_FAN),
+            "knob_y_pos": controller.knob(KNOB_Y_POS),
+            "knob_y_fan": controller.knob(KNOB_Y_FAN),
+        }
+
+        self._coord_array = None
+        self._warp_args = (display_resolution, controller, steps)
+
+
+def hit_point(
+    points: np.ndarray,
+    position: tuple[float, float],
+    point_offset: tuple[float, float],
+) -> int | None:
+    """
+    Find the warp point whose square contains a position.
+
+    Args:
+        points (np.ndarray): Point positions, one row per point.
+        position (tuple[float, float]): Display position to test.
+        point_offset (tuple[float, float]): Half the width and height of the point squares.
+
+    Returns:
+        int | None: Index of the last point containing the position, or None.
+
+    """
+    offset = np.asarray(point_offset)
+    inside = np.all(
+        (points - offset <= position) & (position < points + offset),
+        axis=1,
+    )
+    hits = np.flatnonzero(inside)
+
+    return int(hits[-1]) if len(hits) else None
+
+
+def draw_squares(
+    points: np.ndarray,
+    point_offset: tuple[float, float],
+    colour: tuple[float, float, float],
+) -> None:
+    """Draw a square outline around each point in one call, with the vertex array client state enabled."""
+    vertices = np.ascontiguousarray(
+        (points[:, np.newaxis, :] + POINT_SQUARE_LINES * point_offset).reshape(-1, 2),
+        np.float32,
+    )
+
+    GL.glColor3f(*colour)
+    GL.glVertexPointer(2, GL.GL_FLOAT, 0, vertices)
+    GL.glDrawArrays(GL.GL_LINES, 0, len(vertices))
+
+
+def draw_dim(brightness: float) -> None:
+    """Scale the colour of everything drawn in the viewport by a brightness from 0.0 to 1.0."""
+    # multiplying by the quad colour leaves the warp shaders untouched
+    GL.glEnable(GL.GL_BLEND)
+    GL.glBlendFunc(GL.GL_ZERO, GL.GL_SRC_COLOR)
+    GL.glColor3f(brightness, brightness, brightness)
+
+    GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+    GL.glVertexPointer(2, GL.GL_FLOAT, 0, VIEWPORT_QUAD)
+    GL.glDrawArrays(GL.GL_TRIANGLE_STRIP, 0, len(VIEWPORT_QUAD))
+    GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
+
+    GL.glDisable(GL.GL_BLEND)
 
-            points_orig.add((s_x_pos, s_y_pos_0))
 
-            log.debug("s %s %s", s_x_pos, s_y_pos_0)
-            log.debug("s %s %s", s_x_pos, s_y_pos_1)
-            log.debug("d %s %s", d_pos_0[0], d_pos_0[1])
-            log.debug("d %s %s", d_pos_1[0], d_pos_1[1])
+def render_warp(
+    tx_ref: int,
+    display_resolution: tuple[int, int],
+    mesh: WarpMesh | BakedWarp,
+    offset_coord: tuple[float, float],
+    show_points: bool,
+    invert_x: bool = False,
+    mouse_pos: tuple[float, float] | None = None,
+    transition: Transition | None = None,
+    control_points: np.ndarray | None = None,
+    brightness: float = 1.0,
+) -> tuple[tuple[float, float], tuple[int, int]] | None:
+    """Render a warp to the display at a brightness, showing and selecting the control points rather than the mesh vertices if given."""
+    if transition and transition.active:
+        transition.draw(mesh, tx_ref, offset_coord, invert_x)
 
-        GL.glEnd()
+    else:
+        mesh.draw(tx_ref, offset_coord, invert_x)
 
-    GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+    if brightness < 1.0:
+        draw_dim(brightness)
 
     selected = None
     if show_points:
+        coord_array = mesh.coord_array if control_points is None else control_points
+        d_y_size, d_x_size, _ = coord_array.shape
+        points = coord_array.reshape(-1, 2)
+
+        # the source texture position of each warp point
+        s_x_pos = np.linspace(0.0, 1.0, d_x_size)
+        if invert_x:
+            s_x_pos = 1.0 - s_x_pos
+        points_orig = np.stack(
+            np.meshgrid(
+                s_x_pos + offset_coord[0],
+                np.linspace(0.0, 1.0, d_y_size) + offset_coord[1],
+            ),
+            axis=-1,
+        ).reshape(-1, 2)
+
         display_aspect = display_resolution[0] / display_resolution[1]
-        point_offset_x = POINT_OFFSET
-        point_offset_y = point_offset_x * display_aspect
-        for point in points:
-            GL.glLineWidth(LINE_WIDTH_NORMAL)
-            GL.glColor3f(0.0, 1.0, 0.0)
-
-            if (
-                mouse_pos
-                and point[0][0] - point_offset_x
-                <= mouse_pos[0]
-                < point[0][0] + point_offset_x
-                and point[0][1] - point_offset_y
-                <= mouse_pos[1]
-                < point[0][1] + point_offset_y
-            ):
-                GL.glLineWidth(LINE_WIDTH_SELECTED)
-                GL.glColor3f(1.0, 0.0, 1.0)
-                selected = point
-
-            GL.glBegin(GL.GL_LINE_LOOP)
-            GL.glVertex2f(point[0][0] - point_offset_x, point[0][1] - point_offset_y)
-            GL.glVertex2f(point[0][0] - point_offset_x, point[0][1] + point_offset_y)
-            GL.glVertex2f(point[0][0] + point_offset_x, point[0][1] + point_offset_y)
-            GL.glVertex2f(point[0][0] + point_offset_x, point[0][1] - point_offset_y)
-            GL.glEnd()
-
-        for point in points_orig:
+        point_offset = (POINT_OFFSET, POINT_OFFSET * display_aspect)
+
+        point_idx = None
+        if mouse_pos:
+            point_idx = hit_point(points, mouse_pos, point_offset)
+            if point_idx is not None:
+                s_y_idx, s_x_idx = divmod(point_idx, d_x_size)
+                d_pos = points[point_idx]
+                selected = ((d_pos[0], d_pos[1]), (s_x_idx, s_y_idx))
+
+        GL.glEnableClientState(GL.GL_VERTEX_ARRAY)
+
+        GL.glLineWidth(LINE_WIDTH_NORMAL)
+        draw_squares(points, point_offset, (0.0, 1.0, 0.0))
+
+        if point_idx is not None:
+            GL.glLineWidth(LINE_WIDTH_SELECTED)
+            draw_squares(
+                points[point_idx : point_idx + 1],
+                point_offset,
+                (1.0, 0.0, 1.0),
+            )
             GL.glLineWidth(LINE_WIDTH_NORMAL)
-            GL.glColor3f(1.0, 0.0, 0.0)
-
-            GL.glBegin(GL.GL_LINE_LOOP)
-            GL.glVertex2f(point[0] - point_offset_x, point[1] - point_offset_y)
-            GL.glVertex2f(point[0] - point_offset_x, point[1] + point_offset_y)
-            GL.glVertex2f(point[0] + point_offset_x, point[1] + point_offset_y)
-            GL.glVertex2f(point[0] + point_offset_x, point[1] - point_offset_y)
-            GL.glEnd()
+
+        draw_squares(points_orig, point_offset, (1.0, 0.0, 0.0))
+
+        GL.glDisableClientState(GL.GL_VERTEX_ARRAY)
 
     return selected
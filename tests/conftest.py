@@ -0,0 +1,28 @@
+"""Test configuration."""
+
+import os
+from collections.abc import Iterator
+
+import pytest
+
+# offscreen EGL rendering has to be selected before PyOpenGL is first imported
+os.environ.setdefault("PYOPENGL_PLATFORM", "egl")
+# lets Mesa render without X11 or Wayland
+os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+from emf_eye.exceptions import ScriptError
+from emf_eye.offscreen import OffscreenContext
+
+
+@pytest.fixture(scope="module")
+def context(request: pytest.FixtureRequest) -> Iterator[OffscreenContext]:
+    """Return an offscreen context the size of the test module RESOLUTION, skipping the tests where EGL is not available."""
+    try:
+        context = OffscreenContext(request.module.RESOLUTION)
+
+    except (ScriptError, ImportError, AttributeError) as e:
+        pytest.skip(f"no offscreen context: {e}")
+
+    yield context
+
+    context.release()
@@ -0,0 +1,82 @@
+"""Video loops checked for a gap in the frame reads at the loop point."""
+
+import time
+from pathlib import Path
+from timeit import default_timer as timer
+
+import cv2
+import numpy as np
+import pytest
+
+from emf_eye.decoder import LoopingSource, OpenCVSource, write_raw
+
+RESOLUTION = (640, 360)
+VIDEO_FPS = 25
+VIDEO_FRAMES = 30
+LOOP_PASSES = 3
+# time between reads, so the next pass is prepared in the background as it is during playback
+READ_INTERVAL = 0.01
+# well under the time to reopen the video, which is what a loop without preparing costs
+LOOP_SLACK = 0.001
+
+
+@pytest.fixture(scope="module")
+def video_path(tmp_path_factory: pytest.TempPathFactory) -> Path:
+    """Return a short synthetic video, with its raw frames decoded beside it."""
+    path = tmp_path_factory.mktemp("loop") / "loop.mp4"
+    writer = cv2.VideoWriter(
+        str(path),
+        cv2.VideoWriter_fourcc(*"mp4v"),
+        VIDEO_FPS,
+        RESOLUTION,
+    )
+    background = np.random.default_rng(0).integers(
+        0,
+        256,
+        (RESOLUTION[1], RESOLUTION[0], 3),
+        np.uint8,
+    )
+    for idx in range(VIDEO_FRAMES):
+        writer.write(np.roll(background, idx * 8, axis=1))
+    writer.release()
+
+    source = OpenCVSource(path)
+    try:
+        write_raw(path.with_suffix(".raw"), source)
+
+    finally:
+        source.release()
+
+    return path
+
+
+@pytest.mark.parametrize("decoder", ["opencv", "raw"])
+def test_loop_gap(video_path: Path, decoder: str) -> None:
+    """The worst read at a loop point is no slower than the reads within a pass."""
+    source = LoopingSource(
+        video_path.with_suffix(".raw") if decoder == "raw" else video_path,
+        decoder,
+    )
+
+    read_times = []
+    loop_times = []
+    try:
+        while source.loops < LOOP_PASSES:
+            loops = source.loops
+            time_start = timer()
+            cv_image = source.read()
+            read_time = timer() - time_start
+
+            assert cv_image is not None
+            if source.loops != loops:
+                loop_times.append(read_time)
+            else:
+                read_times.append(read_time)
+
+            time.sleep(READ_INTERVAL)
+
+    finally:
+        source.release()
+
+    assert len(loop_times) == LOOP_PASSES
+    assert max(loop_times) <= max(read_times) + LOOP_SLACK
@@ -0,0 +1,32 @@
+"""Shader hooks checked in the shader sources they are defined in."""
+
+import pytest
+
+from emf_eye import mesh, remap
+from emf_eye.exceptions import ScriptError
+from emf_eye.shader import define_hook
+
+
+@pytest.mark.parametrize(
+    ("source", "name"),
+    [
+        (mesh.VERTEX_SHADER, "WARP"),
+        (mesh.FRAGMENT_SHADER, "BLEND"),
+        (remap.FRAGMENT_SHADER, "BLEND"),
+    ],
+)
+def test_define_hook(source: str, name: str) -> None:
+    """Test a hook is defined after the version line, ahead of the default it replaces."""
+    hooked = define_hook(source, name, "// hook")
+    lines = hooked.split("\n")
+
+    assert lines[0] == "#version 120"
+    assert lines[1] == f"#define {name}"
+    assert lines[2] == "// hook"
+    assert hooked.index("// hook") < hooked.index(f"#ifndef {name}")
+
+
+def test_define_hook_missing() -> None:
+    """Test a source without the hook is an error rather than quietly left unchanged."""
+    with pytest.raises(ScriptError):
+        define_hook(remap.BAKE_FRAGMENT_SHADER, "BLEND", "// hook")
@@ -0,0 +1,98 @@
+"""GPU PARAMETER warp checked against the CPU warp by rendering both offscreen."""
+
+from collections.abc import Iterator
+
+import numpy as np
+import pytest
+from OpenGL import GL
+
+from emf_eye.controller import KnobSet
+from emf_eye.mesh import WarpMesh
+from emf_eye.offscreen import OffscreenContext
+from emf_eye.warp import SHADER_WARP_STEPS, ShaderWarpMesh, Warp, calculate_warp
+
+RESOLUTION = (640, 360)
+FRAME_SIZE = (320, 180)
+# levels a pixel can differ by from rounding alone
+LEVEL_TOLERANCE = 8
+PIXEL_TOLERANCE = 0.00001
+KNOB_SETS = 5
+
+
+@pytest.fixture(scope="module")
+def tx_ref(context: OffscreenContext) -> Iterator[int]:
+    """Return a texture of a synthetic frame, a colour gradient with a checkerboard through it."""
+    y, x = np.mgrid[0 : FRAME_SIZE[1], 0 : FRAME_SIZE[0]]
+    checker = ((x // 16) + (y // 16)) % 2
+    frame = np.stack(
+        [
+            x * 255 // FRAME_SIZE[0],
+            y * 255 // FRAME_SIZE[1],
+            checker * 255,
+        ],
+        axis=-1,
+    ).astype(np.uint8)
+
+    tx_ref = GL.glGenTextures(1)
+    GL.glBindTexture(GL.GL_TEXTURE_2D, tx_ref)
+    GL.glPixelStorei(GL.GL_UNPACK_ALIGNMENT, 1)
+    GL.glTexImage2D(
+        GL.GL_TEXTURE_2D,
+        0,
+        GL.GL_RGB8,
+        *FRAME_SIZE,
+        0,
+        GL.GL_BGR,
+        GL.GL_UNSIGNED_BYTE,
+        frame,
+    )
+    GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MAG_FILTER, GL.GL_LINEAR)
+    GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_MIN_FILTER, GL.GL_LINEAR)
+    GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_S, GL.GL_REPEAT)
+    GL.glTexParameteri(GL.GL_TEXTURE_2D, GL.GL_TEXTURE_WRAP_T, GL.GL_REPEAT)
+    GL.glBindTexture(GL.GL_TEXTURE_2D, 0)
+
+    yield tx_ref
+
+    GL.glDeleteTextures([tx_ref])
+
+
+def render(
+    context: OffscreenContext,
+    mesh: WarpMesh,
+    tx_ref: int,
+) -> np.ndarray:
+    """Render a warp mesh and return the pixels."""
+    GL.glClear(GL.GL_COLOR_BUFFER_BIT)
+    mesh.draw(tx_ref, (0.0, 0.0))
+    GL.glFinish()
+
+    return context.read_pixels().astype(np.int16)
+
+
+@pytest.mark.parametrize("seed", range(KNOB_SETS))
+def test_shader_warp(context: OffscreenContext, tx_ref: int, seed: int) -> None:
+    """The shader warp renders the same pixels as the CPU warp on the same grid."""
+    knobs = KnobSet()
+    knobs.set_knobs(np.random.default_rng(seed).random(len(knobs.knobs)).tolist())
+
+    cpu_mesh = WarpMesh()
+    cpu_mesh.update(
+        calculate_warp(Warp.PARAMETER, RESOLUTION, knobs, SHADER_WARP_STEPS),
+    )
+    shader_mesh = ShaderWarpMesh()
+    shader_mesh.update_warp(RESOLUTION, knobs, SHADER_WARP_STEPS)
+
+    try:
+        cpu_pixels = render(context, cpu_mesh, tx_ref)
+        shader_pixels = render(context, shader_mesh, tx_ref)
+
+    finally:
+        cpu_mesh.release()
+        shader_mesh.release()
+
+    # the warp must have drawn something for the comparison to mean anything
+    assert np.count_nonzero(cpu_pixels)
+
+    differing = np.any(np.abs(cpu_pixels - shader_pixels) > LEVEL_TOLERANCE, axis=-1)
+    assert differing.mean() < PIXEL_TOLERANCE
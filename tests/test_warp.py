@@ -0,0 +1,146 @@
+"""PARAMETER warp checked against the original scalar calculation."""
+
+from math import cos, pi, sin
+
+import numpy as np
+import pytest
+
+from emf_eye.controller import KnobSet
+from emf_eye.mesh import WarpMesh
+from emf_eye.offscreen import OffscreenContext
+from emf_eye.warp import (
+    KNOB_ASPECT,
+    KNOB_X_FAN,
+    KNOB_X_POS,
+    KNOB_Y_FAN,
+    KNOB_Y_POS,
+    Y_FAN_SCALE,
+    Warp,
+    WarpCache,
+    calculate_warp,
+)
+
+RESOLUTION = (1920, 1080)
+STEPS = (1, 20, 150)
+KNOB_SETS = 10
+
+
+def scalar_warp(
+    display_resolution: tuple[int, int],
+    knobs: KnobSet,
+    steps: int,
+) -> np.ndarray:
+    """Return the PARAMETER warp calculated a vertex at a time, as it was before vectorising."""
+    display_aspect = display_resolution[0] / display_resolution[1]
+    display_scale = knobs.interpolate(display_aspect, 1.0, KNOB_ASPECT, True)
+
+    def cos_curve(v: float, knob_index: int, invert: bool) -> float:
+        t = v * pi
+        c = (1.0 - cos(t)) / 2.0
+        return knobs.interpolate(c, v, knob_index, invert)
+
+    def sin_curve(v: float, knob_index: int, invert: bool) -> float:
+        t = v * pi
+        c = sin(t)
+        return knobs.interpolate(c, 1.0, knob_index, invert)
+
+    coord_array = []
+    for y in [v / steps for v in range(steps + 1)]:
+        y_scale = sin_curve(y, KNOB_X_FAN, True)
+
+        row = []
+        for x in [v / steps for v in range(steps + 1)]:
+            x_pos = cos_curve(x, KNOB_X_POS, True)
+            x_pos -= 0.5
+            x_pos *= y_scale
+            x_pos /= display_scale
+            x_pos += 0.5
+
+            y_fan = 1.0 - sin_curve(x, KNOB_Y_FAN, True)
+            y_fan *= Y_FAN_SCALE
+            y_fan += 1.0
+
+            y_pos = cos_curve(y, KNOB_Y_POS, True)
+            y_pos -= 0.5
+            y_pos *= y_fan
+            y_pos += 0.5
+
+            row.append([x_pos, y_pos])
+        coord_array.append(row)
+
+    return np.array(coord_array, np.float32)
+
+
+def random_knobs(seed: int) -> KnobSet:
+    """Return knobs set to random values."""
+    knobs = KnobSet()
+    knobs.set_knobs(np.random.default_rng(seed).random(len(knobs.knobs)).tolist())
+
+    return knobs
+
+
+@pytest.mark.parametrize("steps", STEPS)
+@pytest.mark.parametrize("seed", range(KNOB_SETS))
+def test_parameter_warp(steps: int, seed: int) -> None:
+    """The vectorised warp matches the scalar warp."""
+    knobs = random_knobs(seed)
+
+    coord_array = calculate_warp(Warp.PARAMETER, RESOLUTION, knobs, steps)
+
+    assert np.array_equal(coord_array, scalar_warp(RESOLUTION, knobs, steps))
+
+
+@pytest.mark.parametrize("steps", STEPS)
+def test_parameter_warp_cache(steps: int) -> None:
+    """A reused cache matches the scalar warp as the knobs are turned one at a time and all at once."""
+    cache = WarpCache()
+    knobs = random_knobs(0)
+    rng = np.random.default_rng(1)
+
+    for knob_index in [KNOB_X_POS, KNOB_X_FAN, KNOB_ASPECT, KNOB_Y_POS, KNOB_Y_FAN]:
+        knobs.set_knob(knob_index, float(rng.random()))
+        coord_array = calculate_warp(Warp.PARAMETER, RESOLUTION, knobs, steps, cache)
+
+        assert np.array_equal(coord_array, scalar_warp(RESOLUTION, knobs, steps))
+
+    for seed in range(KNOB_SETS):
+        knobs = random_knobs(seed)
+        coord_array = calculate_warp(Warp.PARAMETER, RESOLUTION, knobs, steps, cache)
+
+        assert np.array_equal(coord_array, scalar_warp(RESOLUTION, knobs, steps))
+
+
+def test_parameter_warp_cache_steps() -> None:
+    """A reused cache matches the scalar warp when the step count changes."""
+    cache = WarpCache()
+    knobs = random_knobs(0)
+
+    for steps in [*STEPS, *reversed(STEPS)]:
+        coord_array = calculate_warp(Warp.PARAMETER, RESOLUTION, knobs, steps, cache)
+
+        assert np.array_equal(coord_array, scalar_warp(RESOLUTION, knobs, steps))
+
+
+def test_parameter_warp_cache_mesh(context: OffscreenContext) -> None:
+    """A mesh keeps its warp when the cache reuses the array it was updated from."""
+    cache = WarpCache()
+    mesh = WarpMesh()
+    try:
+        coord_array = calculate_warp(
+            Warp.PARAMETER,
+            RESOLUTION,
+            random_knobs(0),
+            STEPS[1],
+            cache,
+        )
+        expected = coord_array.copy()
+        mesh.update(coord_array)
+
+        calculate_warp(Warp.PARAMETER, RESOLUTION, random_knobs(1), STEPS[1], cache)
+
+        # the cache overwrote the array it returned
+        assert not np.array_equal(coord_array, expected)
+        assert np.array_equal(mesh.coord_array, expected)
+
+    finally:
+        mesh.release()